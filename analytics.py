@@ -0,0 +1,211 @@
+"""
+Server-side analytics over UserAccounts and StatusUpdates.
+
+Each query runs as an aggregation pipeline with allowDiskUse. Results are streamed
+from the cursor; small ones are cached until the write count of a collection they
+depend on moves.
+"""
+
+import threading
+import time
+
+from backends import CollectionBackend, SQLiteDatabase
+from compact_schema import TABLE_KEYS, CompactCollection
+
+USER_TABLE = "UserAccounts"
+STATUS_TABLE = "StatusUpdates"
+DEFAULT_LENGTH_BOUNDARIES = [0, 20, 40, 80, 160, 280]
+# Results longer than this are streamed only, never cached
+MAX_CACHED_ROWS = 10_000
+CURSOR_BATCH_SIZE = 1000
+
+
+class WriteCounter:
+    """
+    Per-collection count of writes seen through CountingCollection
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def bump(self, name, amount=1):
+        """
+        Records amount writes to collection name
+        """
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+    def version(self, names):
+        """
+        Snapshot of the write counts of names
+        """
+        with self.lock:
+            return tuple(self.counts.get(name, 0) for name in names)
+
+
+class CountingCollection(CollectionBackend):
+    """
+    Passes every call through to collection and counts the writes
+    """
+
+    def __init__(self, collection, name, counter):
+        self.collection = collection
+        self.name = name
+        self.counter = counter
+
+    def __getattr__(self, attribute):
+        return getattr(self.collection, attribute)
+
+    def insert_one(self, document):
+        result = self.collection.insert_one(document)
+        self.counter.bump(self.name)
+        return result
+
+    def insert_many(self, documents, ordered=True):
+        documents = list(documents)
+        try:
+            return self.collection.insert_many(documents, ordered=ordered)
+        finally:
+            # Counted even when the batch partly fails; a spurious invalidation is harmless
+            self.counter.bump(self.name, len(documents))
+
+    def find_one(self, query, projection=None):
+        return self.collection.find_one(query, projection)
+
+    def find(self, query=None, projection=None):
+        return self.collection.find(query or {}, projection)
+
+    def update_one(self, query, update, upsert=False):
+        result = self.collection.update_one(query, update, upsert=upsert)
+        self.counter.bump(self.name)
+        return result
+
+    def delete_one(self, query):
+        result = self.collection.delete_one(query)
+        self.counter.bump(self.name)
+        return result
+
+    def delete_many(self, query):
+        result = self.collection.delete_many(query)
+        self.counter.bump(self.name)
+        return result
+
+    def count_documents(self, query):
+        return self.collection.count_documents(query)
+
+    def bulk_write(self, requests, ordered=True):
+        requests = list(requests)
+        try:
+            return self.collection.bulk_write(requests, ordered=ordered)
+        finally:
+            self.counter.bump(self.name, len(requests))
+
+    def aggregate(self, pipeline, **kwargs):
+        return self.collection.aggregate(pipeline, **kwargs)
+
+    def with_options(self, **kwargs):
+        return CountingCollection(self.collection.with_options(**kwargs), self.name, self.counter)
+
+
+class Analytics:
+    """
+    Dashboard queries as aggregation pipelines, with write-count invalidated caching
+    """
+
+    def __init__(self, database, counter=None, max_cached_rows=MAX_CACHED_ROWS, compact=False):
+        self.database = database
+        self.compact = compact
+        self.counter = counter or WriteCounter()
+        self.max_cached_rows = max_cached_rows
+        self.cache = {}
+        self.lock = threading.Lock()
+        # Seconds after which a cached result is no longer trusted; None trusts it until a write
+        self.max_age = lambda: None
+
+    def track(self, collection, name):
+        """
+        Wraps collection so its writes invalidate cached results that depend on it
+        """
+        return CountingCollection(collection, name, self.counter)
+
+    def run(self, key, table_name, pipeline, depends_on):
+        """
+        Yields the results of pipeline on table_name, from the cache when still valid.
+        A result is cached once fully consumed, if it has at most max_cached_rows rows.
+        """
+        if isinstance(self.database, SQLiteDatabase):
+            raise NotImplementedError("Analytics needs MongoDB aggregation pipelines; "
+                                      "the SQLite backend only supports $sample")
+        version = self.counter.version(depends_on)
+        max_age = self.max_age()
+        with self.lock:
+            cached = self.cache.get(key)
+        if (cached is not None and cached[0] == version
+                and (max_age is None or time.monotonic() - cached[2] <= max_age)):
+            yield from cached[1]
+            return
+
+        rows = []
+        collection = self.database[table_name]
+        if self.compact:
+            collection = CompactCollection(collection, TABLE_KEYS[table_name])
+        cursor = collection.aggregate(pipeline, allowDiskUse=True, batchSize=CURSOR_BATCH_SIZE)
+        for document in cursor:
+            if rows is not None:
+                rows.append(document)
+                if len(rows) > self.max_cached_rows:
+                    rows = None
+            yield document
+        if rows is not None:
+            with self.lock:
+                self.cache[key] = (version, rows, time.monotonic())
+
+    def follow(self, invalidator):
+        """
+        Counts writes made by any process, as seen on the change streams, so they
+        invalidate cached results too; falls back to the invalidator's TTL while a stream is down
+        """
+        for name in (USER_TABLE, STATUS_TABLE):
+            invalidator.subscribe(name, lambda _document_id, _operation, name=name: self.counter.bump(name),
+                                  lambda name=name: self.counter.bump(name))
+        self.max_age = invalidator.max_age
+
+    def statuses_per_user(self):
+        """
+        Yields {"_id": user_id, "statuses": count} for every user with statuses
+        """
+        pipeline = [{"$group": {"_id": "$user_id", "statuses": {"$sum": 1}}}]
+        return self.run(("statuses_per_user",), STATUS_TABLE, pipeline, [STATUS_TABLE])
+
+    def top_posters(self, count=10):
+        """
+        Yields the count users with the most statuses, most first
+        """
+        pipeline = [{"$group": {"_id": "$user_id", "statuses": {"$sum": 1}}},
+                    {"$sort": {"statuses": -1, "_id": 1}},
+                    {"$limit": count}]
+        return self.run(("top_posters", count), STATUS_TABLE, pipeline, [STATUS_TABLE])
+
+    def users_without_statuses(self):
+        """
+        Yields {"_id": user_id} for users that have no statuses
+        """
+        pipeline = [{"$lookup": {"from": STATUS_TABLE, "localField": "_id", "foreignField": "user_id",
+                                 "pipeline": [{"$limit": 1}, {"$project": {"_id": 1}}], "as": "statuses"}},
+                    {"$match": {"statuses": {"$size": 0}}},
+                    {"$project": {"_id": 1}}]
+        return self.run(("users_without_statuses",), USER_TABLE, pipeline, [USER_TABLE, STATUS_TABLE])
+
+    def status_length_distribution(self, boundaries=None):
+        """
+        Yields {"_id": bucket lower bound, "statuses": count} buckets of status text length;
+        a missing or null status_text counts as length 0
+        """
+        boundaries = list(boundaries or DEFAULT_LENGTH_BOUNDARIES)
+        pipeline = [{"$bucket": {"groupBy": {"$strLenCP": {"$ifNull": ["$status_text", ""]}},
+                                 "boundaries": boundaries + [float("inf")],
+                                 "default": "other",
+                                 "output": {"statuses": {"$sum": 1}}}}]
+        return self.run(("status_length_distribution", tuple(boundaries)), STATUS_TABLE, pipeline,
+                        [STATUS_TABLE])
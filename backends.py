@@ -0,0 +1,645 @@
+"""
+Storage backends for the social network collections.
+
+UserCollection, UserStatusCollection and the main.py functions only use a small
+subset of the pymongo collection API (CollectionBackend below). A pymongo
+collection satisfies it directly; SQLiteCollection implements the same subset
+on SQLite through peewee, for single-node deployments and offline benchmarks.
+Its aggregate only runs the $sample pipeline used by export, so analytics checks
+for the SQLite backend and refuses it.
+"""
+
+import abc
+import json
+import re
+import sqlite3
+import threading
+import uuid
+
+import peewee
+import pymongo
+from pymongo.collection import Collection
+
+# Fields that get an expression index in the SQLite backend, per table
+SQLITE_INDEXES = {"StatusUpdates": ("user_id",)}
+SQLITE_PRAGMAS = {"journal_mode": "wal", "synchronous": "normal", "cache_size": -64 * 1000}
+# SQLite caps bound parameters per statement; keep $in lists and pre-checks below it
+SQLITE_MAX_VARIABLES = 900
+RANGE_OPERATORS = {"$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+# BSON $type aliases -> SQLite typeof() of the stored value
+SQLITE_TYPES = {"string": "text", "int": "integer", "long": "integer", "double": "real", "null": "null"}
+# SQLite index names are global and stay put when a table is renamed, so they carry a random
+# tag instead of the table name: ix_<8 hex>_<index name>
+SQLITE_INDEX_NAME = re.compile(r"ix_[0-9a-f]{8}_(.+)")
+INDEX_COLUMN = re.compile(r"json_extract\(doc, '\$\.([^']+)'\)|\b(_id)\b")
+INDEX_EXISTS = re.compile(r"json_extract\(doc, '\$\.([^']+)'\) IS (NOT )?NULL")
+# Field names are spliced into SQL as JSON paths, so only plain (dotted) names are accepted
+FIELD_NAME = re.compile(r"[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)*")
+
+
+class CollectionBackend(abc.ABC):
+    """
+    The collection operations the rest of the project relies on
+    """
+
+    @abc.abstractmethod
+    def insert_one(self, document):
+        """Inserts one document, raising DuplicateKeyError on an existing _id"""
+
+    @abc.abstractmethod
+    def insert_many(self, documents, ordered=True):
+        """Inserts documents, raising BulkWriteError with writeErrors on failures"""
+
+    @abc.abstractmethod
+    def find_one(self, query, projection=None):
+        """Returns the first matching document or None"""
+
+    @abc.abstractmethod
+    def find(self, query=None, projection=None):
+        """Returns an iterable of matching documents"""
+
+    @abc.abstractmethod
+    def update_one(self, query, update, upsert=False):
+        """Applies a $set / $push / $pull update to the first matching document;
+        with upsert a document is created from the query's equality fields if none matches"""
+
+    @abc.abstractmethod
+    def delete_one(self, query):
+        """Deletes the first matching document"""
+
+    @abc.abstractmethod
+    def delete_many(self, query):
+        """Deletes all matching documents"""
+
+    @abc.abstractmethod
+    def count_documents(self, query):
+        """Counts matching documents"""
+
+    @abc.abstractmethod
+    def with_options(self, **kwargs):
+        """Returns a view with different write options"""
+
+    @abc.abstractmethod
+    def bulk_write(self, requests, ordered=True):
+        """Applies InsertOne / ReplaceOne / UpdateOne / DeleteOne requests as one batch"""
+
+    @abc.abstractmethod
+    def aggregate(self, pipeline, **kwargs):
+        """Runs an aggregation pipeline, raising NotImplementedError for stages the backend lacks"""
+
+
+CollectionBackend.register(Collection)
+
+
+class InsertOneResult:
+    """
+    Mirrors pymongo.results.InsertOneResult
+    """
+
+    def __init__(self, inserted_id):
+        self.inserted_id = inserted_id
+        self.acknowledged = True
+
+
+class InsertManyResult:
+    """
+    Mirrors pymongo.results.InsertManyResult
+    """
+
+    def __init__(self, inserted_ids):
+        self.inserted_ids = inserted_ids
+        self.acknowledged = True
+
+
+class UpdateResult:
+    """
+    Mirrors pymongo.results.UpdateResult
+    """
+
+    def __init__(self, matched_count, modified_count, upserted_id=None):
+        self.matched_count = matched_count
+        self.modified_count = modified_count
+        self.upserted_id = upserted_id
+        self.acknowledged = True
+
+
+class DeleteResult:
+    """
+    Mirrors pymongo.results.DeleteResult
+    """
+
+    def __init__(self, deleted_count):
+        self.deleted_count = deleted_count
+        self.acknowledged = True
+
+
+def quote_name(name):
+    """
+    Quotes a table or index name for use in SQL
+    """
+    return '"' + name.replace('"', '""') + '"'
+
+
+def index_sql_name(name):
+    """
+    Database-wide SQLite name for an index called name
+    """
+    return quote_name(f"ix_{uuid.uuid4().hex[:8]}_{name}")
+
+
+def field_column(field):
+    """
+    SQL expression reading field from the doc column; rejects names that are not plain field paths
+    """
+    if field == "_id":
+        return "_id"
+    if not isinstance(field, str) or not FIELD_NAME.fullmatch(field):
+        raise ValueError(f"Invalid field name {field!r}")
+    return f"json_extract(doc, '$.{field}')"
+
+
+def condition_clauses(column, condition):
+    """
+    SQL clauses and parameters for an operator condition such as {"$gte": 1, "$lt": 5} on column
+    """
+    clauses = []
+    params = []
+    for operator, value in condition.items():
+        if operator == "$in":
+            values = list(value)
+            if not values:
+                clauses.append("0")
+                continue
+            clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+        elif operator == "$exists":
+            clauses.append(f"{column} IS {'NOT ' if value else ''}NULL")
+        elif operator in RANGE_OPERATORS:
+            clauses.append(f"{column} {RANGE_OPERATORS[operator]} ?")
+            params.append(value)
+        elif operator == "$type" and value in SQLITE_TYPES:
+            clauses.append(f"typeof({column}) = ?")
+            params.append(SQLITE_TYPES[value])
+        elif operator == "$not" and isinstance(value, dict):
+            negated, negated_params = condition_clauses(column, value)
+            clauses.append(f"NOT ({' AND '.join(negated)})")
+            params.extend(negated_params)
+        else:
+            raise NotImplementedError(f"Unsupported query operator in {condition}")
+    return clauses, params
+
+
+def where_clause(query):
+    """
+    Translates an equality / $in / $exists / range / $type query into a SQL WHERE clause and parameters.
+    """
+    clauses = []
+    params = []
+    for field, condition in (query or {}).items():
+        column = field_column(field)
+        if isinstance(condition, dict):
+            operator_clauses, operator_params = condition_clauses(column, condition)
+            clauses += operator_clauses
+            params += operator_params
+        elif "." in field:
+            # "array.field": a nested field, or any element of an array of documents
+            array, element_field = field.split(".", 1)
+            clauses.append(f"({column} = ? OR EXISTS (SELECT 1 FROM json_each(doc, '$.{array}') "
+                           f"WHERE json_each.type = 'object' "
+                           f"AND json_extract(json_each.value, '$.{element_field}') = ?))")
+            params.extend([condition, condition])
+        else:
+            clauses.append(f"{column} = ?")
+            params.append(condition)
+    if not clauses:
+        return "", params
+    return " WHERE " + " AND ".join(clauses), params
+
+
+def apply_projection(document, projection):
+    """
+    Applies an inclusion projection such as {"_id": 1, "user_id": 1}.
+    """
+    if not projection:
+        return document
+    fields = {field for field, include in projection.items() if include}
+    if projection.get("_id", 1):
+        fields.add("_id")
+    return {key: value for key, value in document.items() if key in fields}
+
+
+def upsert_document(query):
+    """
+    The document an upsert starts from: the query's equality fields, which must include _id
+    """
+    document = {field: value for field, value in query.items()
+                if not field.startswith("$") and "." not in field and not isinstance(value, dict)}
+    if "_id" not in document:
+        raise NotImplementedError(f"Upsert needs an _id in the query: {query}")
+    return document
+
+
+def element_matches(element, condition):
+    """
+    True if an array element matches a $pull condition: equal, or a document with the condition's fields
+    """
+    if isinstance(condition, dict):
+        return isinstance(element, dict) and all(element.get(key) == value for key, value in condition.items())
+    return element == condition
+
+
+def push_values(values, spec):
+    """
+    values after a $push of spec, which is a value or {"$each", "$position", "$slice"}
+    """
+    if not (isinstance(spec, dict) and "$each" in spec):
+        return values + [spec]
+    position = spec.get("$position", len(values))
+    values = values[:position] + list(spec["$each"]) + values[position:]
+    if "$slice" in spec:
+        values = values[:spec["$slice"]] if spec["$slice"] >= 0 else values[spec["$slice"]:]
+    return values
+
+
+def apply_update(document, update, query=None):
+    """
+    Copy of document with a $set, $push or $pull update applied.
+    $set supports the positional "array.$.field" form, for the element matched by query's "array.field".
+    """
+    if not set(update) <= {"$set", "$push", "$pull"}:
+        raise NotImplementedError(f"Unsupported update {update}")
+    updated = dict(document)
+    for field, value in update.get("$set", {}).items():
+        if ".$." not in field:
+            updated[field] = value
+            continue
+        array, element_field = field.split(".$.", 1)
+        conditions = {key[len(array) + 1:]: condition for key, condition in (query or {}).items()
+                      if key.startswith(array + ".")}
+        elements = [dict(element) for element in updated.get(array, [])]
+        for element in elements:
+            if element_matches(element, conditions):
+                element[element_field] = value
+                break
+        updated[array] = elements
+    for field, spec in update.get("$push", {}).items():
+        updated[field] = push_values(list(updated.get(field, [])), spec)
+    for field, condition in update.get("$pull", {}).items():
+        if field in updated:
+            updated[field] = [element for element in updated[field] if not element_matches(element, condition)]
+    return updated
+
+
+class SQLiteCollection(CollectionBackend):
+    """
+    One collection stored as a SQLite table of (_id, JSON document)
+    """
+
+    def __init__(self, database, table_name):
+        self.db = database
+        self.table_name = table_name
+        self.table = quote_name(table_name)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.create_table()
+
+    def create_table(self):
+        """
+        Creates the table and its indexes if missing
+        """
+        self.db.execute_sql(
+            f'CREATE TABLE IF NOT EXISTS {self.table} (_id TEXT PRIMARY KEY, doc TEXT NOT NULL)')
+        for field in SQLITE_INDEXES.get(self.table_name, ()):
+            if self.has_index(field):
+                # e.g. built under another name by a staged load and renamed in with the table
+                continue
+            self.db.execute_sql(f'CREATE INDEX {index_sql_name(field)} ON {self.table} ({field_column(field)})')
+
+    def has_index(self, field):
+        """
+        True if the table already has an index whose first column is field
+        """
+        cursor = self.db.execute_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql LIKE ?",
+            (self.table_name, f"%({field_column(field)}%"))
+        return cursor.fetchone() is not None
+
+    @staticmethod
+    def encode(document):
+        """
+        Serializes a document for the doc column
+        """
+        return json.dumps(dict(document), default=str)
+
+    def existing_ids(self, ids):
+        """
+        Returns the subset of ids already stored
+        """
+        ids = list(ids)
+        found = set()
+        for i in range(0, len(ids), SQLITE_MAX_VARIABLES):
+            chunk = ids[i:i + SQLITE_MAX_VARIABLES]
+            cursor = self.db.execute_sql(
+                f'SELECT _id FROM {self.table} WHERE _id IN ({", ".join("?" * len(chunk))})', chunk)
+            found.update(row[0] for row in cursor.fetchall())
+        return found
+
+    def create_index(self, keys, unique=False, name=None, partialFilterExpression=None):
+        """
+        Expression index on JSON fields, like pymongo's create_index. keys is a field name
+        or a list of (field, direction); a partial filter may only use $exists.
+        Raises DuplicateKeyError if a unique index cannot be built over existing documents.
+        """
+        # pylint: disable = C0103
+        fields = [keys] if isinstance(keys, str) else [field for field, _direction in keys]
+        name = name or "_".join(fields)
+        columns = ", ".join(field_column(field) for field in fields)
+        where, params = where_clause(partialFilterExpression)
+        if params:
+            raise NotImplementedError(f"Unsupported partial filter {partialFilterExpression}")
+        with self.lock:
+            if name in self.index_information():
+                return name
+            try:
+                self.db.execute_sql(f'CREATE {"UNIQUE " if unique else ""}INDEX '
+                                    f'{index_sql_name(name)} ON {self.table} ({columns}){where}')
+            except peewee.IntegrityError as error:
+                raise pymongo.errors.DuplicateKeyError(f"E11000 duplicate key error building index {name}",
+                                                       11000) from error
+        return name
+
+    def index_information(self):
+        """
+        The table's indexes as {name: {"key": [(field, 1)], "unique": ..., "partialFilterExpression": ...}},
+        like pymongo's index_information
+        """
+        indexes = {"_id_": {"key": [("_id", pymongo.ASCENDING)]}}
+        cursor = self.db.execute_sql("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? "
+                                     "AND sql IS NOT NULL", (self.table_name,))
+        for sql_name, sql in cursor.fetchall():
+            match = SQLITE_INDEX_NAME.fullmatch(sql_name)
+            name = match.group(1) if match else sql_name.removeprefix(f"ix_{self.table_name}_")
+            columns, _, where = sql.split(" ON ", 1)[1].split(" (", 1)[1].partition(" WHERE ")
+            info = {"key": [(field or _id, pymongo.ASCENDING) for field, _id in INDEX_COLUMN.findall(columns)]}
+            if sql.startswith("CREATE UNIQUE"):
+                info["unique"] = True
+            if where:
+                info["partialFilterExpression"] = {field: {"$exists": bool(negated)}
+                                                   for field, negated in INDEX_EXISTS.findall(where)}
+            indexes[name] = info
+        return indexes
+
+    def insert_row(self, document):
+        """
+        Inserts one document inside the caller's transaction, raising DuplicateKeyError on a conflict
+        """
+        try:
+            self.db.execute_sql(f'INSERT INTO {self.table} (_id, doc) VALUES (?, ?)',
+                                (document["_id"], self.encode(document)))
+        except peewee.IntegrityError as error:
+            raise pymongo.errors.DuplicateKeyError(f"E11000 duplicate key error: {document['_id']}",
+                                                   11000) from error
+
+    def insert_one(self, document):
+        with self.lock, self.db.atomic():
+            self.insert_row(document)
+        return InsertOneResult(document["_id"])
+
+    def insert_rows(self, rows, ordered):
+        """
+        Inserts (index, _id, doc) rows in one statement; if a unique index rejects one,
+        retries row by row so only the conflicting rows fail.
+        Returns (inserted ids, write errors).
+        """
+        sql = f'INSERT INTO {self.table} (_id, doc) VALUES (?, ?)'
+        try:
+            with self.db.atomic():
+                self.db.cursor().executemany(sql, [row[1:] for row in rows])
+            return [row[1] for row in rows], []
+        except (peewee.IntegrityError, sqlite3.IntegrityError):
+            # The raw cursor raises sqlite3's error, execute_sql peewee's
+            pass
+        inserted = []
+        write_errors = []
+        for index, item_id, doc in rows:
+            try:
+                with self.db.atomic():
+                    self.db.execute_sql(sql, (item_id, doc))
+                inserted.append(item_id)
+            except peewee.IntegrityError:
+                write_errors.append({"index": index, "code": 11000,
+                                     "errmsg": f"E11000 duplicate key error: {item_id}"})
+                if ordered:
+                    break
+        return inserted, write_errors
+
+    def insert_many(self, documents, ordered=True):
+        documents = list(documents)
+        with self.lock, self.db.atomic():
+            existing = self.existing_ids(doc["_id"] for doc in documents)
+            rows = []
+            write_errors = []
+            for index, doc in enumerate(documents):
+                if doc["_id"] in existing:
+                    write_errors.append({"index": index, "code": 11000,
+                                         "errmsg": f"E11000 duplicate key error: {doc['_id']}"})
+                    if ordered:
+                        break
+                    continue
+                existing.add(doc["_id"])
+                rows.append((index, doc["_id"], self.encode(doc)))
+            inserted, index_errors = self.insert_rows(rows, ordered)
+        if index_errors:
+            # Keep the ordered "stop at the first error" semantics across both kinds of error
+            write_errors = sorted(write_errors + index_errors, key=lambda e: e["index"])[:1 if ordered else None]
+        if write_errors:
+            raise pymongo.errors.BulkWriteError({"nInserted": len(inserted), "writeErrors": write_errors})
+        return InsertManyResult(inserted)
+
+    def find(self, query=None, projection=None, limit=0):
+        where, params = where_clause(query)
+        sql = f'SELECT doc FROM {self.table}{where}'
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        cursor = self.db.execute_sql(sql, params)
+        return [apply_projection(json.loads(row[0]), projection) for row in cursor.fetchall()]
+
+    def aggregate(self, pipeline, **kwargs):
+        """
+        Only [{"$sample": ...}, {"$project": {"_id": 1}}], as used to split _id ranges
+        """
+        if not pipeline or set(pipeline[0]) != {"$sample"} or pipeline[1:] != [{"$project": {"_id": 1}}]:
+            raise NotImplementedError(f"Unsupported pipeline {pipeline}")
+        cursor = self.db.execute_sql(f'SELECT _id FROM {self.table} ORDER BY random() LIMIT ?',
+                                     (int(pipeline[0]["$sample"]["size"]),))
+        return [{"_id": row[0]} for row in cursor.fetchall()]
+
+    def find_one(self, query, projection=None):
+        results = self.find(query, projection, limit=1)
+        return results[0] if results else None
+
+    def update_one(self, query, update, upsert=False):
+        with self.lock, self.db.atomic():
+            return self.update_document(query, update, upsert)
+
+    def update_document(self, query, update, upsert=False):
+        """
+        update_one inside the caller's lock and transaction
+        """
+        document = self.find_one(query)
+        if document is None:
+            if not upsert:
+                return UpdateResult(0, 0)
+            created = apply_update(upsert_document(query), update)
+            self.insert_row(created)
+            return UpdateResult(0, 0, created["_id"])
+        updated = apply_update(document, update, query)
+        if updated == document:
+            return UpdateResult(1, 0)
+        try:
+            self.db.execute_sql(f'UPDATE {self.table} SET doc = ? WHERE _id = ?',
+                                (self.encode(updated), document["_id"]))
+        except peewee.IntegrityError as error:
+            raise pymongo.errors.DuplicateKeyError(f"E11000 duplicate key error: {document['_id']}",
+                                                   11000) from error
+        return UpdateResult(1, 1)
+
+    def delete_one(self, query):
+        with self.lock, self.db.atomic():
+            document = self.find_one(query, {"_id": 1})
+            if document is None:
+                return DeleteResult(0)
+            self.db.execute_sql(f'DELETE FROM {self.table} WHERE _id = ?', (document["_id"],))
+        return DeleteResult(1)
+
+    def delete_many(self, query):
+        where, params = where_clause(query)
+        with self.lock, self.db.atomic():
+            cursor = self.db.execute_sql(f'DELETE FROM {self.table}{where}', params)
+        return DeleteResult(cursor.rowcount)
+
+    def count_documents(self, query):
+        where, params = where_clause(query)
+        return self.db.execute_sql(f'SELECT COUNT(*) FROM {self.table}{where}', params).fetchone()[0]
+
+    def bulk_write(self, requests, ordered=True):
+        # pymongo's request classes keep their arguments in _doc, _filter and _upsert
+        # pylint: disable = W0212
+        with self.lock, self.db.atomic():
+            for request in requests:
+                if isinstance(request, pymongo.InsertOne):
+                    self.db.execute_sql(f'INSERT INTO {self.table} (_id, doc) VALUES (?, ?)',
+                                        (request._doc["_id"], self.encode(request._doc)))
+                elif isinstance(request, pymongo.ReplaceOne):
+                    item_id = request._filter["_id"]
+                    if request._upsert or self.existing_ids([item_id]):
+                        self.db.execute_sql(f'INSERT OR REPLACE INTO {self.table} (_id, doc) VALUES (?, ?)',
+                                            (item_id, self.encode({"_id": item_id, **request._doc})))
+                elif isinstance(request, pymongo.UpdateOne):
+                    self.update_document(request._filter, request._doc, request._upsert)
+                elif isinstance(request, pymongo.DeleteOne):
+                    self.db.execute_sql(f'DELETE FROM {self.table} WHERE _id = ?',
+                                        (request._filter["_id"],))
+                else:
+                    raise NotImplementedError(f"Unsupported bulk request {request!r}")
+
+    def with_options(self, **kwargs):
+        # SQLite has no per-operation write concern; WAL with synchronous=normal applies to all writes
+        return self
+
+    def rename(self, new_name, dropTarget=False):
+        """
+        Renames the table in one transaction, like pymongo's rename; with dropTarget an
+        existing new_name table is replaced. Readers on other connections see either the
+        old or the new table, never neither. Indexes move with the table.
+        """
+        # pylint: disable = C0103
+        with self.lock, self.db.atomic():
+            exists = self.db.execute_sql("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                         (new_name,)).fetchone()
+            if exists and not dropTarget:
+                raise pymongo.errors.OperationFailure(f"target namespace exists: {new_name}")
+            self.db.execute_sql(f'DROP TABLE IF EXISTS {quote_name(new_name)}')
+            self.db.execute_sql(f'ALTER TABLE {self.table} RENAME TO {quote_name(new_name)}')
+
+    def drop(self):
+        """
+        Drops the table's contents; an empty table is recreated so existing handles stay usable,
+        as with MongoDB's implicit collection creation
+        """
+        with self.lock:
+            self.db.execute_sql(f'DROP TABLE IF EXISTS {self.table}')
+            self.create_table()
+
+
+class SQLiteDatabase:
+    """
+    A SQLite file standing in for one MongoDB database
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.db = peewee.SqliteDatabase(path, pragmas=SQLITE_PRAGMAS, timeout=30)
+        self.collections = {}
+
+    def __getitem__(self, table_name):
+        if table_name not in self.collections:
+            self.collections[table_name] = SQLiteCollection(self.db, table_name)
+        return self.collections[table_name]
+
+    def drop_collection(self, table_name):
+        """
+        Removes a table entirely, unlike SQLiteCollection.drop which leaves it empty
+        """
+        self.collections.pop(table_name, None)
+        self.db.execute_sql(f'DROP TABLE IF EXISTS {quote_name(table_name)}')
+
+    def list_collection_names(self):
+        """
+        Returns the table names in this database
+        """
+        cursor = self.db.execute_sql("SELECT name FROM sqlite_master WHERE type = 'table'")
+        return [row[0] for row in cursor.fetchall()]
+
+    def close(self):
+        """
+        Closes this thread's connection
+        """
+        self.db.close()
+
+
+class SQLiteClient:
+    """
+    Client-like entry point: client[database_name][table_name] -> SQLiteCollection.
+    Each database name maps to <directory>/<database_name>.sqlite3.
+    """
+
+    def __init__(self, directory="."):
+        self.directory = directory
+        self.databases = {}
+
+    def database_path(self, database_name):
+        """
+        File used for database_name
+        """
+        return f"{self.directory.rstrip('/')}/{database_name}.sqlite3"
+
+    def __getitem__(self, database_name):
+        if database_name not in self.databases:
+            self.databases[database_name] = SQLiteDatabase(self.database_path(database_name))
+        return self.databases[database_name]
+
+    def drop_database(self, database_name):
+        """
+        Drops every table of database_name
+        """
+        database = self[database_name]
+        for table_name in database.list_collection_names():
+            database[table_name].drop()
+
+    def close(self):
+        """
+        Closes every open database
+        """
+        for database in self.databases.values():
+            database.close()
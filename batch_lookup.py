@@ -0,0 +1,113 @@
+"""
+Batch lookups of users or statuses by ID: IDs are resolved in chunked $in queries,
+concurrently for large inputs, and results are streamed back in input order as
+(id, document) pairs with None for IDs that were not found.
+Usage: python batch_lookup.py users|statuses <id_file> [connection_string]
+"""
+
+import csv
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, islice
+
+import read_routing
+
+LOOKUP_CHUNK_SIZE = 500
+MAX_WORKERS = 4
+# Chunks kept in flight per worker, bounding memory for arbitrarily long inputs
+CHUNKS_PER_WORKER = 2
+ID_HEADERS = ("USER_ID", "STATUS_ID", "ID")
+
+
+def read_ids(filename):
+    """
+    Yields IDs from a file with one ID per line, or the first column of a CSV
+    such as accounts.csv; an ID header line is skipped
+    """
+    with open(filename, encoding="utf-8", newline="") as file:
+        for number, row in enumerate(csv.reader(file)):
+            if not row or not row[0].strip():
+                continue
+            if number == 0 and row[0].strip().upper() in ID_HEADERS:
+                continue
+            yield row[0].strip()
+
+
+def chunks(ids, size):
+    """
+    Splits an iterable of IDs into lists of at most size
+    """
+    iterator = iter(ids)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def lookup_chunk(collection, chunk, projection=None):
+    """
+    One $in query for a chunk of IDs; returns the chunk with its (id, document or None) results.
+    _id is always fetched to match documents to IDs, and dropped again if projection excludes it.
+    """
+    hide_id = isinstance(projection, dict) and not projection.get("_id", True)
+    if hide_id:
+        projection = {field: value for field, value in projection.items() if field != "_id"} or None
+    found = {}
+    for document in collection.find({"_id": {"$in": list(set(chunk))}}, projection):
+        found[document.pop("_id") if hide_id else document["_id"]] = document
+    return [(item_id, found.get(item_id)) for item_id in chunk]
+
+
+def batch_lookup(collection, ids, projection=None, chunk_size=LOOKUP_CHUNK_SIZE, max_workers=MAX_WORKERS):
+    """
+    Yields (id, document or None) for every ID, in input order.
+    Up to max_workers chunks are queried at once; a single chunk runs inline.
+    """
+    collection = read_routing.read_view(collection, "search")
+    id_chunks = chunks(ids, chunk_size)
+    first = next(id_chunks, None)
+    second = next(id_chunks, None)
+    if second is None:
+        if first is not None:
+            yield from lookup_chunk(collection, first, projection)
+        return
+    pending = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for chunk in chain([first, second], id_chunks):
+            pending.append(executor.submit(lookup_chunk, collection, chunk, projection))
+            if len(pending) >= max_workers * CHUNKS_PER_WORKER:
+                yield from pending.pop(0).result()
+        for future in pending:
+            yield from future.result()
+
+
+def write_results(results, output, fields):
+    """
+    Writes (id, document) results as CSV rows: ID, FOUND, then fields (empty when missing).
+    Returns (found, missing) counts.
+    """
+    writer = csv.writer(output)
+    writer.writerow(["ID", "FOUND", *fields])
+    found = missing = 0
+    for item_id, document in results:
+        if document is None:
+            missing += 1
+            writer.writerow([item_id, "no", *([""] * len(fields))])
+        else:
+            found += 1
+            writer.writerow([item_id, "yes", *(document.get(field, "") for field in fields)])
+    return found, missing
+
+
+if __name__ == "__main__":
+    import main  # pylint: disable = C0415
+    if len(sys.argv) < 3 or sys.argv[1] not in ("users", "statuses"):
+        sys.exit(__doc__.strip().splitlines()[-1])
+    client = main.get_mongo_client(*sys.argv[3:4])
+    if sys.argv[1] == "users":
+        lookups = main.search_users(read_ids(sys.argv[2]), main.init_user_collection(client))
+        columns = ["user_email", "user_name", "user_last_name"]
+    else:
+        lookups = main.search_statuses(read_ids(sys.argv[2]), main.init_status_collection(client))
+        columns = ["user_id", "status_text"]
+    found_count, missing_count = write_results(lookups, sys.stdout, columns)
+    print(f"{found_count} found, {missing_count} missing", file=sys.stderr)
+    client.close()
@@ -0,0 +1,66 @@
+'''
+Compares loader throughput between storage backends.
+Usage: python bench_backends.py [connection_string ...]
+Defaults to the SQLite backend only, so it runs fully offline.
+'''
+
+import os
+import sys
+import tempfile
+import time
+
+import main
+
+# pylint: disable = C0103
+
+ROWS = 50_000
+
+
+def write_synthetic_files(directory, users=2000, statuses=ROWS):
+    '''
+    Writes accounts/status CSV files shaped like the sample data
+    '''
+    accounts = os.path.join(directory, "accounts.csv")
+    with open(accounts, "w", encoding="utf-8") as file:
+        file.write("USER_ID,EMAIL,NAME,LASTNAME\n")
+        for i in range(users):
+            file.write(f"User.Name{i},user{i}@testmail.com,User,Name{i}\n")
+    status_file = os.path.join(directory, "status_updates.csv")
+    with open(status_file, "w", encoding="utf-8") as file:
+        file.write("STATUS_ID,USER_ID,STATUS_TEXT\n")
+        for i in range(statuses):
+            file.write(f"User.Name{i % users}_{i:05d},User.Name{i % users},Status text number {i}\n")
+    return accounts, status_file
+
+
+def run(connection_string, accounts, status_file, batch_size=1000):
+    '''
+    Loads both files into a fresh database and returns (user rows/s, status rows/s)
+    '''
+    client = main.get_mongo_client(connection_string)
+    client.drop_database(main.DATABASE)
+    user_collection = main.init_user_collection(client)
+    status_collection = main.init_status_collection(client)
+
+    start_time = time.perf_counter()
+    main.load_users(accounts, user_collection, batch_size=batch_size)
+    user_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    main.load_status_updates(status_file, status_collection, batch_size=batch_size)
+    status_time = time.perf_counter() - start_time
+
+    users = user_collection.count_documents({})
+    statuses = status_collection.database.count_documents({})
+    client.drop_database(main.DATABASE)
+    client.close()
+    return users / user_time, statuses / status_time
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        targets = sys.argv[1:] or [main.SQLITE_SCHEME + directory]
+        files = write_synthetic_files(directory)
+        for target in targets:
+            user_rate, status_rate = run(target, *files)
+            print(f"{target}: users {user_rate:,.0f} rows/s, statuses {status_rate:,.0f} rows/s")
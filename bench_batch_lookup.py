@@ -0,0 +1,61 @@
+'''
+Compares looking up a list of user IDs one search_user call at a time with
+search_users, which resolves them in chunked $in queries, at 100k users.
+Usage: python bench_batch_lookup.py [connection_string ...]
+Defaults to the SQLite backend only, so it runs fully offline.
+'''
+
+import random
+import sys
+import tempfile
+import time
+
+import main
+
+# pylint: disable = C0103
+
+USERS = 100_000
+LOOKUPS = 20_000
+# A share of the IDs that do not exist, as in a real list of IDs to check
+MISSING_SHARE = 0.1
+BATCH_SIZE = 10_000
+
+
+def ids_per_second(lookup, ids):
+    '''
+    Runs lookup(ids) to completion and returns IDs/s
+    '''
+    start_time = time.perf_counter()
+    lookup(ids)
+    return len(ids) / (time.perf_counter() - start_time)
+
+
+def run(connection_string, users=USERS):
+    '''
+    Returns {"per-ID loop", "search_users"} IDs/s
+    '''
+    client = main.get_mongo_client(connection_string)
+    client.drop_database(main.DATABASE)
+    user_collection = main.init_user_collection(client)
+    for start in range(0, users, BATCH_SIZE):
+        user_collection.insert_many([{"_id": f"User{i}", "user_email": f"user{i}@testmail.com",
+                                      "user_name": "User", "user_last_name": f"Name{i}"}
+                                     for i in range(start, min(users, start + BATCH_SIZE))])
+
+    ids = [f"User{random.randrange(users)}" if random.random() >= MISSING_SHARE else f"Ghost{i}"
+           for i in range(LOOKUPS)]
+    rates = {
+        "per-ID loop": ids_per_second(lambda ids: [main.search_user(user_id, user_collection) for user_id in ids],
+                                      ids),
+        "search_users": ids_per_second(lambda ids: list(main.search_users(ids, user_collection)), ids),
+    }
+    client.drop_database(main.DATABASE)
+    client.close()
+    return rates
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        for target in sys.argv[1:] or [main.SQLITE_SCHEME + directory]:
+            for name, rate in run(target).items():
+                print(f"{target}: {name}: {rate:,.0f} IDs/s")
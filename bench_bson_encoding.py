@@ -0,0 +1,72 @@
+'''
+Benchmark of CPU time per 100k status rows, starting from CSV text:
+dict path (DictReader row, loader dict, BSON encode in insert_many) vs
+pre-encoded raw BSON path (csv.reader row, raw buffer, RawBSONDocument wrap)
+'''
+
+import csv
+import io
+import time
+
+import bson
+from bson.raw_bson import RawBSONDocument
+import main
+
+# pylint: disable = C0103
+
+ROWS = 100_000
+
+
+def synthetic_csv(count=ROWS):
+    '''
+    Builds a status CSV in memory shaped like status_updates.csv
+    '''
+    lines = ["STATUS_ID,USER_ID,STATUS_TEXT"]
+    lines += [f"User.Name{i % 2000}_{i:05d},User.Name{i % 2000},Status text number {i} with some words"
+              for i in range(count)]
+    return "\n".join(lines) + "\n"
+
+
+def dict_path(text):
+    '''
+    What load_status_updates does, all in the parent process
+    '''
+    for row in csv.DictReader(io.StringIO(text)):
+        bson.encode({"_id": row['STATUS_ID'], "user_id": row['USER_ID'], "status_text": row['STATUS_TEXT']})
+
+
+def raw_worker_path(text):
+    '''
+    What load_status_updates_raw workers do
+    '''
+    reader = csv.reader(io.StringIO(text))
+    next(reader)
+    return main.encode_status_batch(list(reader))
+
+
+def raw_parent_path(encoded):
+    '''
+    What is left for the parent: wrap the buffers; insert_many sends RawBSONDocument.raw as-is
+    '''
+    for data in encoded:
+        _ = RawBSONDocument(data).raw
+
+
+def timed(function, *args):
+    '''
+    Returns (CPU seconds, result)
+    '''
+    start_time = time.process_time()
+    result = function(*args)
+    return time.process_time() - start_time, result
+
+
+if __name__ == "__main__":
+    csv_text = synthetic_csv()
+    dict_time, _ = timed(dict_path, csv_text)
+    worker_time, buffers = timed(raw_worker_path, csv_text)
+    parent_time, _ = timed(raw_parent_path, buffers)
+    scale = 100_000 / ROWS
+    print(f"dict path:          {dict_time * scale:.3f} CPU s per 100k rows (parent)")
+    print(f"raw path (workers): {worker_time * scale:.3f} CPU s per 100k rows")
+    print(f"raw path (parent):  {parent_time * scale:.3f} CPU s per 100k rows")
@@ -0,0 +1,66 @@
+'''
+Measures storage and working-set size of the full and compact schemas.
+Reports the average BSON document size (what the server caches and sends) and the
+on-disk size each backend reports: SQLite file size, MongoDB collStats size/storageSize.
+Usage: python bench_compact_schema.py [connection_string ...]
+Defaults to the SQLite backend only, so it runs fully offline.
+'''
+
+import os
+import sys
+import tempfile
+
+import bson
+
+import main
+from bench_backends import write_synthetic_files
+
+# pylint: disable = C0103
+
+USERS = 20_000
+STATUSES = 200_000
+
+
+def storage_bytes(client, database_name):
+    '''
+    Bytes the backend uses for database_name: (data size, storage size)
+    '''
+    if hasattr(client, "database_path"):
+        size = os.path.getsize(client.database_path(database_name))
+        return size, size
+    stats = [client[database_name].command("collStats", name) for name in ("UserAccounts", "StatusUpdates")]
+    return sum(stat["size"] for stat in stats), sum(stat["storageSize"] for stat in stats)
+
+
+def run(connection_string, accounts, status_file, compact):
+    '''
+    Loads both files in one schema; returns (avg user BSON, avg status BSON, data size, storage size)
+    '''
+    client = main.get_mongo_client(connection_string)
+    database_name = f"{main.DATABASE}_{'compact' if compact else 'full'}"
+    client.drop_database(database_name)
+    user_collection = main.init_user_collection(client, database_name, compact=compact)
+    status_collection = main.init_status_collection(client, database_name, compact=compact)
+    main.load_users(accounts, user_collection, batch_size=5000)
+    main.load_status_updates(status_file, status_collection, batch_size=5000)
+    if hasattr(client, "database_path"):
+        client[database_name].db.execute_sql("VACUUM")
+
+    raw = client[database_name]
+    user_bytes = sum(len(bson.encode(document)) for document in raw["UserAccounts"].find({})) / USERS
+    status_bytes = sum(len(bson.encode(document)) for document in raw["StatusUpdates"].find({})) / STATUSES
+    sizes = storage_bytes(client, database_name)
+    client.drop_database(database_name)
+    client.close()
+    return (user_bytes, status_bytes, *sizes)
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        files = write_synthetic_files(directory, users=USERS, statuses=STATUSES)
+        for target in sys.argv[1:] or [main.SQLITE_SCHEME + directory]:
+            full = run(target, *files, compact=False)
+            compact = run(target, *files, compact=True)
+            for label, before, after in zip(("avg user document", "avg status document", "data size",
+                                             "storage size"), full, compact):
+                print(f"{target}: {label}: {before:,.0f} -> {after:,.0f} bytes ({1 - after / before:.1%} smaller)")
@@ -0,0 +1,63 @@
+'''
+Compares search_user_by_email as a collection scan, through the unique index,
+and through the index plus the LRU cache, at 1M users.
+Usage: python bench_email_lookup.py [connection_string ...]
+Defaults to the SQLite backend only, so it runs fully offline.
+'''
+
+import random
+import sys
+import tempfile
+import time
+
+import main
+
+# pylint: disable = C0103
+
+USERS = 1_000_000
+SCAN_LOOKUPS = 20
+INDEXED_LOOKUPS = 20_000
+BATCH_SIZE = 10_000
+
+
+def lookups_per_second(emails, user_collection, email_lookup=None):
+    '''
+    Runs search_user_by_email for every email and returns lookups/s
+    '''
+    start_time = time.perf_counter()
+    for email in emails:
+        main.search_user_by_email(email, user_collection, email_lookup)
+    return len(emails) / (time.perf_counter() - start_time)
+
+
+def run(connection_string, users=USERS):
+    '''
+    Returns {"scan", "index", "index + cache"} lookups/s
+    '''
+    client = main.get_mongo_client(connection_string)
+    client.drop_database(main.DATABASE)
+    user_collection = main.init_user_collection(client)
+    for start in range(0, users, BATCH_SIZE):
+        user_collection.insert_many([{"_id": f"User{i}", "user_email": f"user{i}@testmail.com",
+                                      "user_name": "User", "user_last_name": f"Name{i}"}
+                                     for i in range(start, min(users, start + BATCH_SIZE))])
+
+    rates = {"scan": lookups_per_second([f"user{random.randrange(users)}@testmail.com"
+                                         for _ in range(SCAN_LOOKUPS)], user_collection)}
+    email_lookup = main.init_email_lookup(user_collection)
+    # A skewed workload: most lookups hit a small set of active users
+    hot = [f"user{random.randrange(users)}@testmail.com" for _ in range(1000)]
+    emails = [random.choice(hot) if random.random() < 0.8 else f"user{random.randrange(users)}@testmail.com"
+              for _ in range(INDEXED_LOOKUPS)]
+    rates["index"] = lookups_per_second(emails, user_collection)
+    rates["index + cache"] = lookups_per_second(emails, user_collection, email_lookup)
+    client.drop_database(main.DATABASE)
+    client.close()
+    return rates
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        for target in sys.argv[1:] or [main.SQLITE_SCHEME + directory]:
+            for name, rate in run(target).items():
+                print(f"{target}: {name}: {rate:,.1f} lookups/s")
@@ -0,0 +1,48 @@
+'''
+Measures export throughput for one cursor against parallel _id-range cursors.
+Usage: python bench_export.py [connection_string ...]
+Defaults to the SQLite backend only, so it runs fully offline.
+'''
+
+import os
+import sys
+import tempfile
+import time
+
+import main
+from bench_backends import write_synthetic_files
+
+# pylint: disable = C0103
+
+ROWS = 200_000
+PARTS = (1, 2, 4, 8)
+
+
+def run(connection_string, directory, rows=ROWS):
+    '''
+    Loads synthetic statuses, then returns {(format, parts): rows/s} for each export
+    '''
+    client = main.get_mongo_client(connection_string)
+    client.drop_database(main.DATABASE)
+    status_collection = main.init_status_collection(client)
+    _accounts, status_file = write_synthetic_files(directory, statuses=rows)
+    main.load_status_updates(status_file, status_collection, batch_size=5000)
+
+    rates = {}
+    for file_format in ("csv", "parquet"):
+        for parts in PARTS:
+            filename = os.path.join(directory, f"export_{parts}.{file_format}")
+            start_time = time.perf_counter()
+            written = main.export_status_updates(filename, status_collection, parts=parts)
+            rates[file_format, parts] = (written or 0) / (time.perf_counter() - start_time)
+            os.remove(filename)
+    client.drop_database(main.DATABASE)
+    client.close()
+    return rates
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        for target in sys.argv[1:] or [main.SQLITE_SCHEME + directory]:
+            for (file_format, parts), rate in run(target, directory).items():
+                print(f"{target}: {file_format} with {parts} cursor(s): {rate:,.0f} rows/s")
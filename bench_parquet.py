@@ -0,0 +1,101 @@
+'''
+Compares the CSV and Parquet input paths of the loaders on the same data.
+Reports parsing alone (file to documents) and full loads into a fresh database.
+Usage: python bench_parquet.py [connection_string ...]
+Defaults to the SQLite backend only, so it runs fully offline.
+'''
+
+import sys
+import tempfile
+import time
+
+import pyarrow.csv
+import pyarrow.parquet
+
+import columnar
+import delta_sync
+import main
+from bench_backends import write_synthetic_files
+
+# pylint: disable = C0103
+
+USERS = 100_000
+STATUSES = 300_000
+ROW_GROUP_SIZE = 25_000
+
+
+def to_parquet(csv_file):
+    '''
+    Writes a Parquet copy of a CSV file next to it, all columns as strings
+    '''
+    parquet_file = csv_file.rsplit(".", 1)[0] + ".parquet"
+    options = pyarrow.csv.ConvertOptions(strings_can_be_null=False)
+    table = pyarrow.csv.read_csv(csv_file, convert_options=options)
+    table = table.cast(pyarrow.schema([(name, pyarrow.string()) for name in table.column_names]))
+    pyarrow.parquet.write_table(table, parquet_file, row_group_size=ROW_GROUP_SIZE)
+    return parquet_file
+
+
+def timed(function, *args, **kwargs):
+    '''
+    Seconds taken by function(*args, **kwargs)
+    '''
+    start_time = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - start_time
+
+
+def read_parquet(filename, spec):
+    '''
+    All documents of a Parquet file, as the single-process loaders read them
+    '''
+    return [document for group in columnar.read_documents(filename, spec) for document in group]
+
+
+def parse_rates(accounts, status_file):
+    '''
+    Rows/s for turning each file into documents, without writing them
+    '''
+    rates = {}
+    for name, filename, rows in (("users", accounts, USERS), ("statuses", status_file, STATUSES)):
+        spec = delta_sync.USER_SPEC if name == "users" else delta_sync.STATUS_SPEC
+        reader = main.read_user_csv if name == "users" else main.read_status_csv
+        rates[name, "csv"] = rows / timed(reader, filename)
+        rates[name, "parquet"] = rows / timed(read_parquet, filename.rsplit(".", 1)[0] + ".parquet", spec)
+    return rates
+
+
+def load_rates(connection_string, accounts, status_file):
+    '''
+    Rows/s for full loads of each format into a fresh database
+    '''
+    rates = {}
+    for file_format, users, statuses in (("csv", accounts, status_file),
+                                         ("parquet", to_parquet(accounts), to_parquet(status_file))):
+        for name, function, args in (
+                ("users", main.load_users, (users,)),
+                ("statuses", main.load_status_updates, (statuses,)),
+                ("users multiprocess", main.load_users_multiprocess, (users,))):
+            client = main.get_mongo_client(connection_string)
+            client.drop_database(main.DATABASE)
+            if name == "users multiprocess":
+                seconds = timed(function, *args, connection_string=connection_string, batch_size=ROW_GROUP_SIZE)
+            elif name == "users":
+                seconds = timed(function, *args, main.init_user_collection(client), batch_size=5000)
+            else:
+                seconds = timed(function, *args, main.init_status_collection(client), batch_size=5000)
+            rates[name, file_format] = (STATUSES if name == "statuses" else USERS) / seconds
+            client.drop_database(main.DATABASE)
+            client.close()
+    return rates
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        files = write_synthetic_files(directory, users=USERS, statuses=STATUSES)
+        targets = sys.argv[1:] or [main.SQLITE_SCHEME + directory]
+        for target in targets:
+            for (name, file_format), rate in load_rates(target, *files).items():
+                print(f"{target}: load {name} from {file_format}: {rate:,.0f} rows/s")
+        for (name, file_format), rate in parse_rates(*files).items():
+            print(f"parse {name} from {file_format}: {rate:,.0f} rows/s")
@@ -0,0 +1,61 @@
+'''
+Lookup latency during a concurrent bulk load, primary reads vs routed (secondary) reads.
+Needs a replica set: python bench_read_routing.py "mongodb://host1,host2,host3/?replicaSet=rs0"
+'''
+
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import bench_backends
+import main
+
+# pylint: disable = C0103
+
+LOOKUPS = 2000
+
+
+def lookup_latencies(user_collection, user_ids):
+    '''
+    Per-lookup latencies in milliseconds
+    '''
+    latencies = []
+    for user_id in user_ids:
+        start_time = time.perf_counter()
+        main.search_user(user_id, user_collection)
+        latencies.append((time.perf_counter() - start_time) * 1000)
+    return latencies
+
+
+def run(connection_string, status_file, routed):
+    '''
+    Times lookups while load_status_updates runs in a background thread
+    '''
+    client = main.get_mongo_client(connection_string)
+    loader = threading.Thread(target=main.load_status_updates,
+                              args=(status_file, main.init_status_collection(client)), kwargs={"batch_size": 1000})
+    if routed:
+        user_collection, _status_collection = main.init_read_routed_collections(client)
+    else:
+        user_collection = main.init_user_collection(client)
+    loader.start()
+    latencies = lookup_latencies(user_collection, [f"User.Name{i % 2000}" for i in range(LOOKUPS)])
+    loader.join()
+    client.drop_database(main.DATABASE)
+    client.close()
+    return latencies
+
+
+if __name__ == "__main__":
+    target = sys.argv[1]
+    with tempfile.TemporaryDirectory() as directory:
+        accounts, statuses = bench_backends.write_synthetic_files(directory, statuses=200_000)
+        for routed in (False, True):
+            setup_client = main.get_mongo_client(target)
+            main.load_users(accounts, main.init_user_collection(setup_client), batch_size=1000)
+            setup_client.close()
+            latencies = run(target, statuses, routed)
+            print(f"{'routed' if routed else 'primary'}: median {statistics.median(latencies):.2f} ms, "
+                  f"p99 {statistics.quantiles(latencies, n=100)[98]:.2f} ms")
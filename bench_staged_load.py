@@ -0,0 +1,72 @@
+'''
+Compares a full status reload done as drop + load into the indexed live collection
+with a staged load (unindexed shadow, index build, rename). A reader thread counts
+the live collection throughout and reports how often it saw partial data.
+Usage: python bench_staged_load.py [connection_string ...]
+Defaults to the SQLite backend only, so it runs fully offline.
+'''
+
+import sys
+import tempfile
+import threading
+import time
+
+import main
+from bench_backends import write_synthetic_files
+
+# pylint: disable = C0103
+
+ROWS = 300_000
+BATCH_SIZE = 5000
+
+
+def watch_reads(connection_string, stop, seen):
+    '''
+    Appends the live status count (None on a failed read) to seen until stop is set
+    '''
+    client = main.get_mongo_client(connection_string)
+    status_collection = main.init_status_collection(client)
+    while not stop.is_set():
+        try:
+            seen.append(status_collection.database.count_documents({}))
+        except Exception:  # pylint: disable = W0718
+            # e.g. the collection is missing between drop and re-create
+            seen.append(None)
+        stop.wait(0.01)
+    client.close()
+
+
+def reload(connection_string, status_file, staged):
+    '''
+    Reloads the statuses once; returns (seconds, share of reads that saw partial data)
+    '''
+    client = main.get_mongo_client(connection_string)
+    stop = threading.Event()
+    seen = []
+    reader = threading.Thread(target=watch_reads, args=(connection_string, stop, seen))
+    reader.start()
+    start_time = time.perf_counter()
+    if staged:
+        main.load_status_updates_staged(status_file, client, batch_size=BATCH_SIZE)
+    else:
+        status_collection = main.init_status_collection(client)
+        status_collection.database.drop()
+        main.load_status_updates(status_file, status_collection, batch_size=BATCH_SIZE)
+    seconds = time.perf_counter() - start_time
+    stop.set()
+    reader.join()
+    client.close()
+    return seconds, sum(1 for count in seen if count != ROWS) / max(len(seen), 1)
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        _accounts, status_file = write_synthetic_files(directory, statuses=ROWS)
+        for target in sys.argv[1:] or [main.SQLITE_SCHEME + directory]:
+            setup = main.get_mongo_client(target)
+            main.load_status_updates_staged(status_file, setup, batch_size=BATCH_SIZE)
+            setup.close()
+            for staged in (False, True):
+                seconds, partial = reload(target, status_file, staged)
+                print(f"{target}: {'staged' if staged else 'drop + load'}: {ROWS / seconds:,.0f} rows/s, "
+                      f"{partial:.0%} of reads saw partial data")
@@ -0,0 +1,66 @@
+'''
+Memory per million users and lookup latency of UserDirectory compared with find_one.
+Usage: python bench_user_directory.py [connection_string]
+find_one runs against the SQLite backend unless a connection string is given.
+'''
+
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import main
+from user_directory import UserDirectory
+
+# pylint: disable = C0103
+
+USERS = 1_000_000
+LOOKUPS = 20_000
+
+
+def user_ids(count):
+    '''
+    IDs shaped like the sample data (Firstname.Lastname42)
+    '''
+    return [f"User.Name{i}" for i in range(count)]
+
+
+def directory_memory(count=USERS):
+    '''
+    Bytes allocated by a UserDirectory holding count IDs, strings included
+    '''
+    tracemalloc.start()
+    # One sort of the bulk IDs; add() inserts into the sorted array, O(n) per call
+    directory = UserDirectory.from_ids(user_ids(count))
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, directory
+
+
+def lookup_latency(function, probes):
+    '''
+    Mean seconds per lookup
+    '''
+    start_time = time.perf_counter()
+    for probe in probes:
+        function(probe)
+    return (time.perf_counter() - start_time) / len(probes)
+
+
+if __name__ == "__main__":
+    memory, directory = directory_memory()
+    print(f"UserDirectory: {memory / 1024 ** 2:.1f} MiB per million users")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        client = main.get_mongo_client(sys.argv[1] if len(sys.argv) > 1 else main.SQLITE_SCHEME + tmp)
+        user_collection = main.init_user_collection(client)
+        user_collection.insert_many([{"_id": user_id} for user_id in user_ids(100_000)], ordered=False)
+        probes = [f"User.Name{random.randrange(200_000)}" for _ in range(LOOKUPS)]
+
+        find_one_time = lookup_latency(lambda user_id: user_collection.find_one({"_id": user_id}), probes)
+        directory_time = lookup_latency(directory.contains, probes)
+        print(f"find_one:      {find_one_time * 1e6:.1f} us per lookup")
+        print(f"UserDirectory: {directory_time * 1e6:.2f} us per lookup")
+        client.drop_database(main.DATABASE)
+        client.close()
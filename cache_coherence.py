@@ -0,0 +1,168 @@
+"""
+Cross-process cache coherence: follows the UserAccounts / StatusUpdates change streams
+and tells every subscribed in-process cache which documents changed.
+
+A stream that drops is reopened from its last resume token, so no change is missed.
+If the history behind the token is gone, subscribers are flushed. While any stream
+is down (or change streams are unavailable, e.g. on a standalone server) max_age()
+returns the TTL and caches stop trusting entries older than that.
+"""
+
+import threading
+
+import pymongo
+
+USER_TABLE = "UserAccounts"
+STATUS_TABLE = "StatusUpdates"
+DEFAULT_TTL = 30.0
+RETRY_DELAY = 1.0
+MAX_RETRY_DELAY = 30.0
+# Server error raised when the oplog no longer holds the resume point
+CHANGE_STREAM_HISTORY_LOST = 286
+DOCUMENT_OPERATIONS = ("insert", "update", "replace", "delete")
+
+
+def change_stream_source(collection):
+    """
+    Event source for a pymongo collection: open(resume_token) -> change stream
+    """
+    def open_stream(resume_token):
+        return collection.watch(resume_after=resume_token)
+    return open_stream
+
+
+class CacheInvalidator:
+    """
+    One follower thread per watched collection, dispatching change events to subscribers.
+    sources maps a collection name to open(resume_token) returning an iterable of
+    change events; change_stream_source builds one for a real collection, tests inject their own.
+    """
+
+    def __init__(self, sources, ttl=DEFAULT_TTL, retry_delay=RETRY_DELAY):
+        self.sources = dict(sources)
+        self.ttl = ttl
+        self.retry_delay = retry_delay
+        self.subscribers = {table_name: [] for table_name in self.sources}
+        self.resume_tokens = {}
+        self.connected = set()
+        self.streams = {}
+        self.threads = []
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+
+    def subscribe(self, table_name, invalidate, flush=None):
+        """
+        invalidate(document_id, operation) is called for every changed document of table_name,
+        flush() when changes may have been missed
+        """
+        self.subscribers[table_name].append((invalidate, flush))
+
+    def live(self):
+        """
+        True while every stream is connected
+        """
+        with self.lock:
+            return self.connected == set(self.sources)
+
+    def max_age(self):
+        """
+        Oldest cache entry subscribers may trust, in seconds: None while every stream is live, else the TTL
+        """
+        return None if self.live() else self.ttl
+
+    def dispatch(self, table_name, event):
+        """
+        Hands one change event to the subscribers of table_name and records its resume token.
+        A failing subscriber is reported and flushed; the others still get the event.
+        """
+        operation = event["operationType"]
+        for invalidate, flush in self.subscribers[table_name]:
+            try:
+                if operation in DOCUMENT_OPERATIONS:
+                    invalidate(event["documentKey"]["_id"], operation)
+                elif flush is not None:
+                    # drop, rename, dropDatabase, invalidate: the whole collection may have changed
+                    flush()
+            except Exception as error:  # pylint: disable = W0718
+                print(f"Cache subscriber of {table_name} failed on {operation}: {error!r}")
+                if flush is not None and operation in DOCUMENT_OPERATIONS:
+                    self.flush_subscriber(table_name, flush)
+        with self.lock:
+            self.resume_tokens[table_name] = event["_id"]
+
+    def flush(self, table_name):
+        """
+        Flushes every subscriber of table_name
+        """
+        for _invalidate, flush in self.subscribers[table_name]:
+            if flush is not None:
+                self.flush_subscriber(table_name, flush)
+
+    @staticmethod
+    def flush_subscriber(table_name, flush):
+        """
+        Calls one subscriber's flush, reporting rather than raising its errors
+        """
+        try:
+            flush()
+        except Exception as error:  # pylint: disable = W0718
+            print(f"Cache subscriber of {table_name} failed to flush: {error!r}")
+
+    def follow(self, table_name):
+        """
+        Follower thread body: (re)opens the stream and dispatches its events until stopped.
+        Any error drops the stream and retries with backoff; the thread only ends on stop().
+        """
+        delay = self.retry_delay
+        while not self.stopping.is_set():
+            try:
+                with self.lock:
+                    resume_token = self.resume_tokens.get(table_name)
+                stream = self.sources[table_name](resume_token)
+                with self.lock:
+                    self.streams[table_name] = stream
+                    self.connected.add(table_name)
+                delay = self.retry_delay
+                for event in stream:
+                    self.dispatch(table_name, event)
+                    if self.stopping.is_set():
+                        break
+            except pymongo.errors.OperationFailure as error:
+                if error.code == CHANGE_STREAM_HISTORY_LOST:
+                    # Events since the token are gone: start from now and drop everything cached
+                    with self.lock:
+                        self.resume_tokens.pop(table_name, None)
+                    self.flush(table_name)
+            except pymongo.errors.PyMongoError:
+                pass
+            except Exception as error:  # pylint: disable = W0718
+                print(f"Change stream of {table_name} failed: {error!r}")
+            finally:
+                with self.lock:
+                    self.connected.discard(table_name)
+                    self.streams.pop(table_name, None)
+            self.stopping.wait(delay)
+            delay = min(delay * 2, MAX_RETRY_DELAY)
+
+    def start(self):
+        """
+        Starts one daemon follower thread per watched collection
+        """
+        for table_name in self.sources:
+            thread = threading.Thread(target=self.follow, args=(table_name,), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def stop(self):
+        """
+        Stops the followers, closing open streams so blocked reads return
+        """
+        self.stopping.set()
+        with self.lock:
+            streams = list(self.streams.values())
+        for stream in streams:
+            if hasattr(stream, "close"):
+                stream.close()
+        for thread in self.threads:
+            thread.join()
@@ -0,0 +1,66 @@
+"""
+Columnar input for the loaders: Parquet files are read one row group at a time with
+pyarrow and mapped to documents column-wise, without csv.DictReader or pandas rows.
+pyarrow is only needed when a Parquet file is actually loaded.
+"""
+
+PARQUET_EXTENSIONS = (".parquet", ".pq")
+
+
+def is_parquet(filename):
+    """
+    True for files the loaders should read as Parquet
+    """
+    return str(filename).lower().endswith(PARQUET_EXTENSIONS)
+
+
+def open_parquet(filename):
+    """
+    pyarrow ParquetFile for filename; raises FileNotFoundError like open() does
+    """
+    import pyarrow.parquet  # pylint: disable = C0415
+    try:
+        return pyarrow.parquet.ParquetFile(filename)
+    except OSError as error:
+        raise FileNotFoundError(str(error)) from error
+
+
+def row_group_count(filename):
+    """
+    Number of row groups, the unit of work handed to loader processes
+    """
+    return open_parquet(filename).num_row_groups
+
+
+def table_documents(table, spec, required=False):
+    """
+    Maps a table with the spec's CSV columns to a list of documents.
+    Columns are cast to strings, as the CSV loaders read them; with required,
+    rows with a null or empty value in any column are dropped column-wise first.
+    """
+    import pyarrow  # pylint: disable = C0415
+    import pyarrow.compute  # pylint: disable = C0415
+    columns = [spec["key"], *spec["fields"]]
+    table = table.select(columns)
+    table = table.cast(pyarrow.schema([(column, pyarrow.string()) for column in columns]))
+    if required:
+        mask = None
+        for column in table.columns:
+            present = pyarrow.compute.fill_null(pyarrow.compute.greater(pyarrow.compute.utf8_length(column), 0),
+                                                False)
+            mask = present if mask is None else pyarrow.compute.and_(mask, present)
+        table = table.filter(mask)
+    return table.rename_columns(["_id", *spec["fields"].values()]).to_pylist()
+
+
+def read_documents(filename, spec, required=False, row_groups=None):
+    """
+    Yields one list of documents per row group (all row groups, or the given indexes)
+    """
+    parquet_file = open_parquet(filename)
+    columns = [spec["key"], *spec["fields"]]
+    missing = [column for column in columns if column not in parquet_file.schema_arrow.names]
+    if missing:
+        raise KeyError(f"Missing columns {missing}")
+    for index in range(parquet_file.num_row_groups) if row_groups is None else row_groups:
+        yield table_documents(parquet_file.read_row_group(index, columns=columns), spec, required)
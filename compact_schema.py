@@ -0,0 +1,312 @@
+"""
+Compact on-disk schema: documents are stored with one- or two-letter keys and
+mapped back to the full field names on read, so callers never see the short form.
+
+CompactCollection wraps a collection and translates documents, queries, projections,
+updates, bulk requests, index keys and aggregation field paths in both directions.
+migrate() rewrites an existing collection between the two schemas in bulk.
+Usage: python compact_schema.py [connection_string] [--expand]
+"""
+
+import sys
+
+import pymongo
+from bson.raw_bson import RawBSONDocument
+from pymongo import DeleteOne, InsertOne, ReplaceOne, UpdateOne
+
+from backends import CollectionBackend
+
+USER_KEYS = {"user_email": "e", "user_name": "n", "user_last_name": "l", "user_email_normalized": "en"}
+STATUS_KEYS = {"user_id": "u", "status_text": "t"}
+TABLE_KEYS = {"UserAccounts": USER_KEYS, "StatusUpdates": STATUS_KEYS}
+# Indexes of the compact collections, by full field name
+COMPACT_INDEXES = {"UserAccounts": [], "StatusUpdates": [[("user_id", pymongo.ASCENDING)]]}
+MIGRATION_BATCH_SIZE = 1000
+# Stages whose results are not stored documents: later paths and result keys are output names
+RESHAPING_STAGES = {"$group", "$bucket", "$bucketAuto", "$count", "$sortByCount", "$facet", "$replaceRoot",
+                    "$replaceWith"}
+
+
+def rename_keys(document, keys):
+    """
+    Copy of document with its top-level keys renamed through keys
+    """
+    return {keys.get(key, key): value for key, value in document.items()}
+
+
+def translate_query(query, keys):
+    """
+    Renames the fields of a query, recursing into $and / $or / $nor
+    """
+    translated = {}
+    for field, condition in (query or {}).items():
+        if field in ("$and", "$or", "$nor"):
+            translated[field] = [translate_query(part, keys) for part in condition]
+        else:
+            translated[keys.get(field, field)] = condition
+    return translated
+
+
+def translate_update(update, keys):
+    """
+    Renames the fields inside each update operator ($set, $unset, ...)
+    """
+    return {operator: rename_keys(values, keys) for operator, values in update.items()}
+
+
+def translate_expression(value, keys):
+    """
+    Renames the "$field" paths inside an aggregation expression; dict keys there are
+    operators or output names and are left alone
+    """
+    if isinstance(value, list):
+        return [translate_expression(item, keys) for item in value]
+    if isinstance(value, dict):
+        return {key: translate_expression(item, keys) for key, item in value.items()}
+    if isinstance(value, str) and value.startswith("$") and value[1:] in keys:
+        return "$" + keys[value[1:]]
+    return value
+
+
+def translate_stage(stage, keys):
+    """
+    Renames the field references of one pipeline stage. Only keys that name stored fields
+    ($match fields, $sort fields, $project inclusions) are renamed, never output names.
+    A $lookup is translated with the keys of the collection it joins.
+    """
+    operator, spec = next(iter(stage.items()))
+    if operator == "$match":
+        return {operator: translate_expression(translate_query(spec, keys), keys)}
+    if operator == "$sort":
+        return {operator: rename_keys(spec, keys)}
+    if operator == "$project":
+        return {operator: {keys.get(field, field) if is_inclusion(value) else field: translate_expression(value, keys)
+                           for field, value in spec.items()}}
+    if operator == "$lookup":
+        lookup = dict(spec)
+        foreign_keys = TABLE_KEYS.get(lookup.get("from"), {})
+        if "localField" in lookup:
+            lookup["localField"] = keys.get(lookup["localField"], lookup["localField"])
+        if "foreignField" in lookup:
+            lookup["foreignField"] = foreign_keys.get(lookup["foreignField"], lookup["foreignField"])
+        if "pipeline" in lookup:
+            lookup["pipeline"] = translate_pipeline(lookup["pipeline"], foreign_keys)
+        return {operator: lookup}
+    return {operator: translate_expression(spec, keys)}
+
+
+def is_inclusion(value):
+    """
+    True for a $project value that includes or excludes a field rather than computing one
+    """
+    return isinstance(value, (bool, int))
+
+
+def translate_pipeline(pipeline, keys):
+    """
+    Renames the field references of an aggregation pipeline. After a stage that reshapes
+    the documents ($group, $bucket, ...) paths name that stage's outputs and are kept as they are.
+    """
+    translated = []
+    for stage in pipeline:
+        translated.append(translate_stage(stage, keys))
+        if RESHAPING_STAGES.intersection(stage):
+            keys = {}
+    return translated
+
+
+def computed_fields(pipeline):
+    """
+    Output names the pipeline computes, which results keep as they are; None if it
+    reshapes the documents, so no result key is a stored field
+    """
+    computed = set()
+    for stage in pipeline:
+        if RESHAPING_STAGES.intersection(stage):
+            return None
+        operator, spec = next(iter(stage.items()))
+        if operator == "$project":
+            computed.update(field for field, value in spec.items() if not is_inclusion(value))
+        elif operator in ("$addFields", "$set"):
+            computed.update(spec)
+        elif operator == "$lookup":
+            computed.add(spec["as"])
+    return computed
+
+
+def translate_index_keys(index_keys, keys):
+    """
+    Renames the fields of create_index keys (a field name or (field, direction) pairs)
+    """
+    if isinstance(index_keys, str):
+        return keys.get(index_keys, index_keys)
+    return [(keys.get(field, field), direction) for field, direction in index_keys]
+
+
+def translate_request(request, keys):
+    """
+    Rebuilds a bulk_write request with short keys
+    """
+    # pymongo's request classes keep their arguments in _doc, _filter and _upsert
+    # pylint: disable = W0212
+    if isinstance(request, InsertOne):
+        return InsertOne(rename_keys(request._doc, keys))
+    if isinstance(request, ReplaceOne):
+        return ReplaceOne(translate_query(request._filter, keys), rename_keys(request._doc, keys),
+                          upsert=request._upsert)
+    if isinstance(request, UpdateOne):
+        return UpdateOne(translate_query(request._filter, keys), translate_update(request._doc, keys),
+                         upsert=request._upsert)
+    if isinstance(request, DeleteOne):
+        return DeleteOne(translate_query(request._filter, keys))
+    raise NotImplementedError(f"Unsupported bulk request {request!r}")
+
+
+class CompactCollection(CollectionBackend):
+    """
+    Stores documents under short keys and returns them with the full field names
+    """
+
+    def __init__(self, collection, keys):
+        self.collection = collection
+        self.keys = keys
+        self.full_names = {short: field for field, short in keys.items()}
+
+    def __getattr__(self, attribute):
+        return getattr(self.collection, attribute)
+
+    def compact(self, document):
+        """
+        Full-name document -> stored form; pre-encoded raw BSON already under short keys is
+        passed through, raw BSON under full names is decoded and re-keyed
+        """
+        if isinstance(document, RawBSONDocument) and not any(key in self.keys for key in document):
+            return document
+        return rename_keys(document, self.keys)
+
+    def expand(self, document):
+        """
+        Stored form -> full-name document
+        """
+        return None if document is None else rename_keys(document, self.full_names)
+
+    def insert_one(self, document):
+        return self.collection.insert_one(self.compact(document))
+
+    def insert_many(self, documents, ordered=True):
+        return self.collection.insert_many([self.compact(document) for document in documents], ordered=ordered)
+
+    def find_one(self, query, projection=None):
+        return self.expand(self.collection.find_one(translate_query(query, self.keys),
+                                                    projection and rename_keys(projection, self.keys)))
+
+    def find(self, query=None, projection=None):
+        cursor = self.collection.find(translate_query(query, self.keys),
+                                      projection and rename_keys(projection, self.keys))
+        return (self.expand(document) for document in cursor)
+
+    def update_one(self, query, update, upsert=False):
+        return self.collection.update_one(translate_query(query, self.keys), translate_update(update, self.keys),
+                                          upsert=upsert)
+
+    def delete_one(self, query):
+        return self.collection.delete_one(translate_query(query, self.keys))
+
+    def delete_many(self, query):
+        return self.collection.delete_many(translate_query(query, self.keys))
+
+    def count_documents(self, query):
+        return self.collection.count_documents(translate_query(query, self.keys))
+
+    def bulk_write(self, requests, ordered=True):
+        return self.collection.bulk_write([translate_request(request, self.keys) for request in requests],
+                                          ordered=ordered)
+
+    def aggregate(self, pipeline, **kwargs):
+        """
+        Runs pipeline with its field paths translated; stored fields in the results are
+        mapped back, computed output names are returned as they are
+        """
+        cursor = self.collection.aggregate(translate_pipeline(pipeline, self.keys), **kwargs)
+        computed = computed_fields(pipeline)
+        if computed is None:
+            return iter(cursor)
+        return ({key if key in computed else self.full_names.get(key, key): value for key, value in document.items()}
+                for document in cursor)
+
+    def create_index(self, keys, **kwargs):
+        """
+        create_index on the short field names
+        """
+        if "partialFilterExpression" in kwargs:
+            kwargs["partialFilterExpression"] = translate_query(kwargs["partialFilterExpression"], self.keys)
+        return self.collection.create_index(translate_index_keys(keys, self.keys), **kwargs)
+
+    def with_options(self, **kwargs):
+        return CompactCollection(self.collection.with_options(**kwargs), self.keys)
+
+
+def stored_keys(collection):
+    """
+    Compact key map of the documents collection stores ({} for full names), looking through
+    wrappers (their .collection) and partitioned collections (whose partitions must agree)
+    """
+    if isinstance(collection, CompactCollection):
+        return collection.keys
+    # vars(): a pymongo Collection answers any attribute with a sub-collection
+    attributes = vars(collection) if hasattr(collection, "__dict__") else {}
+    if "partitions" in attributes:
+        key_maps = [stored_keys(partition) for partition in attributes["partitions"]]
+        if any(key_map != key_maps[0] for key_map in key_maps):
+            raise ValueError("Partitions store different schemas")
+        return key_maps[0] if key_maps else {}
+    if "collection" in attributes:
+        return stored_keys(attributes["collection"])
+    return {}
+
+
+def raw_keys(collection, fields):
+    """
+    Pre-encoded BSON string element headers for fields, short if collection stores the compact schema
+    """
+    keys = stored_keys(collection)
+    return tuple(b"\x02" + keys.get(field, field).encode("utf-8") + b"\x00" for field in fields)
+
+
+def migrate(collection, keys, to_compact=True, batch_size=MIGRATION_BATCH_SIZE, indexes=()):
+    """
+    Rewrites every document of a raw collection to the compact schema (or back, with
+    to_compact=False) using batched ReplaceOne writes, then creates indexes (lists of
+    (full field name, direction)) on the new field names.
+    Documents already in the target schema are left alone. Returns the number rewritten.
+    """
+    mapping = keys if to_compact else {short: field for field, short in keys.items()}
+    rewritten = 0
+    batch = []
+    for document in collection.find({}):
+        if any(key in mapping for key in document):
+            batch.append(ReplaceOne({"_id": document["_id"]}, rename_keys(document, mapping)))
+        if len(batch) >= batch_size:
+            collection.bulk_write(batch, ordered=False)
+            rewritten += len(batch)
+            batch = []
+    if batch:
+        collection.bulk_write(batch, ordered=False)
+        rewritten += len(batch)
+
+    target = CompactCollection(collection, keys) if to_compact else collection
+    for index_keys in indexes:
+        target.create_index(index_keys)
+    return rewritten
+
+
+if __name__ == "__main__":
+    import main  # pylint: disable = C0415
+    connection_string = next((arg for arg in sys.argv[1:] if not arg.startswith("--")),
+                             "mongodb://localhost:27017/")
+    client = main.get_mongo_client(connection_string)
+    for table_name, table_keys in TABLE_KEYS.items():
+        count = migrate(client[main.DATABASE][table_name], table_keys, "--expand" not in sys.argv,
+                        indexes=COMPACT_INDEXES[table_name] if "--expand" not in sys.argv else ())
+        print(f"{table_name}: rewrote {count} documents")
+    client.close()
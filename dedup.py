@@ -0,0 +1,127 @@
+"""
+Streaming in-file deduplication in front of the loaders, so repeated
+USER_ID / STATUS_ID values never reach the server
+"""
+
+import csv
+import os
+import sqlite3
+import tempfile
+
+FIRST_WINS = "first"
+LAST_WINS = "last"
+# Keys held in memory before the key store spills to a temporary SQLite file
+DEFAULT_MAX_KEYS = 1_000_000
+
+
+class KeyStore:
+    """
+    Map of key -> line number that spills to disk past max_keys
+    """
+
+    def __init__(self, max_keys=DEFAULT_MAX_KEYS):
+        self.max_keys = max_keys
+        self.keys = {}
+        self.connection = None
+        self.path = None
+
+    def spill(self):
+        """
+        Moves the in-memory keys to a temporary SQLite file
+        """
+        handle, self.path = tempfile.mkstemp(suffix=".sqlite3")
+        os.close(handle)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute("PRAGMA journal_mode = OFF")
+        self.connection.execute("PRAGMA synchronous = OFF")
+        self.connection.execute("CREATE TABLE keys (key TEXT PRIMARY KEY, line INTEGER)")
+        self.connection.executemany("INSERT INTO keys VALUES (?, ?)", self.keys.items())
+        self.keys = None
+
+    def get(self, key):
+        """
+        Line number recorded for key, or None
+        """
+        if self.connection is None:
+            return self.keys.get(key)
+        row = self.connection.execute("SELECT line FROM keys WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, line):
+        """
+        Records line number for key
+        """
+        if self.connection is None:
+            self.keys[key] = line
+            if len(self.keys) > self.max_keys:
+                self.spill()
+        else:
+            self.connection.execute("INSERT OR REPLACE INTO keys VALUES (?, ?)", (key, line))
+
+    def close(self):
+        """
+        Removes the spill file, if any
+        """
+        if self.connection is not None:
+            self.connection.close()
+            os.remove(self.path)
+            self.connection = None
+
+
+def numbered_rows(filename):
+    """
+    Yields (line_number, row dict) from a CSV file
+    """
+    with open(filename, encoding="utf-8", newline="") as csvfile:
+        reader = csv.DictReader(csvfile)
+        for row in reader:
+            yield reader.line_num, row
+
+
+def read_csv_deduplicated(filename, key_column, policy=FIRST_WINS, duplicates=None, max_keys=DEFAULT_MAX_KEYS):
+    """
+    Yields CSV row dicts with at most one row per key_column value.
+    See deduplicate for the policies and the duplicates report.
+    """
+    return deduplicate(lambda: numbered_rows(filename), key_column, policy, duplicates, max_keys)
+
+
+def deduplicate(rows_factory, key_column, policy=FIRST_WINS, duplicates=None, max_keys=DEFAULT_MAX_KEYS):
+    """
+    Yields row dicts with at most one row per key_column value.
+    rows_factory() returns an iterable of (line_number, row); LAST_WINS calls it twice,
+    once to find each key's last line, FIRST_WINS streams in a single pass.
+    Every dropped row is appended to duplicates as {"key", "line", "kept_line"}.
+    """
+    if policy not in (FIRST_WINS, LAST_WINS):
+        raise ValueError(f"Unknown dedup policy {policy!r}")
+    store = KeyStore(max_keys)
+    try:
+        if policy == LAST_WINS:
+            for line, row in rows_factory():
+                store.set(row[key_column], line)
+
+        for line, row in rows_factory():
+            key = row[key_column]
+            kept_line = store.get(key)
+            if policy == FIRST_WINS:
+                if kept_line is None:
+                    store.set(key, line)
+                    yield row
+                    continue
+            elif kept_line == line:
+                yield row
+                continue
+            if duplicates is not None:
+                duplicates.append({"key": key, "line": line, "kept_line": kept_line})
+    finally:
+        store.close()
+
+
+def report_duplicates(duplicates, key_column):
+    """
+    Prints the duplicate rows that were dropped
+    """
+    for duplicate in duplicates:
+        print(f"Duplicate {key_column} {duplicate['key']} on line {duplicate['line']} "
+              f"(kept line {duplicate['kept_line']})")
@@ -0,0 +1,163 @@
+"""
+Delta sync of nightly CSV snapshots: only new, changed and deleted IDs are sent to the database
+"""
+
+import csv
+import hashlib
+import sqlite3
+
+import pymongo
+from pymongo import DeleteOne, ReplaceOne
+
+USER_SPEC = {
+    "name": "users",
+    "key": "USER_ID",
+    "fields": {"EMAIL": "user_email", "NAME": "user_name", "LASTNAME": "user_last_name"},
+    # Every column must be non-empty, as in load_users
+    "required": True,
+}
+STATUS_SPEC = {
+    "name": "statuses",
+    "key": "STATUS_ID",
+    "fields": {"USER_ID": "user_id", "STATUS_TEXT": "status_text"},
+    "required": False,
+}
+# Bytes kept per row hash; 8 bytes keeps the store compact with a negligible collision rate
+FINGERPRINT_SIZE = 8
+FIELD_SEPARATOR = "\x1f"
+
+
+def complete_row(row, spec):
+    """
+    True if row has an ID and every field (a short CSV row leaves them None); with the
+    spec's required flag the fields must also be non-empty
+    """
+    values = [row.get(column) for column in spec["fields"]]
+    if spec["required"]:
+        return bool(row.get(spec["key"])) and all(values)
+    return bool(row.get(spec["key"])) and all(value is not None for value in values)
+
+
+def row_fingerprint(row, spec):
+    """
+    Short hash of the fields that end up in the document
+    """
+    text = FIELD_SEPARATOR.join(row[column] for column in spec["fields"])
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=FINGERPRINT_SIZE).digest()
+
+
+def to_document(row, spec):
+    """
+    Maps a CSV row to the stored document
+    """
+    document = {"_id": row[spec["key"]]}
+    for column, field in spec["fields"].items():
+        document[field] = row[column]
+    return document
+
+
+class FingerprintStore:
+    """
+    SQLite file of id -> row hash from the last successful sync, one table per kind
+    """
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        for spec in (USER_SPEC, STATUS_SPEC):
+            self.connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {spec['name']} (id TEXT PRIMARY KEY, hash BLOB NOT NULL) WITHOUT ROWID")
+
+    def diff(self, spec, fingerprints, kept=()):
+        """
+        Compares (id, hash) pairs from the current snapshot with the stored ones.
+        IDs in kept (rows skipped as incomplete) are neither changed nor deleted.
+        Returns (new ids, changed ids, deleted ids, unchanged count).
+        """
+        table = spec["name"]
+        self.connection.execute("DROP TABLE IF EXISTS temp.snapshot")
+        self.connection.execute("CREATE TEMP TABLE snapshot (id TEXT PRIMARY KEY, hash BLOB NOT NULL) WITHOUT ROWID")
+        self.connection.executemany("INSERT OR REPLACE INTO temp.snapshot VALUES (?, ?)", fingerprints)
+        total = self.connection.execute("SELECT COUNT(*) FROM temp.snapshot").fetchone()[0]
+        # Kept IDs carry their stored hash into the snapshot, so they diff as unchanged
+        self.connection.executemany(f"INSERT OR IGNORE INTO temp.snapshot SELECT id, hash FROM {table} WHERE id = ?",
+                                    ((item_id,) for item_id in kept if item_id))
+        new = {row[0] for row in self.connection.execute(
+            f"SELECT s.id FROM temp.snapshot s LEFT JOIN {table} f ON f.id = s.id WHERE f.id IS NULL")}
+        changed = {row[0] for row in self.connection.execute(
+            f"SELECT s.id FROM temp.snapshot s JOIN {table} f ON f.id = s.id WHERE f.hash != s.hash")}
+        deleted = [row[0] for row in self.connection.execute(
+            f"SELECT f.id FROM {table} f LEFT JOIN temp.snapshot s ON s.id = f.id WHERE s.id IS NULL")]
+        return new, changed, deleted, total - len(new) - len(changed)
+
+    def commit_snapshot(self, spec):
+        """
+        Makes the current snapshot the baseline for the next sync
+        """
+        table = spec["name"]
+        with self.connection:
+            self.connection.execute(f"DELETE FROM {table}")
+            self.connection.execute(f"INSERT INTO {table} SELECT id, hash FROM temp.snapshot")
+            self.connection.execute("DROP TABLE temp.snapshot")
+
+    def close(self):
+        """
+        Closes the store
+        """
+        self.connection.close()
+
+
+def read_rows(filename):
+    """
+    Yields CSV row dicts
+    """
+    with open(filename, encoding="utf-8", newline="") as csvfile:
+        yield from csv.DictReader(csvfile)
+
+
+def sync_snapshot(filename, collection, store_path, spec, changes=None):
+    """
+    Brings collection in line with a full CSV snapshot.
+    Pass one hashes every row and diffs against the store inside SQLite; pass two builds
+    documents only for new and changed IDs, which go out with the deletes in one bulk_write.
+    Incomplete rows (see complete_row) are skipped in both passes and counted as "skipped";
+    a skipped row's ID keeps its stored document rather than being deleted.
+    If changes is a dict, a successful sync fills it with the "upserted" documents and "deleted" IDs.
+    Returns a report dict, with "success" False if the write failed (the store is then left as is).
+    """
+    store = FingerprintStore(store_path)
+    try:
+        skipped = []
+
+        def fingerprints():
+            for row in read_rows(filename):
+                if complete_row(row, spec):
+                    yield row[spec["key"]], row_fingerprint(row, spec)
+                else:
+                    skipped.append(row.get(spec["key"]))
+
+        # diff reads kept only after the fingerprints, so skipped is complete by then
+        new, changed, deleted, unchanged = store.diff(spec, fingerprints(), skipped)
+        upserts = new | changed
+        # Keyed by ID so a repeated ID in the snapshot is sent once (last row wins, as in the store)
+        documents = {row[spec["key"]]: to_document(row, spec)
+                     for row in read_rows(filename) if complete_row(row, spec) and row[spec["key"]] in upserts}
+        operations = [ReplaceOne({"_id": item_id}, document, upsert=True) for item_id, document in documents.items()]
+        operations += [DeleteOne({"_id": item_id}) for item_id in deleted]
+
+        report = {"new": len(new), "changed": len(changed), "deleted": len(deleted), "unchanged": unchanged,
+                  "skipped": len(skipped), "success": True}
+        if report["skipped"]:
+            print(f"Delta sync of {spec['name']}: skipped {report['skipped']} incomplete rows")
+        if operations:
+            try:
+                collection.bulk_write(operations, ordered=False)
+            except pymongo.errors.PyMongoError as error:
+                print(f"Delta sync of {spec['name']} failed: {error}")
+                report["success"] = False
+                return report
+        store.commit_snapshot(spec)
+        if changes is not None:
+            changes.update(upserted=list(documents.values()), deleted=deleted)
+        return report
+    finally:
+        store.close()
@@ -0,0 +1,241 @@
+"""
+Lookup of users by email, backed by a unique index on user_email (or on a lowercased
+copy of it) with a bounded LRU cache in front.
+
+Duplicate emails are rejected by the index itself, so add_user / update_user need no
+extra query: the insert or update fails with DuplicateKeyError.
+
+With the normalized index every write must carry the lowercased copy; add_user and
+update_user add it through EmailLookup.prepare, bulk loaders and delta sync by writing
+through a NormalizedEmailCollection (init_user_collection(..., normalized_email=True)).
+"""
+
+import threading
+import time
+from collections import Counter, OrderedDict
+
+import pymongo
+from bson.raw_bson import RawBSONDocument
+from pymongo import InsertOne, ReplaceOne, UpdateOne
+
+import cache_coherence
+import read_routing
+from backends import CollectionBackend
+
+EMAIL_FIELD = "user_email"
+NORMALIZED_FIELD = "user_email_normalized"
+DEFAULT_CACHE_SIZE = 10_000
+BACKFILL_BATCH_SIZE = 1000
+
+
+def normalize_email(email):
+    """
+    Canonical form used by the normalized index: surrounding spaces dropped, lowercased
+    """
+    return email.strip().lower()
+
+
+def with_normalized(values):
+    """
+    Copy of a user document or $set values with the normalized email added, if it has an email
+    """
+    if isinstance(values, RawBSONDocument) or not isinstance(values.get(EMAIL_FIELD), str):
+        return values
+    return {**values, NORMALIZED_FIELD: normalize_email(values[EMAIL_FIELD])}
+
+
+def normalized_update(update):
+    """
+    Update document with the normalized email added to its $set
+    """
+    if "$set" not in update:
+        return update
+    return {**update, "$set": with_normalized(update["$set"])}
+
+
+def normalized_request(request):
+    """
+    Rebuilds a bulk_write request so it writes the normalized email
+    """
+    # pymongo's request classes keep their arguments in _doc, _filter and _upsert
+    # pylint: disable = W0212
+    if isinstance(request, InsertOne):
+        return InsertOne(with_normalized(request._doc))
+    if isinstance(request, ReplaceOne):
+        return ReplaceOne(request._filter, with_normalized(request._doc), upsert=request._upsert)
+    if isinstance(request, UpdateOne):
+        return UpdateOne(request._filter, normalized_update(request._doc), upsert=request._upsert)
+    return request
+
+
+class NormalizedEmailCollection(CollectionBackend):
+    """
+    Adds the normalized email to every user written through it, so users from bulk
+    loads and delta syncs are found by a normalized EmailLookup too
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def __getattr__(self, attribute):
+        return getattr(self.collection, attribute)
+
+    def insert_one(self, document):
+        return self.collection.insert_one(with_normalized(document))
+
+    def insert_many(self, documents, ordered=True):
+        return self.collection.insert_many([with_normalized(document) for document in documents], ordered=ordered)
+
+    def find_one(self, query, projection=None):
+        return self.collection.find_one(query, projection)
+
+    def find(self, query=None, projection=None):
+        return self.collection.find(query or {}, projection)
+
+    def update_one(self, query, update, upsert=False):
+        return self.collection.update_one(query, normalized_update(update), upsert=upsert)
+
+    def delete_one(self, query):
+        return self.collection.delete_one(query)
+
+    def delete_many(self, query):
+        return self.collection.delete_many(query)
+
+    def count_documents(self, query):
+        return self.collection.count_documents(query)
+
+    def bulk_write(self, requests, ordered=True):
+        return self.collection.bulk_write([normalized_request(request) for request in requests], ordered=ordered)
+
+    def aggregate(self, pipeline, **kwargs):
+        return self.collection.aggregate(pipeline, **kwargs)
+
+    def with_options(self, **kwargs):
+        return NormalizedEmailCollection(self.collection.with_options(**kwargs))
+
+
+class EmailLookup:
+    """
+    search-by-email with an LRU cache of found users, keyed by (normalized) email.
+    Only hits are cached; add_user / update_user / delete_user call forget() so a
+    cached user never outlives a change made through this process. follow() extends
+    that to changes made by other processes.
+    """
+
+    def __init__(self, user_collection, normalized=False, cache_size=DEFAULT_CACHE_SIZE):
+        self.user_collection = user_collection
+        self.normalized = normalized
+        self.field = NORMALIZED_FIELD if normalized else EMAIL_FIELD
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.cache_keys = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # Seconds after which a cached user is no longer trusted; None trusts it until evicted
+        self.max_age = lambda: None
+
+    def key(self, email):
+        """
+        Value stored in the indexed field for email
+        """
+        return normalize_email(email) if self.normalized else email
+
+    def ensure_index(self):
+        """
+        Creates the unique index (backfilling the normalized field first if needed).
+        Returns False, leaving lookups unindexed, if existing users share an email.
+        """
+        if self.normalized:
+            self.backfill()
+        duplicates = self.duplicates()
+        if duplicates:
+            examples = ", ".join(f"{email!r} x{count}" for email, count in list(duplicates.items())[:5])
+            print(f"Cannot create unique index on {self.field}: {len(duplicates)} emails are shared by "
+                  f"several users, e.g. {examples}")
+            return False
+        options = {"partialFilterExpression": {NORMALIZED_FIELD: {"$exists": True}}} if self.normalized else {}
+        try:
+            self.user_collection.create_index([(self.field, pymongo.ASCENDING)], unique=True,
+                                              name=f"{self.field}_unique", **options)
+            return True
+        except pymongo.errors.DuplicateKeyError as error:
+            print(f"Cannot create unique index on {self.field}, existing users share an email: {error}")
+            return False
+
+    def duplicates(self):
+        """
+        {email: user count} for the (normalized) emails shared by more than one user
+        """
+        counts = Counter(user[self.field] for user in self.user_collection.find({}, {self.field: 1})
+                         if user.get(self.field) is not None)
+        return {email: count for email, count in counts.items() if count > 1}
+
+    def backfill(self):
+        """
+        Sets the normalized field on users loaded without it
+        """
+        batch = []
+        for user in self.user_collection.find({}):
+            if NORMALIZED_FIELD not in user and user.get(EMAIL_FIELD):
+                batch.append(ReplaceOne({"_id": user["_id"]}, self.prepare(user)))
+            if len(batch) >= BACKFILL_BATCH_SIZE:
+                self.user_collection.bulk_write(batch, ordered=False)
+                batch = []
+        if batch:
+            self.user_collection.bulk_write(batch, ordered=False)
+
+    def prepare(self, values):
+        """
+        Adds the normalized email to a user document or $set values, when normalizing
+        """
+        return with_normalized(values) if self.normalized else values
+
+    def find(self, email):
+        """
+        The user with this email, or None
+        """
+        key = self.key(email)
+        max_age = self.max_age()
+        with self.lock:
+            user, cached_at = self.cache.get(key, (None, 0.0))
+            if user is not None and (max_age is None or time.monotonic() - cached_at <= max_age):
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return user
+            self.misses += 1
+        user = read_routing.read_view(self.user_collection, "search").find_one({self.field: key})
+        if user is not None:
+            with self.lock:
+                self.cache[key] = (user, time.monotonic())
+                self.cache_keys[user["_id"]] = key
+                if len(self.cache) > self.cache_size:
+                    _key, (evicted, _cached_at) = self.cache.popitem(last=False)
+                    self.cache_keys.pop(evicted["_id"], None)
+        return user
+
+    def forget(self, user_id):
+        """
+        Drops the cached entry of a changed or deleted user
+        """
+        with self.lock:
+            key = self.cache_keys.pop(user_id, None)
+            if key is not None:
+                self.cache.pop(key, None)
+
+    def clear(self):
+        """
+        Empties the cache
+        """
+        with self.lock:
+            self.cache.clear()
+            self.cache_keys.clear()
+
+    def follow(self, invalidator):
+        """
+        Keeps the cache coherent with changes from any process through a CacheInvalidator,
+        falling back to its TTL while the change stream is down
+        """
+        invalidator.subscribe(cache_coherence.USER_TABLE, lambda user_id, _operation: self.forget(user_id),
+                              self.clear)
+        self.max_age = invalidator.max_age
@@ -0,0 +1,184 @@
+"""
+Parallel streaming export of UserAccounts / StatusUpdates to CSV or Parquet.
+
+The _id space is split into ranges from a sample of IDs; each range is scanned by
+its own cursor with a projection and a large batch size, and batches are appended
+to one output file as they arrive, so the collection is never held in memory.
+Range bounds are string _ids; as $gte / $lt only match values of the bound's type,
+one more scan picks up every _id that is not a string.
+"""
+
+import csv
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_PARTS = 4
+EXPORT_BATCH_SIZE = 5000
+# Sampled IDs per range; more samples give more even ranges
+SAMPLES_PER_PART = 50
+# Range of the _ids that no string range covers
+NON_STRING_IDS = ("non-string", None)
+
+
+def spec_columns(spec):
+    """
+    CSV columns of a spec, in the order the loaders expect
+    """
+    return [spec["key"], *spec["fields"]]
+
+
+def sample_ids(collection, size):
+    """
+    Random _id sample, server-side where the backend supports $sample
+    """
+    try:
+        cursor = collection.aggregate([{"$sample": {"size": size}}, {"$project": {"_id": 1}}])
+        return [document["_id"] for document in cursor]
+    except (AttributeError, NotImplementedError):
+        ids = [document["_id"] for document in collection.find({}, {"_id": 1})]
+        return random.sample(ids, min(size, len(ids)))
+
+
+def split_ranges(collection, parts):
+    """
+    Splits the _id space into up to parts (low, high) ranges; None is an open end.
+    Boundaries come from the sampled string _ids; when there are any, NON_STRING_IDS
+    is added for the rest. Without string _ids the whole collection is one range.
+    """
+    if parts <= 1:
+        return [(None, None)]
+    ids = sorted({item_id for item_id in sample_ids(collection, parts * SAMPLES_PER_PART)
+                  if isinstance(item_id, str)})
+    boundaries = sorted({ids[len(ids) * number // parts] for number in range(1, parts)}) if ids else []
+    if not boundaries:
+        return [(None, None)]
+    edges = [None, *boundaries, None]
+    return list(zip(edges, edges[1:])) + [NON_STRING_IDS]
+
+
+def range_query(low, high):
+    """
+    Query for low <= _id < high between string bounds, or for NON_STRING_IDS
+    """
+    if (low, high) == NON_STRING_IDS:
+        return {"_id": {"$not": {"$type": "string"}}}
+    bounds = {}
+    if low is not None:
+        bounds["$gte"] = low
+    if high is not None:
+        bounds["$lt"] = high
+    return {"_id": bounds} if bounds else {}
+
+
+def scan_range(collection, low, high, spec, batch_size):
+    """
+    Yields lists of CSV-ordered rows for the documents in one _id range
+    """
+    projection = {field: 1 for field in spec["fields"].values()}
+    cursor = collection.find(range_query(low, high), projection)
+    if hasattr(cursor, "batch_size"):
+        cursor = cursor.batch_size(batch_size)
+    fields = list(spec["fields"].values())
+    rows = []
+    for document in cursor:
+        rows.append([document["_id"], *(document.get(field, "") for field in fields)])
+        if len(rows) >= batch_size:
+            yield rows
+            rows = []
+    if rows:
+        yield rows
+
+
+class CsvSink:
+    """
+    Appends row batches to a CSV file with the loader's header
+    """
+
+    def __init__(self, filename, columns):
+        self.file = open(filename, "w", newline="", encoding="utf-8")  # pylint: disable = R1732
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(columns)
+
+    def write(self, rows):
+        """
+        Writes one batch
+        """
+        self.writer.writerows(rows)
+
+    def close(self):
+        """
+        Flushes and closes the file
+        """
+        self.file.close()
+
+
+class ParquetSink:
+    """
+    Appends row batches to a Parquet file, one row group per batch (needs pyarrow)
+    """
+
+    def __init__(self, filename, columns):
+        import pyarrow  # pylint: disable = C0415
+        import pyarrow.parquet  # pylint: disable = C0415
+        self.pyarrow = pyarrow
+        self.columns = columns
+        self.schema = pyarrow.schema([(column, pyarrow.string()) for column in columns])
+        self.writer = pyarrow.parquet.ParquetWriter(filename, self.schema)
+
+    def write(self, rows):
+        """
+        Writes one batch as a row group
+        """
+        arrays = [self.pyarrow.array([row[index] for row in rows], self.pyarrow.string())
+                  for index in range(len(self.columns))]
+        self.writer.write_table(self.pyarrow.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        """
+        Writes the footer and closes the file
+        """
+        self.writer.close()
+
+
+SINKS = {"csv": CsvSink, "parquet": ParquetSink}
+
+
+def export_format(filename, file_format=None):
+    """
+    Output format: explicit, or from the file extension (CSV for any extension but .parquet).
+    Raises ValueError for an unknown explicit format.
+    """
+    if file_format is not None:
+        if file_format.lower() not in SINKS:
+            raise ValueError(f"Unknown export format {file_format!r}; expected one of {', '.join(SINKS)}")
+        return file_format.lower()
+    extension = filename.rsplit(".", 1)[-1].lower()
+    return extension if extension in SINKS else "csv"
+
+
+def export_collection(collection, filename, spec, file_format=None, parts=DEFAULT_PARTS,
+                      batch_size=EXPORT_BATCH_SIZE):
+    """
+    Streams every document of collection to filename, scanning parts _id ranges in parallel.
+    Rows are grouped by range, not sorted. Returns the number of rows written.
+    """
+    sink_class = SINKS[export_format(filename, file_format)]
+    ranges = split_ranges(collection, parts)
+    sink = sink_class(filename, spec_columns(spec))
+    lock = threading.Lock()
+
+    def export_range(bounds):
+        written = 0
+        for rows in scan_range(collection, *bounds, spec, batch_size):
+            with lock:
+                sink.write(rows)
+            written += len(rows)
+        return written
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+            return sum(executor.map(export_range, ranges))
+    finally:
+        sink.close()
+
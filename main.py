@@ -4,146 +4,844 @@ revised for assignment 7
 """
 
 import csv
-from concurrent.futures import ThreadPoolExecutor
+import os
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice, repeat
 
 import pandas as pd
-from multiprocessing import Process, cpu_count
+from multiprocessing import cpu_count
 import pymongo
+from bson.raw_bson import RawBSONDocument
+from pymongo.write_concern import WriteConcern
 
+import analytics
+import backends
+import batch_lookup
+import cache_coherence
+import columnar
+import compact_schema
+import dedup
+import delta_sync
+import email_index
+import export
+import partitioning
+from memory_budget import MemoryThrottle, plan_load
+import read_routing
+import staging
+import timeline as timeline_module
 import user_status
+import validation
+from profiling import profiled
 
 DATABASE = "databaseA07"
+SQLITE_SCHEME = "sqlite:///"
+
+# Unacknowledged writes used by the opt-in bulk ingest mode; a verification pass follows.
+BULK_WRITE_CONCERN = WriteConcern(w=0)
+
+# Pre-encoded BSON element headers (type 0x02 = UTF-8 string) for status documents
+STATUS_RAW_KEYS = (b"\x02_id\x00", b"\x02user_id\x00", b"\x02status_text\x00")
+STATUS_COLUMNS = ("STATUS_ID", "USER_ID", "STATUS_TEXT")
+USER_COLUMNS = ("USER_ID", "EMAIL", "NAME", "LASTNAME")
+PACK_INT32 = struct.Struct("<i").pack
 
 
 def get_mongo_client(connection_string="mongodb://localhost:27017/"):
     """
     Creates a MongoDB client instance
+    A "sqlite:///<directory>" connection string selects the SQLite backend instead.
     """
+    if connection_string.startswith(SQLITE_SCHEME):
+        return backends.SQLiteClient(connection_string[len(SQLITE_SCHEME):] or ".")
     return pymongo.MongoClient(connection_string)
 
 
-def init_user_collection(mongo_client, database_name=DATABASE, table_name="UserAccounts"):
+def connect_worker(host, port, connection_string=None):
+    """
+    Opens the separate connection a worker process needs
+    """
+    if connection_string:
+        return get_mongo_client(connection_string)
+    return pymongo.MongoClient(host, port)
+
+
+def init_user_collection(mongo_client, database_name=DATABASE, table_name="UserAccounts", compact=False,
+                         normalized_email=False):
     """
     Creates and returns a MongoDB collection for user data.
+    With compact, documents are stored under short keys and read back with full names.
+    normalized_email adds the lowercased email every write needs for a normalized EmailLookup.
     """
     db = mongo_client[database_name]  # Access the specified database by name
     collection = db[table_name]
+    if compact:
+        collection = compact_schema.CompactCollection(collection, compact_schema.USER_KEYS)
+    if normalized_email:
+        collection = email_index.NormalizedEmailCollection(collection)
     return collection
 
 
-def init_status_collection(mongo_client, database_name=DATABASE, table_name="StatusUpdates"):
+def init_status_collection(mongo_client, database_name=DATABASE, table_name="StatusUpdates", compact=False):
     """
     Creates and returns a new instance of UserStatusCollection.
+    With compact, documents are stored under short keys and read back with full names.
     """
     db = mongo_client[database_name]  # Access the specified database by name
-    status_collection = user_status.UserStatusCollection(db[table_name])
+    collection = db[table_name]
+    if compact:
+        collection = compact_schema.CompactCollection(collection, compact_schema.STATUS_KEYS)
+    status_collection = user_status.UserStatusCollection(collection)
     return status_collection
 
 
-def load_users(filename, user_collection, batch_size=32):
+def init_timeline(mongo_client, database_name=DATABASE, size=timeline_module.DEFAULT_TIMELINE_SIZE):
+    """
+    Creates the StatusTimeline kept up to date by the status functions when passed to them
+    """
+    return timeline_module.StatusTimeline(mongo_client[database_name][timeline_module.TIMELINE_TABLE], size)
+
+
+def init_analytics(mongo_client, database_name=DATABASE, compact=False):
+    """
+    Returns (analytics, user_collection, status_collection). Writes made through the returned
+    collections invalidate the analytics results cached for them.
+    compact selects the compact schema for the collections and the pipelines.
+    """
+    db = mongo_client[database_name]
+    report = analytics.Analytics(db, compact=compact)
+    user_collection = db[analytics.USER_TABLE]
+    if compact:
+        user_collection = compact_schema.CompactCollection(user_collection, compact_schema.USER_KEYS)
+    user_collection = report.track(user_collection, analytics.USER_TABLE)
+    status_collection = user_status.UserStatusCollection(
+        report.track(db[analytics.STATUS_TABLE], analytics.STATUS_TABLE), compact)
+    return report, user_collection, status_collection
+
+
+def init_cache_invalidator(mongo_client, database_name=DATABASE, ttl=cache_coherence.DEFAULT_TTL, start=True):
+    """
+    Returns a CacheInvalidator following the UserAccounts and StatusUpdates change streams.
+    Caches opt in with their follow() method (EmailLookup, UserDirectory, Analytics).
+    Needs a replica set; elsewhere the caches run on the TTL alone.
+    """
+    db = mongo_client[database_name]
+    invalidator = cache_coherence.CacheInvalidator(
+        {name: cache_coherence.change_stream_source(db[name])
+         for name in (cache_coherence.USER_TABLE, cache_coherence.STATUS_TABLE)}, ttl)
+    return invalidator.start() if start else invalidator
+
+
+def init_email_lookup(user_collection, normalized=False, cache_size=email_index.DEFAULT_CACHE_SIZE):
+    """
+    Creates the unique email index and returns an EmailLookup for search_user_by_email,
+    or None if the index cannot be built because existing users share an email.
+    normalized indexes a lowercased copy of the email, so lookups and duplicates ignore case;
+    bulk writes then need a collection from init_user_collection(..., normalized_email=True).
+    """
+    email_lookup = email_index.EmailLookup(user_collection, normalized, cache_size)
+    if not email_lookup.ensure_index():
+        return None
+    return email_lookup
+
+
+def init_read_routed_collections(mongo_client, routes=None, database_name=DATABASE):
+    """
+    Returns (user_collection, status_collection) whose reads follow per-operation read routes
+    (see read_routing.DEFAULT_READ_ROUTES) while writes stay on the primary.
+    Both share one causally consistent session, so the caller reads its own writes;
+    like any session it must not be used from several threads at once.
+    """
+    session = mongo_client.start_session(causal_consistency=True)
+    db = mongo_client[database_name]
+    user_collection = read_routing.ReadRoutedCollection(db["UserAccounts"], session, routes)
+    status_collection = user_status.UserStatusCollection(
+        read_routing.ReadRoutedCollection(db["StatusUpdates"], session, routes))
+    return user_collection, status_collection
+
+
+def init_partitioned_status_collection(partitions, table_name="StatusUpdates", compact=False):
     """
-    Opens a CSV file with user data and adds it to an existing MongoDB collection
+    Creates a UserStatusCollection spread over several databases by a hash of user_id.
+    partitions is a list of connection strings or (connection_string, database_name) pairs.
+    With compact, each partition stores the compact schema.
     """
+    collections = []
+    for partition in partitions:
+        connection_string, database_name = (partition, DATABASE) if isinstance(partition, str) else partition
+        collection = get_mongo_client(connection_string)[database_name][table_name]
+        if compact:
+            collection = compact_schema.CompactCollection(collection, compact_schema.STATUS_KEYS)
+        collections.append(collection)
+    return user_status.UserStatusCollection(partitioning.PartitionedCollection(collections))
+
+
+@profiled(merge=True)
+def load_users(filename, user_collection, batch_size=32, bulk_ingest=False, dedupe=None, validate=False,
+               reject_file=None):
+    """
+    Opens a CSV or Parquet file with user data and adds it to an existing MongoDB collection
+    With bulk_ingest, batches are written unacknowledged and then verified against the file.
+    dedupe ("first" or "last") drops repeated USER_IDs in the file before they reach the server.
+    validate checks whole pandas chunks (fields, email and ID shape, swapped columns);
+    rejected rows are written to reject_file if given. dedupe and validate are CSV only.
+    """
+    parquet = columnar.is_parquet(filename)
+    if parquet and (dedupe or validate):
+        raise ValueError("dedupe and validate are only available for CSV input")
     try:
-        with open(filename, encoding="utf-8", newline="") as csvfile:
-            reader = csv.DictReader(csvfile)
-            user_data = []
-            for row in reader:
-                if all(key in row and row[key] for key in ["USER_ID", "EMAIL", "NAME", "LASTNAME"]):
-                    user_data.append({
-                        "_id": row["USER_ID"],  # Use USER_ID as the primary key
-                        "user_email": row["EMAIL"],
-                        "user_name": row["NAME"],
-                        "user_last_name": row["LASTNAME"]
-                    })
-
-            # Process data in batches
+        if parquet:
+            user_data = [user for group in columnar.read_documents(filename, delta_sync.USER_SPEC, required=True)
+                         for user in group]
+        else:
+            user_data = read_user_csv(filename, dedupe, validate, reject_file)
+
+        if bulk_ingest:
+            fast_collection = user_collection.with_options(write_concern=BULK_WRITE_CONCERN)
             for i in range(0, len(user_data), batch_size):
-                batch = user_data[i:i + batch_size]
-                try:
-                    user_collection.insert_many(batch)
-                except pymongo.errors.DuplicateKeyError:
-                    print('Mock duplicate key error')
-                    return False
-
-            return True
+                fast_collection.insert_many(user_data[i:i + batch_size], ordered=False)
+            report = verify_bulk_load(user_collection, user_data)
+            if report["duplicates"]:
+                print(f"Duplicate key error: {report['duplicates']} repeated USER_IDs in {filename}")
+                return False
+            return report["errors"] == 0
+
+        # Process data in batches
+        for i in range(0, len(user_data), batch_size):
+            batch = user_data[i:i + batch_size]
+            try:
+                user_collection.insert_many(batch)
+            except pymongo.errors.DuplicateKeyError:
+                print('Mock duplicate key error')
+                return False
+            except pymongo.errors.BulkWriteError as error:
+                # e.g. a duplicate email under the unique email index
+                print(f"Error loading users: {len(error.details.get('writeErrors', []))} rows rejected")
+                return False
+
+        return True
     except (FileNotFoundError, KeyError) as e:
         print(f"Error loading users: {e}")
         return False
 
 
-def load_users_multiprocess(filename, host="localhost", port=27017, database_name=DATABASE, batch_size=1000):
+def read_user_csv(filename, dedupe=None, validate=False, reject_file=None):
+    """
+    Reads the user documents of a CSV file, skipping rows with a missing field
+    """
+    with open(filename, encoding="utf-8", newline="") as csvfile:
+        duplicates = []
+        rejects = {}
+        reader = source_rows(filename, csv.DictReader(csvfile), "USER_ID", validation.USER_SCHEMA,
+                             validate, dedupe, duplicates, rejects, USER_COLUMNS)
+        user_data = []
+        for row in reader:
+            if complete_row(row, USER_COLUMNS):
+                user_data.append({
+                    "_id": row["USER_ID"],  # Use USER_ID as the primary key
+                    "user_email": row["EMAIL"],
+                    "user_name": row["NAME"],
+                    "user_last_name": row["LASTNAME"]
+                })
+        dedup.report_duplicates(duplicates, "USER_ID")
+        report_rejects(rejects, reject_file)
+    return user_data
+
+
+def complete_row(row, columns):
+    """
+    True if row has a non-empty value for every column
+    """
+    return all(key in row and row[key] for key in columns)
+
+
+def source_rows(filename, reader, key_column, schema, validate, dedupe, duplicates, rejects, required=()):
+    """
+    Picks a loader's row source: the plain csv reader, validated pandas chunks,
+    and the dedup pre-pass on top of either.
+    Rows missing a required column are dropped before dedup, so they never win over a valid duplicate.
+    """
+    if validate:
+        def rows_factory():
+            return validation.numbered_valid_rows(filename, schema, rejects)
+    else:
+        def rows_factory():
+            return ((line, row) for line, row in dedup.numbered_rows(filename) if complete_row(row, required))
+    if dedupe:
+        return dedup.deduplicate(rows_factory, key_column, dedupe, duplicates)
+    if validate:
+        return (row for _line, row in rows_factory())
+    return reader
+
+
+def report_rejects(rejects, reject_file):
+    """
+    Reports rows rejected by validation and writes them to reject_file
+    """
+    if not rejects:
+        return
+    print(f"Rejected {len(rejects)} invalid rows")
+    if reject_file:
+        validation.write_rejects(rejects, reject_file)
+
+
+def verify_bulk_load(collection, documents, chunk_size=1000):
+    """
+    Verification pass after an unacknowledged bulk load.
+    Compares the source _id set with what the collection holds and
+    re-sends only the missing documents with the collection's own write concern.
+    Repeated _ids in documents, which unacknowledged writes drop silently, are counted as duplicates.
+    """
+    report = {"checked": 0, "missing": 0, "resent": 0, "errors": 0, "duplicates": 0}
+    seen = set()
+    for i in range(0, len(documents), chunk_size):
+        chunk = documents[i:i + chunk_size]
+        ids = [doc["_id"] for doc in chunk]
+        for item_id in ids:
+            if item_id in seen:
+                report["duplicates"] += 1
+            seen.add(item_id)
+        present = {doc["_id"] for doc in collection.find({"_id": {"$in": ids}}, {"_id": 1})}
+        missing = [doc for doc in chunk if doc["_id"] not in present]
+        report["checked"] += len(chunk)
+        report["missing"] += len(missing)
+        if missing:
+            inserted, _duplicates, errors = insert_batch_counted(collection, missing)
+            report["resent"] += inserted
+            report["errors"] += errors
+    return report
+
+
+@profiled(merge=True)
+def load_users_multiprocess(filename, host="localhost", port=27017, database_name=DATABASE, batch_size=1000,
+                            return_report=False, bulk_ingest=False, connection_string=None, validate=False,
+                            reject_file=None, memory_budget=None, dedupe=None, normalized_email=False,
+                            compact=False):
     """
     Loads the user file with multiprocessing.
+    A Parquet file is spread across the workers one row group per task.
+    Each worker returns a result dict which is merged into one load report.
+    Returns the overall success flag, or the full report if return_report is True.
+    With bulk_ingest, workers write unacknowledged and verify their chunk afterwards.
+    connection_string, when given, overrides host/port (e.g. a sqlite:/// backend).
+    validate checks each chunk in the parent before it is handed to a worker.
+    memory_budget (bytes or e.g. "512M") picks chunk size, worker count and in-flight chunks
+    from the measured per-row cost and holds back new chunks while RSS is near the budget.
+    dedupe ("first" or "last") drops repeated USER_IDs in the file before the chunks are built.
+    compact and normalized_email select the workers' collection (see init_user_collection).
     """
     processors = cpu_count()
+    rejects = {}
+    duplicates = []
+    worker_args = (host, port, database_name, bulk_ingest, connection_string,
+                   {"compact": compact, "normalized_email": normalized_email})
+    if columnar.is_parquet(filename):
+        if validate or dedupe or memory_budget is not None:
+            raise ValueError("validate, dedupe and memory_budget are only available for CSV input")
+        start_time = time.perf_counter()
+        # Workers read their own row groups, so no row data crosses the process boundary
+        with ProcessPoolExecutor(max_workers=processors) as executor:
+            futures = [executor.submit(load_users_parquet_worker, filename, [index], *worker_args)
+                       for index in range(columnar.row_group_count(filename))]
+            results = [future.result() for future in futures]
+        report = merge_load_results(results, time.perf_counter() - start_time)
+        report["rejected"] = 0
+        return report if return_report else report["success"]
+
+    if memory_budget is not None:
+        plan = plan_load(filename, memory_budget)
+        batch_size, processors = plan["chunk_size"], plan["workers"]
 
     # Read the file in chunks to minimize memory usage and avoid reading the entire file at once.
-    data_chunks = pd.read_csv(filename, chunksize=batch_size)
+    if dedupe:
+        rows = source_rows(filename, None, "USER_ID", validation.USER_SCHEMA, validate, dedupe, duplicates,
+                           rejects, USER_COLUMNS)
+        data_chunks = dataframe_chunks(rows, batch_size)
+    elif validate:
+        data_chunks = validated_chunks(filename, batch_size, rejects)
+    else:
+        data_chunks = pd.read_csv(filename, chunksize=batch_size)
 
-    processes = []
-    for chunk in data_chunks:
-        process = Process(target=load_users_multiprocess_worker, args=(chunk, host, port, database_name,))
-        process.start()
-        processes.append(process)
+    start_time = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=processors) as executor:
+        if memory_budget is not None:
+            results = run_budgeted(executor, load_users_multiprocess_worker, data_chunks, worker_args,
+                                   plan["in_flight"], MemoryThrottle(memory_budget))
+        else:
+            futures = [executor.submit(load_users_multiprocess_worker, chunk, *worker_args) for chunk in data_chunks]
+            results = [future.result() for future in futures]
 
-    for process in processes:
-        process.join()
+    report = merge_load_results(results, time.perf_counter() - start_time)
+    report["rejected"] = len(rejects)
+    dedup.report_duplicates(duplicates, "USER_ID")
+    report_rejects(rejects, reject_file)
+    if return_report:
+        return report
+    return report["success"]
 
-    return True
 
+def run_budgeted(executor, function, chunks, args, in_flight, throttle):
+    """
+    Submits function(chunk, *args) for each chunk, keeping at most in_flight chunks
+    submitted at once and pausing while the throttle reports memory pressure.
+    Chunks are pulled lazily, so unread chunks cost no memory.
+    """
+    pending = []
+    done = []
+    for chunk in chunks:
+        pending = throttle.wait(pending, done)
+        while len(pending) >= in_flight:
+            done.append(pending.pop(0))
+            done[-1].result()
+        pending.append(executor.submit(function, chunk, *args))
+    return [future.result() for future in done + pending]
 
-def load_users_multiprocess_worker(data, host, port, database_name):
+
+def dataframe_chunks(rows, batch_size):
     """
-    Helper function for multiprocessing to load users.
+    Groups row dicts into DataFrames of batch_size rows for the loader workers
+    """
+    rows = iter(rows)
+    while batch := list(islice(rows, batch_size)):
+        yield pd.DataFrame(batch)
+
+
+def validated_chunks(filename, batch_size, rejects, schema=validation.USER_SCHEMA):
+    """
+    Yields the valid part of each chunk, collecting rejected rows by line number
+    """
+    for chunk in validation.read_csv_chunks(filename, batch_size):
+        valid, rejected = validation.prepare_chunk(chunk, schema)
+        rejects.update(zip((rejected.index + 2).tolist(), rejected.to_dict("records")))
+        if not valid.empty:
+            yield valid
+
+
+def insert_batch_counted(collection, batch):
+    """
+    Inserts one batch with insert_many and returns (inserted, duplicates, errors)
+    instead of raising on duplicate keys or other write errors.
+    """
+    try:
+        result = collection.insert_many(batch, ordered=False)
+        return len(result.inserted_ids), 0, 0
+    except pymongo.errors.BulkWriteError as error:
+        write_errors = error.details.get("writeErrors", [])
+        duplicates = sum(1 for write_error in write_errors if write_error.get("code") == 11000)
+        return error.details.get("nInserted", 0), duplicates, len(write_errors) - duplicates
+    except pymongo.errors.PyMongoError as error:
+        print(f"Unexpected error in batch: {error}")
+        return 0, 0, len(batch)
+
+
+def worker_result(rows, inserted, duplicates, errors, seconds):
+    """
+    Builds the structured result a loader worker reports back to the parent.
+    """
+    return {
+        "pid": os.getpid(),
+        "rows": rows,
+        "inserted": inserted,
+        "duplicates": duplicates,
+        "errors": errors,
+        "seconds": seconds,
+        "rows_per_sec": rows / seconds if seconds > 0 else 0.0,
+    }
+
+
+def merge_load_results(results, seconds):
     """
-    client = pymongo.MongoClient(host, port)
-    user_collection = init_user_collection(client, database_name)
+    Merges per-worker result dicts into a single load report.
+    The load counts as successful when no worker hit a non-duplicate error
+    and every row was either inserted or reported as a duplicate.
+    """
+    report = {"rows": 0, "inserted": 0, "duplicates": 0, "errors": 0}
+    for result in results:
+        for key in report:
+            report[key] += result[key]
+    report["seconds"] = seconds
+    report["rows_per_sec"] = report["rows"] / seconds if seconds > 0 else 0.0
+    report["workers"] = list(results)
+    report["success"] = (report["errors"] == 0
+                         and report["inserted"] + report["duplicates"] == report["rows"])
+    return report
+
 
+@profiled
+def load_users_multiprocess_worker(data, host, port, database_name, bulk_ingest=False, connection_string=None,
+                                   collection_options=None):
+    """
+    Helper function for multiprocessing to load users.
+    collection_options are passed to init_user_collection.
+    Returns a result dict with rows, inserted, duplicates, errors and timing.
+    """
+    start_time = time.perf_counter()
     column_map = {"USER_ID": "_id", "EMAIL": "user_email", "NAME": "user_name", "LASTNAME": "user_last_name"}
     data.rename(columns=column_map, inplace=True)
 
     # Convert the data to a list of dictionaries for batch insertion
     user_records = data.to_dict("records")
+    return insert_user_records(user_records, start_time, host, port, database_name, bulk_ingest,
+                               connection_string, collection_options)
+
+
+@profiled
+def load_users_parquet_worker(filename, row_groups, host, port, database_name, bulk_ingest=False,
+                              connection_string=None, collection_options=None):
+    """
+    Worker for Parquet input: reads its own row groups and loads them.
+    Returns the same result dict as load_users_multiprocess_worker.
+    """
+    start_time = time.perf_counter()
+    user_records = [user for group in columnar.read_documents(filename, delta_sync.USER_SPEC, required=True,
+                                                                row_groups=row_groups)
+                    for user in group]
+    return insert_user_records(user_records, start_time, host, port, database_name, bulk_ingest,
+                               connection_string, collection_options)
+
+
+def insert_user_records(user_records, start_time, host, port, database_name, bulk_ingest=False,
+                        connection_string=None, collection_options=None):
+    """
+    Inserts a worker's user documents with parallel insert_many batches and reports the counts
+    """
+    client = connect_worker(host, port, connection_string)
+    user_collection = init_user_collection(client, database_name, **(collection_options or {}))
 
-    # Insert data in batches using insert_many
+    write_collection = user_collection
+    if bulk_ingest:
+        write_collection = user_collection.with_options(write_concern=BULK_WRITE_CONCERN)
+
+    # Insert data in batches using insert_many and collect the per-batch counts
     with ThreadPoolExecutor() as executor:
         batch_size = len(user_records) // cpu_count() + 1
         batches = [user_records[i:i + batch_size] for i in range(0, len(user_records), batch_size)]
-        for batch in batches:
-            executor.submit(user_collection.insert_many, batch, ordered=False)
+        futures = [executor.submit(insert_batch_counted, write_collection, batch) for batch in batches]
+        counts = [future.result() for future in futures]
+
+    inserted, duplicates, errors = (sum(column) for column in zip(*counts)) if counts else (0, 0, 0)
+    if bulk_ingest:
+        # Unacknowledged counts are meaningless; trust the verification pass instead
+        verification = verify_bulk_load(user_collection, user_records)
+        duplicates, errors = verification["duplicates"], verification["errors"]
+        inserted = len(user_records) - verification["missing"] + verification["resent"] - duplicates
 
     client.close()
+    return worker_result(len(user_records), inserted, duplicates, errors, time.perf_counter() - start_time)
 
-def load_status_updates(filename, status_collection, batch_size=100):
+
+@profiled(merge=True)
+def load_status_updates(filename, status_collection, batch_size=100, bulk_ingest=False, user_directory=None,
+                        dedupe=None, validate=False, reject_file=None, timeline=None, memory_budget=None):
     """
-    Loads status updates from a CSV file into the database in batches.
+    Loads status updates from a CSV or Parquet file into the database in batches.
+    A StatusTimeline, if given, gets the newly inserted statuses of each batch (not with bulk_ingest).
+    memory_budget streams the file in planned chunks instead of holding it all;
+    dedupe and bulk_ingest need the whole file and cannot be combined with it.
+    With bulk_ingest, batches are written unacknowledged and then verified against the file.
+    With a UserDirectory, statuses for unknown users are skipped in memory before loading.
+    dedupe ("first" or "last") drops repeated STATUS_IDs in the file before they reach the server.
+    validate checks whole pandas chunks; rejected rows are written to reject_file if given.
+    dedupe, validate and memory_budget are CSV only.
     """
+    parquet = columnar.is_parquet(filename)
+    if parquet and (dedupe or validate or memory_budget is not None):
+        raise ValueError("dedupe, validate and memory_budget are only available for CSV input")
+    if bulk_ingest and timeline is not None:
+        raise ValueError("timeline needs acknowledged writes to know which statuses were inserted")
+    if memory_budget is not None:
+        if dedupe or bulk_ingest:
+            raise ValueError("dedupe and bulk_ingest are not available with memory_budget")
+        return load_status_updates_budgeted(filename, status_collection, memory_budget, user_directory,
+                                            timeline, validate, reject_file)
     try:
-        with open(filename, 'r', encoding="utf-8", newline="") as file:
-            reader = csv.DictReader(file)
-            status_updates = []
-
-            for row in reader:
-                status_updates.append({
-                    "_id": row['STATUS_ID'],
-                    "user_id": row['USER_ID'],
-                    "status_text": row['STATUS_TEXT']
-                })
+        if parquet:
+            status_updates = [status for group in columnar.read_documents(filename, delta_sync.STATUS_SPEC)
+                              for status in group]
+        else:
+            status_updates = read_status_csv(filename, dedupe, validate, reject_file)
+
+        if user_directory is not None:
+            known = [status for status in status_updates if status["user_id"] in user_directory]
+            if len(known) != len(status_updates):
+                print(f"Skipped {len(status_updates) - len(known)} statuses without a matching user")
+            status_updates = known
+
+        load_collection = status_collection
+        if bulk_ingest:
+            load_collection = status_collection.with_write_concern(BULK_WRITE_CONCERN)
 
-            # Process data in batches
-            for i in range(0, len(status_updates), batch_size):
-                batch = status_updates[i:i + batch_size]
-                if not status_collection.batch_load_statuses(batch):
-                    print(f"Error loading batch of statuses starting at index {i}")
-                    return False
+        # Process data in batches
+        for i in range(0, len(status_updates), batch_size):
+            batch = status_updates[i:i + batch_size]
+            if not load_status_batch(load_collection, batch, timeline):
+                print(f"Error loading batch of statuses starting at index {i}")
+                return False
 
-            return True
+        if bulk_ingest:
+            return verify_bulk_load(status_collection.database, status_updates)["errors"] == 0
+        return True
     except FileNotFoundError:
         # logger.debug("File %s was not found", filename)
         return False
 
 
+def read_status_csv(filename, dedupe=None, validate=False, reject_file=None):
+    """
+    Reads the status documents of a CSV file
+    """
+    with open(filename, 'r', encoding="utf-8", newline="") as file:
+        duplicates = []
+        rejects = {}
+        reader = source_rows(filename, csv.DictReader(file), "STATUS_ID", validation.STATUS_SCHEMA,
+                             validate, dedupe, duplicates, rejects)
+        status_updates = []
+
+        for row in reader:
+            status_updates.append({
+                "_id": row['STATUS_ID'],
+                "user_id": row['USER_ID'],
+                "status_text": row['STATUS_TEXT']
+            })
+        dedup.report_duplicates(duplicates, "STATUS_ID")
+        report_rejects(rejects, reject_file)
+    return status_updates
+
+
+def load_users_staged(filename, mongo_client, database_name=DATABASE, table_name="UserAccounts", batch_size=1000,
+                      indexes=None, max_skipped=0.0, compact=False, normalized_email=False, **load_options):
+    """
+    Full reload of the users through a shadow collection swapped in only once it is
+    complete, indexed and the count checks out. load_options go to load_users.
+    compact loads the compact schema; normalized_email writes the normalized email.
+    Returns the staging report (see staging.staged_load).
+    """
+
+    def load(shadow):
+        if normalized_email:
+            shadow = email_index.NormalizedEmailCollection(shadow)
+        return load_users(filename, shadow, batch_size, **load_options)
+
+    try:
+        row_count = staging.source_row_count(filename)
+    except FileNotFoundError as e:
+        print(f"Error loading users: {e}")
+        return {"success": False}
+    return staging.staged_load(mongo_client[database_name], table_name,
+                               load,
+                               row_count, indexes, max_skipped, compact_schema.USER_KEYS if compact else None)
+
+
+def load_status_updates_staged(filename, mongo_client, database_name=DATABASE, table_name="StatusUpdates",
+                               batch_size=1000, indexes=None, max_skipped=0.0, compact=False, **load_options):
+    """
+    Full reload of the statuses through a shadow collection, as load_users_staged.
+    load_options go to load_status_updates.
+    """
+    try:
+        row_count = staging.source_row_count(filename)
+    except FileNotFoundError:
+        return {"success": False}
+    return staging.staged_load(
+        mongo_client[database_name], table_name,
+        lambda shadow: load_status_updates(filename, user_status.UserStatusCollection(shadow), batch_size,
+                                           **load_options),
+        row_count, indexes, max_skipped, compact_schema.STATUS_KEYS if compact else None)
+
+
+def load_status_chunk(chunk, status_collection, user_directory=None, timeline=None):
+    """
+    Loads one DataFrame chunk of status rows; used by the memory-budgeted loader
+    """
+    column_map = {"STATUS_ID": "_id", "USER_ID": "user_id", "STATUS_TEXT": "status_text"}
+    status_updates = chunk[list(column_map)].rename(columns=column_map).to_dict("records")
+    if user_directory is not None:
+        status_updates = [status for status in status_updates if status["user_id"] in user_directory]
+    if not status_updates:
+        return True
+    return load_status_batch(status_collection, status_updates, timeline)
+
+
+def load_status_batch(status_collection, batch, timeline=None):
+    """
+    batch_load_statuses, then the timeline fan-out of the statuses actually inserted,
+    so reloading existing statuses does not repeat them on timelines
+    """
+    if timeline is None:
+        return status_collection.batch_load_statuses(batch)
+    inserted = []
+    if not status_collection.batch_load_statuses(batch, inserted):
+        return False
+    timeline.add_many(inserted)
+    return True
+
+
+def load_status_updates_budgeted(filename, status_collection, memory_budget, user_directory=None, timeline=None,
+                                 validate=False, reject_file=None):
+    """
+    Streams a status file in chunks sized from the memory budget, with a bounded number
+    of chunks being written at once by writer threads.
+    """
+    try:
+        plan = plan_load(filename, memory_budget, worker_base=0)
+        rejects = {}
+        if validate:
+            chunks = validated_chunks(filename, plan["chunk_size"], rejects, validation.STATUS_SCHEMA)
+        else:
+            chunks = validation.read_csv_chunks(filename, plan["chunk_size"])
+        with ThreadPoolExecutor(max_workers=plan["workers"]) as writers:
+            results = run_budgeted(writers, load_status_chunk, chunks,
+                                   (status_collection, user_directory, timeline),
+                                   plan["in_flight"], MemoryThrottle(memory_budget))
+        report_rejects(rejects, reject_file)
+        return all(results)
+    except FileNotFoundError:
+        return False
+
+
+def encode_raw_document(keys, values):
+    """
+    Encodes string values straight into a BSON document buffer, without building a dict.
+    keys are pre-encoded element headers such as STATUS_RAW_KEYS.
+    """
+    parts = []
+    for key, value in zip(keys, values):
+        data = value.encode("utf-8")
+        parts += (key, PACK_INT32(len(data) + 1), data, b"\x00")
+    body = b"".join(parts)
+    return PACK_INT32(len(body) + 5) + body + b"\x00"
+
+
+@profiled
+def encode_status_batch(rows, order=(0, 1, 2), keys=STATUS_RAW_KEYS):
+    """
+    Worker function: turns parsed CSV rows into raw BSON buffers for status documents.
+    order gives the column index of STATUS_ID, USER_ID and STATUS_TEXT.
+    """
+    return [encode_raw_document(keys, [row[i] for i in order]) for row in rows]
+
+
+def load_raw_status_batch(status_collection, encoded):
+    """
+    Writer thread helper: wraps pre-encoded buffers and hands them to batch_load_statuses.
+    Returns the statuses actually inserted, or None if the batch failed.
+    """
+    inserted = []
+    if not status_collection.batch_load_statuses([RawBSONDocument(data) for data in encoded], inserted):
+        return None
+    return inserted
+
+
+@profiled(merge=True)
+def load_status_updates_raw(filename, status_collection, batch_size=1000, processes=None, timeline=None):
+    """
+    Loads status updates by encoding CSV rows to BSON in worker processes.
+    The writer threads only move the pre-encoded bytes to the server.
+    Rows missing a column are skipped and reported, blank lines ignored.
+    A StatusTimeline gets the inserted statuses, batch by batch in file order.
+    """
+    try:
+        with open(filename, 'r', encoding="utf-8", newline="") as file:
+            reader = csv.reader(file)
+            header = next(reader)
+            order = tuple(header.index(column) for column in STATUS_COLUMNS)
+            width = max(order) + 1
+            keys = compact_schema.raw_keys(status_collection.database, ("_id", "user_id", "status_text"))
+            rejects = {}
+
+            def row_batches():
+                batch = []
+                for row in reader:
+                    if len(row) < width:
+                        if row:
+                            rejects[reader.line_num] = row
+                        continue
+                    batch.append(row)
+                    if len(batch) == batch_size:
+                        yield batch
+                        batch = []
+                if batch:
+                    yield batch
+
+            with ProcessPoolExecutor(max_workers=processes) as encoders, ThreadPoolExecutor() as writers:
+                futures = [writers.submit(load_raw_status_batch, status_collection, encoded)
+                           for encoded in encoders.map(encode_status_batch, row_batches(), repeat(order), repeat(keys))]
+                results = [future.result() for future in futures]
+            loaded = all(inserted is not None for inserted in results)
+            if timeline is not None:
+                stored_keys = compact_schema.stored_keys(status_collection.database)
+                full_names = {short: field for field, short in stored_keys.items()}
+                for inserted in results:
+                    timeline.add_many([compact_schema.rename_keys(status, full_names) for status in inserted or []])
+            report_rejects(rejects, None)
+            return loaded
+    except (FileNotFoundError, StopIteration, ValueError) as e:
+        print(f"Error loading status updates: {e}")
+        return False
+
+
+def sync_users(filename, user_collection, store_path="delta_fingerprints.sqlite3"):
+    """
+    Delta-syncs a full accounts snapshot: only new, changed and deleted users are written.
+    Returns a report dict with new/changed/deleted/unchanged/skipped counts and success.
+    """
+    try:
+        return delta_sync.sync_snapshot(filename, user_collection, store_path, delta_sync.USER_SPEC)
+    except (FileNotFoundError, KeyError) as e:
+        print(f"Error syncing users: {e}")
+        return {"success": False}
+
+
+def sync_status_updates(filename, status_collection, store_path="delta_fingerprints.sqlite3", timeline=None):
+    """
+    Delta-syncs a full status snapshot: only new, changed and deleted statuses are written.
+    With a StatusTimeline, the timelines of the users whose statuses were written are rebuilt.
+    Returns a report dict with new/changed/deleted/unchanged/skipped counts and success.
+    """
+    changes = {}
+    try:
+        report = delta_sync.sync_snapshot(filename, status_collection.database, store_path, delta_sync.STATUS_SPEC,
+                                          changes)
+    except (FileNotFoundError, KeyError) as e:
+        print(f"Error syncing status updates: {e}")
+        return {"success": False}
+    if timeline is not None and report["success"]:
+        # Statuses that moved to another user, or were deleted, are still on the old user's timeline
+        users = {status["user_id"] for status in changes["upserted"]}
+        users |= timeline.users_with([status["_id"] for status in changes["upserted"]] + changes["deleted"])
+        timeline.rebuild(status_collection.database, users)
+    return report
+
+
+def export_users(filename, user_collection, file_format=None, parts=export.DEFAULT_PARTS,
+                 batch_size=export.EXPORT_BATCH_SIZE):
+    """
+    Streams all users to a CSV file that load_users accepts, or to Parquet
+    (by extension or file_format). Returns the number of users written, or None on error.
+    """
+    try:
+        return export.export_collection(user_collection, filename, delta_sync.USER_SPEC, file_format, parts,
+                                        batch_size)
+    except (OSError, ImportError) as e:
+        print(f"Error exporting users: {e}")
+        return None
+
+
+def export_status_updates(filename, status_collection, file_format=None, parts=export.DEFAULT_PARTS,
+                          batch_size=export.EXPORT_BATCH_SIZE):
+    """
+    Streams all statuses to a CSV file that load_status_updates accepts, or to Parquet
+    (by extension or file_format). Returns the number of statuses written, or None on error.
+    """
+    try:
+        return export.export_collection(status_collection.database, filename, delta_sync.STATUS_SPEC,
+                                        file_format, parts, batch_size)
+    except (OSError, ImportError) as e:
+        print(f"Error exporting status updates: {e}")
+        return None
+
+
 def concurrent_batch_load_statuses(self, data, batch_size=1000, max_workers=4):
     """
     Concurrently loads batches of statuses using ThreadPoolExecutor.
@@ -216,9 +914,11 @@ def concurrent_batch_load_statuses(self, data, batch_size=1000, max_workers=4):
 #     return True
 
 
-def add_user(user_id, email, user_name, user_last_name, user_collection):
+def add_user(user_id, email, user_name, user_last_name, user_collection, user_directory=None, email_lookup=None):
     """
     Creates a new instance of Users and stores it in user_collection
+    An optional UserDirectory is kept in step with the insert.
+    With an EmailLookup, a duplicate email is rejected by its unique index in the same insert.
     """
     user = {
         "_id": user_id,
@@ -226,16 +926,21 @@ def add_user(user_id, email, user_name, user_last_name, user_collection):
         "user_name": user_name,
         "user_last_name": user_last_name
     }
+    if email_lookup is not None:
+        user = email_lookup.prepare(user)
     try:
         user_collection.insert_one(user)
+        if user_directory is not None:
+            user_directory.add(user_id)
         return True
     except pymongo.errors.DuplicateKeyError:
         return False
 
 
-def update_user(user_id, email, user_name, user_last_name, user_collection):
+def update_user(user_id, email, user_name, user_last_name, user_collection, email_lookup=None):
     """
     Updates the values of an existing user
+    With an EmailLookup, taking another user's email fails on its unique index.
     """
     query = {"_id": user_id}
     new_values = {"$set": {
@@ -243,20 +948,35 @@ def update_user(user_id, email, user_name, user_last_name, user_collection):
         "user_name": user_name,
         "user_last_name": user_last_name
     }}
-    result = user_collection.update_one(query, new_values)
+    if email_lookup is not None:
+        new_values["$set"] = email_lookup.prepare(new_values["$set"])
+    try:
+        result = user_collection.update_one(query, new_values)
+    except pymongo.errors.DuplicateKeyError:
+        return False
+    if email_lookup is not None:
+        email_lookup.forget(user_id)
     return result.modified_count > 0
 
 
-def delete_user(user_id, user_collection, status_collection):
+def delete_user(user_id, user_collection, status_collection, user_directory=None, timeline=None,
+                email_lookup=None):
     """
     Deletes a user from user_collection and associated statuses from status_collection.
+    An optional UserDirectory, StatusTimeline and EmailLookup are kept in step with the delete.
     """
     # First, attempt to delete the user
     user_result = user_collection.delete_one({"_id": user_id})
 
     if user_result.deleted_count > 0:
+        if user_directory is not None:
+            user_directory.discard(user_id)
+        if email_lookup is not None:
+            email_lookup.forget(user_id)
         # If the user was deleted, delete all associated statuses
         status_result = status_collection.delete_many({"user_id": user_id})
+        if timeline is not None:
+            timeline.delete_user(user_id)
         print(f"Deleted {status_result.deleted_count} statuses associated with UserID {user_id}")
         # logger.debug("User ID %s successfully deleted from the database", user_id)
         return True
@@ -268,33 +988,86 @@ def search_user(user_id, user_collection):
     """
     Searches for a user in user_collection(which is an instance of UserCollection).
     """
-    return user_collection.find_one({"_id": user_id})
+    return read_routing.read_view(user_collection, "search").find_one({"_id": user_id})
 
 
-def add_status(user_id, status_id, status_text, status_collection, user_collection):
+def search_user_by_email(email, user_collection, email_lookup=None):
+    """
+    Searches for a user by email; through the EmailLookup's index and cache if given,
+    otherwise with a plain query on user_email
+    """
+    if email_lookup is not None:
+        return email_lookup.find(email)
+    return read_routing.read_view(user_collection, "search").find_one({"user_email": email})
+
+
+def search_users(user_ids, user_collection, projection=None, chunk_size=batch_lookup.LOOKUP_CHUNK_SIZE):
+    """
+    Looks up many users at once; user_ids is an iterable of IDs (see search_users_from_file).
+    Yields (user_id, user or None) in input order as chunked $in queries complete.
+    """
+    if isinstance(user_ids, (str, bytes)):
+        raise TypeError("user_ids must be an iterable of IDs, use search_users_from_file for a file")
+    return batch_lookup.batch_lookup(user_collection, user_ids, projection, chunk_size)
+
+
+def search_users_from_file(filename, user_collection, projection=None, chunk_size=batch_lookup.LOOKUP_CHUNK_SIZE):
+    """
+    search_users for the IDs listed in a file (see batch_lookup.read_ids)
+    """
+    return search_users(batch_lookup.read_ids(filename), user_collection, projection, chunk_size)
+
+
+def add_status(user_id, status_id, status_text, status_collection, user_collection, user_directory=None,
+               timeline=None):
     """
     Creates a new instance of UserStatus and stores it in status_collection
+    With a UserDirectory the user existence check happens in memory instead of find_one.
+    A StatusTimeline, if given, gets the new status on top.
     """
-    user_exists = user_collection.find_one({"_id": user_id})
+    if user_directory is not None:
+        user_exists = user_id in user_directory
+    else:
+        user_exists = read_routing.read_view(user_collection, "existence").find_one({"_id": user_id})
 
     if not user_exists:
         return False  # User does not exist, status cannot be added
 
-    return status_collection.add_status(status_id, user_id, status_text)
+    added = status_collection.add_status(status_id, user_id, status_text)
+    if added and timeline is not None:
+        timeline.add(user_id, status_id, status_text)
+    return added
 
 
-def update_status(status_id, user_id, status_text, status_collection):
+def update_status(status_id, user_id, status_text, status_collection, timeline=None):
     """
     Updates the values of an existing status_id
     """
-    return status_collection.modify_status(status_id, user_id, status_text)
+    modified = status_collection.modify_status(status_id, user_id, status_text)
+    if modified and timeline is not None:
+        timeline.modify(user_id, status_id, status_text)
+    return modified
 
 
-def delete_status(status_id, status_collection):
+def delete_status(status_id, status_collection, timeline=None):
     """
     Deletes a status_id from status_collection.
+    With a StatusTimeline the status is looked up first to find whose timeline it is on.
+    """
+    if timeline is None:
+        return status_collection.delete_status(status_id)
+    status = status_collection.search_status(status_id)
+    if not status or not status_collection.delete_status(status_id):
+        return False
+    timeline.remove(status["user_id"], status_id)
+    return True
+
+
+def latest_statuses(user_id, timeline):
     """
-    return status_collection.delete_status(status_id)
+    A user's latest statuses, newest first, from the materialized timeline
+    """
+    return timeline.latest(user_id)
 
 
 def search_status(status_id, status_collection):
@@ -302,3 +1075,21 @@ def search_status(status_id, status_collection):
     Searches for a status in status_collection
     """
     return status_collection.search_status(status_id)
+
+
+def search_statuses(status_ids, status_collection, projection=None, chunk_size=batch_lookup.LOOKUP_CHUNK_SIZE):
+    """
+    Looks up many statuses at once; status_ids is an iterable of IDs (see search_statuses_from_file).
+    Yields (status_id, status or None) in input order as chunked $in queries complete.
+    """
+    if isinstance(status_ids, (str, bytes)):
+        raise TypeError("status_ids must be an iterable of IDs, use search_statuses_from_file for a file")
+    return batch_lookup.batch_lookup(status_collection.database, status_ids, projection, chunk_size)
+
+
+def search_statuses_from_file(filename, status_collection, projection=None,
+                              chunk_size=batch_lookup.LOOKUP_CHUNK_SIZE):
+    """
+    search_statuses for the IDs listed in a file (see batch_lookup.read_ids)
+    """
+    return search_statuses(batch_lookup.read_ids(filename), status_collection, projection, chunk_size)
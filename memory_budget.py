@@ -0,0 +1,146 @@
+"""
+Memory-budgeted loading: picks chunk size, worker count and in-flight batches from
+the measured per-row memory cost, and throttles when RSS nears the budget
+"""
+
+import os
+import re
+import sys
+import time
+from multiprocessing import cpu_count
+
+import pandas as pd
+
+# Share of the budget at which the loaders stop submitting new work
+HIGH_WATER = 0.85
+# Baseline RSS of a worker process (interpreter, pandas, pymongo) before it holds any rows
+WORKER_BASE_BYTES = 80 * 1024 ** 2
+MIN_CHUNK_ROWS = 100
+MAX_CHUNK_ROWS = 50_000
+SAMPLE_ROWS = 1000
+THROTTLE_SLEEP = 0.05
+UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+def parse_size(size):
+    """
+    Accepts bytes as an int or strings such as "512M" / "2GB"
+    """
+    if isinstance(size, int):
+        return size
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMG]?)I?B?\s*", str(size).upper())
+    if not match:
+        raise ValueError(f"Invalid memory size {size!r}")
+    return int(float(match.group(1)) * UNITS[match.group(2)])
+
+
+def process_rss(pid="self"):
+    """
+    Resident set size of a process in bytes (Linux /proc; falls back to peak RSS elsewhere)
+    """
+    try:
+        with open(f"/proc/{pid}/statm", encoding="ascii") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (FileNotFoundError, ProcessLookupError, ValueError):
+        if pid != "self":
+            return 0
+        import resource  # pylint: disable = C0415
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def parent_map():
+    """
+    pid -> parent pid for every process in /proc
+    """
+    parents = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", encoding="ascii", errors="replace") as stat:
+                # The command name may contain spaces; the fields after it are fixed
+                parents[entry] = stat.read().rsplit(")", 1)[1].split()[1]
+        except (OSError, IndexError):
+            continue
+    return parents
+
+
+def tree_rss():
+    """
+    RSS of this process plus all of its descendants
+    """
+    total = process_rss()
+    if not os.path.isdir("/proc"):
+        return total
+    children = {}
+    for pid, parent in parent_map().items():
+        children.setdefault(parent, []).append(pid)
+    pending = list(children.get(str(os.getpid()), []))
+    while pending:
+        pid = pending.pop()
+        total += process_rss(pid)
+        pending += children.get(pid, [])
+    return total
+
+
+def measure_row_cost(filename, sample_rows=SAMPLE_ROWS):
+    """
+    Bytes per row while loading: the DataFrame chunk plus its to_dict("records") copy
+    and the list slots of the sliced batches
+    """
+    sample = pd.read_csv(filename, nrows=sample_rows, dtype=str, keep_default_na=False)
+    if sample.empty:
+        return 1
+    frame_bytes = sample.memory_usage(deep=True).sum()
+    records = sample.to_dict("records")
+    record_bytes = sum(sys.getsizeof(record) for record in records)
+    return int((frame_bytes + record_bytes) / len(sample)) + 2 * 8
+
+
+def plan_load(filename, budget, processes=None, worker_base=WORKER_BASE_BYTES):
+    """
+    Chooses {"chunk_size", "workers", "in_flight", "row_cost"} so that the parent, the workers
+    and the chunks queued for them fit in budget bytes.
+    worker_base is the fixed cost of one worker: a process's baseline RSS, or 0 for threads.
+    """
+    budget = parse_size(budget)
+    row_cost = measure_row_cost(filename)
+    available = budget * HIGH_WATER - process_rss()
+    processes = processes or cpu_count()
+    workers = max(1, min(processes, int(available // (worker_base + 2 * MIN_CHUNK_ROWS * row_cost))))
+    # Each worker holds one chunk, and one more chunk per worker waits queued in the parent
+    per_worker = available / workers - worker_base
+    chunk_size = int(min(MAX_CHUNK_ROWS, max(MIN_CHUNK_ROWS, per_worker / (2 * row_cost))))
+    return {"chunk_size": chunk_size, "workers": workers, "in_flight": 2 * workers, "row_cost": row_cost}
+
+
+class MemoryThrottle:
+    """
+    Blocks new work while the process tree is above HIGH_WATER of the budget
+    """
+
+    def __init__(self, budget, rss_function=tree_rss):
+        self.limit = parse_size(budget) * HIGH_WATER
+        self.rss_function = rss_function
+        self.throttled = 0
+
+    def over(self):
+        """
+        True when the process tree is above the high-water mark
+        """
+        return self.rss_function() > self.limit
+
+    def wait(self, pending, done):
+        """
+        While over the mark, waits for pending futures oldest first and moves them to done.
+        Returns the futures still pending.
+        """
+        pending = list(pending)
+        while pending and self.over():
+            self.throttled += 1
+            done.append(pending.pop(0))
+            done[-1].result()
+        if self.over():
+            time.sleep(THROTTLE_SLEEP)
+        return pending
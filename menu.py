@@ -39,7 +39,8 @@ def add_user():
     email = input("User email: ")
     user_name = input("User name: ")
     user_last_name = input("User last name: ")
-    if not main.add_user(user_id, email, user_name, user_last_name, user_collection):
+    if not main.add_user(user_id, email, user_name, user_last_name, user_collection,
+                         email_lookup=email_lookup):
         print("This user already exists!")
     else:
         print("User was successfully added")
@@ -53,7 +54,7 @@ def update_user():
     email = input("User email: ")
     user_name = input("User name: ")
     user_last_name = input("User last name: ")
-    if not main.update_user(user_id, email, user_name, user_last_name, user_collection):
+    if not main.update_user(user_id, email, user_name, user_last_name, user_collection, email_lookup):
         print("An error occurred while trying to update user, check user id")
     else:
         print("User was successfully updated")
@@ -74,12 +75,54 @@ def search_user():
         print(f"Last name: {result['user_last_name']}")
 
 
+def search_user_by_email():
+    """
+    Searches a user in the database by email
+    """
+    email = input("Enter email to search: ")
+    result = main.search_user_by_email(email, user_collection, email_lookup)
+    if result is None:
+        print("ERROR: User does not exist")
+    else:
+        print(f"User ID: {result['_id']}")
+        print(f"Email: {result['user_email']}")
+        print(f"Name: {result['user_name']}")
+        print(f"Last name: {result['user_last_name']}")
+
+
+def batch_search_users():
+    """
+    Looks up every user ID listed in a file
+    """
+    filename = input("Enter filename of user IDs: ")
+    print_batch_results(main.search_users_from_file(filename, user_collection))
+
+
+def print_batch_results(results):
+    """
+    Prints one FOUND/MISSING line per ID as results arrive, then the totals
+    """
+    found = missing = 0
+    try:
+        for item_id, document in results:
+            if document is None:
+                missing += 1
+                print(f"MISSING {item_id}")
+            else:
+                found += 1
+                print(f"FOUND   {item_id}")
+    except (OSError, UnicodeDecodeError) as e:
+        print(f"ERROR: {e}")
+        return
+    print(f"{found} found, {missing} missing")
+
+
 def delete_user():
     """
     Deletes user from the database and associated statuses.
     """
     user_id = input("User ID: ")
-    if not main.delete_user(user_id, user_collection, status_collection):
+    if not main.delete_user(user_id, user_collection, status_collection, email_lookup=email_lookup):
         print("User does not exist!")
     else:
         print("User and associated statuses were successfully deleted")
@@ -125,6 +168,14 @@ def search_status():
         print(f"Status text: {result['status_text']}")
 
 
+def batch_search_statuses():
+    """
+    Looks up every status ID listed in a file
+    """
+    filename = input("Enter filename of status IDs: ")
+    print_batch_results(main.search_statuses_from_file(filename, status_collection))
+
+
 def delete_status():
     """
     Deletes status from the database
@@ -136,6 +187,20 @@ def delete_status():
         print("Status was successfully deleted")
 
 
+def build_email_index():
+    """
+    Builds the unique email index used by the user options; meant for users loaded from
+    checked or column-fixed data, as existing duplicate emails are reported and block it
+    """
+    global email_lookup  # pylint: disable = W0603
+    lookup = main.init_email_lookup(user_collection)
+    if lookup is None:
+        print("Email index not built, searching by email without it")
+    else:
+        email_lookup = lookup
+        print("Email index built: duplicate emails are now rejected")
+
+
 def quit_program():
     """
     Quits program
@@ -147,6 +212,8 @@ if __name__ == "__main__":
     mongo_client = main.get_mongo_client()
     user_collection = main.init_user_collection(mongo_client, database_name=DATABASE)
     status_collection = main.init_status_collection(mongo_client, database_name=DATABASE)
+    # Built on request (option N) once the loaded users are known to have distinct emails
+    email_lookup = None
     menu_options = {
         "A": load_users,
         "B": load_status_updates,
@@ -158,6 +225,10 @@ if __name__ == "__main__":
         "H": update_status,
         "I": search_status,
         "J": delete_status,
+        "K": search_user_by_email,
+        "L": batch_search_users,
+        "M": batch_search_statuses,
+        "N": build_email_index,
         "Q": quit_program,
     }
     while True:
@@ -173,6 +244,10 @@ if __name__ == "__main__":
                             H: Update status
                             I: Search status
                             J: Delete status
+                            K: Search user by email
+                            L: Batch search users from file
+                            M: Batch search statuses from file
+                            N: Build unique email index
                             Q: Quit
 
                             Please enter your choice: """
@@ -0,0 +1,243 @@
+"""
+Hash partitioning of the status collection across several databases.
+
+Operations that name a user_id go to that user's partition only; bulk loads are
+grouped per partition and written in parallel; anything else fans out.
+Each partition only enforces _id uniqueness for itself, so inserts first look the
+_ids up in every partition; concurrent inserts of one _id for two users can still race.
+"""
+
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import pymongo
+from bson.raw_bson import RawBSONDocument
+
+from backends import CollectionBackend, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+from compact_schema import stored_keys
+
+PARTITION_KEY = "user_id"
+
+
+def partition_index(user_id, count):
+    """
+    Stable partition number for user_id (crc32, unlike hash(), is the same in every process)
+    """
+    return zlib.crc32(str(user_id).encode("utf-8")) % count
+
+
+class PartitionedCollection(CollectionBackend):
+    """
+    Routes collection operations to one of several collections by a hash of user_id
+    """
+
+    def __init__(self, partitions, executor=None):
+        self.partitions = list(partitions)
+        # Views made by with_options share the executor; only the collection that created it shuts it down
+        self.owns_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(max_workers=len(self.partitions))
+        # Pre-encoded raw BSON carries the stored key, which is short on compact partitions
+        self.raw_partition_key = stored_keys(self).get(PARTITION_KEY, PARTITION_KEY)
+
+    def close(self):
+        """
+        Shuts down the fan-out threads
+        """
+        if self.owns_executor:
+            self.executor.shutdown()
+
+    def document_user_id(self, document):
+        """
+        user_id of a document to insert, raw BSON included
+        """
+        if isinstance(document, RawBSONDocument):
+            return document[self.raw_partition_key]
+        return document[PARTITION_KEY]
+
+    def partition_for(self, user_id):
+        """
+        Collection holding user_id's statuses
+        """
+        return self.partitions[partition_index(user_id, len(self.partitions))]
+
+    def targets(self, query):
+        """
+        Partitions a query has to visit: one if it pins user_id, all otherwise
+        """
+        user_id = (query or {}).get(PARTITION_KEY)
+        if user_id is not None and not isinstance(user_id, dict):
+            return [self.partition_for(user_id)]
+        return self.partitions
+
+    def fan_out(self, collections, function):
+        """
+        Runs function(collection) on every collection in parallel, returning results in order
+        """
+        if len(collections) == 1:
+            return [function(collections[0])]
+        return list(self.executor.map(function, collections))
+
+    def existing_ids(self, ids):
+        """
+        The subset of ids stored in any partition
+        """
+        ids = list(ids)
+        if not ids:
+            return set()
+        found = set()
+        for partial in self.fan_out(self.partitions,
+                                    lambda c: list(c.find({"_id": {"$in": ids}}, {"_id": 1}))):
+            found.update(document["_id"] for document in partial)
+        return found
+
+    def duplicate_errors(self, indexed_ids):
+        """
+        Write errors (code 11000) for the (index, _id) pairs whose _id is stored in any
+        partition or repeats an earlier pair, in index order
+        """
+        indexed_ids = list(indexed_ids)
+        taken = self.existing_ids(item_id for _index, item_id in indexed_ids)
+        errors = []
+        for index, item_id in indexed_ids:
+            if item_id in taken:
+                errors.append({"index": index, "code": 11000, "errmsg": f"E11000 duplicate key error: {item_id}"})
+            taken.add(item_id)
+        return errors
+
+    def insert_one(self, document):
+        if self.existing_ids([document["_id"]]):
+            raise pymongo.errors.DuplicateKeyError(f"E11000 duplicate key error: {document['_id']}", 11000)
+        self.partition_for(self.document_user_id(document)).insert_one(document)
+        return InsertOneResult(document["_id"])
+
+    def insert_many(self, documents, ordered=True):
+        """
+        Writes each partition's share in parallel. _ids already stored in any partition, or
+        repeated in documents, fail with code 11000 before anything is written; with ordered,
+        only the documents before the first such failure are written, as MongoDB would.
+        """
+        documents = list(documents)
+        duplicate_errors = self.duplicate_errors(enumerate(document["_id"] for document in documents))
+        if ordered and duplicate_errors:
+            duplicate_errors = duplicate_errors[:1]
+            documents = documents[:duplicate_errors[0]["index"]]
+        failed = {write_error["index"] for write_error in duplicate_errors}
+
+        groups = {}
+        for index, document in enumerate(documents):
+            if index not in failed:
+                groups.setdefault(partition_index(self.document_user_id(document), len(self.partitions)), []).append(
+                    (index, document))
+
+        def write(item):
+            number, members = item
+            try:
+                self.partitions[number].insert_many([doc for _index, doc in members], ordered=ordered)
+                return [doc["_id"] for _index, doc in members], []
+            except pymongo.errors.BulkWriteError as error:
+                # Map each partition-local index back to the caller's index
+                write_errors = [{**write_error, "index": members[write_error["index"]][0]}
+                                for write_error in error.details.get("writeErrors", [])]
+                if ordered:
+                    # An ordered insert stops at the first error
+                    return [doc["_id"] for _index, doc in members[:error.details.get("nInserted", 0)]], write_errors
+                failed = {write_error["index"] for write_error in write_errors}
+                return [doc["_id"] for index, doc in members if index not in failed], write_errors
+
+        inserted_ids = []
+        write_errors = duplicate_errors
+        for ids, errors in self.executor.map(write, groups.items()):
+            inserted_ids += ids
+            write_errors += errors
+        if write_errors:
+            raise pymongo.errors.BulkWriteError({"nInserted": len(inserted_ids),
+                                                 "writeErrors": sorted(write_errors, key=lambda e: e["index"])})
+        return InsertManyResult(inserted_ids)
+
+    def find_one(self, query, projection=None):
+        for result in self.fan_out(self.targets(query), lambda c: c.find_one(query, projection)):
+            if result is not None:
+                return result
+        return None
+
+    def find(self, query=None, projection=None):
+        results = []
+        for partial in self.fan_out(self.targets(query), lambda c: list(c.find(query or {}, projection))):
+            results += partial
+        return results
+
+    def update_one(self, query, update, upsert=False):
+        targets = self.targets(query)
+        if upsert and len(targets) > 1:
+            raise NotImplementedError(f"Upsert needs {PARTITION_KEY} in the query to pick a partition")
+        for collection in targets:
+            result = collection.update_one(query, update, upsert=upsert)
+            if result.matched_count or upsert:
+                return result
+        return UpdateResult(0, 0)
+
+    def delete_one(self, query):
+        for collection in self.targets(query):
+            result = collection.delete_one(query)
+            if result.deleted_count:
+                return result
+        return DeleteResult(0)
+
+    def delete_many(self, query):
+        results = self.fan_out(self.targets(query), lambda c: c.delete_many(query))
+        return DeleteResult(sum(result.deleted_count for result in results))
+
+    def count_documents(self, query):
+        return sum(self.fan_out(self.targets(query), lambda c: c.count_documents(query)))
+
+    def aggregate(self, pipeline, **kwargs):
+        """
+        Pipelines would have to be merged across partitions, which is not supported
+        """
+        raise NotImplementedError("Aggregation is not supported on a partitioned collection")
+
+    def with_options(self, **kwargs):
+        return PartitionedCollection([collection.with_options(**kwargs) for collection in self.partitions],
+                                     self.executor)
+
+    def bulk_write(self, requests, ordered=True):
+        """
+        Inserts and replacements carry user_id and are routed; deletes by _id fan out.
+        A replacement also deletes the _id elsewhere in case its user_id moved it to a new partition.
+        Inserts of an _id stored in any partition are rejected before anything is written.
+        Unordered, each partition's requests run in parallel; ordered, consecutive requests
+        for one partition run as one batch and the batches run in request order.
+        """
+        # pylint: disable = W0212
+        requests = list(requests)
+        write_errors = self.duplicate_errors((index, request._doc["_id"]) for index, request in enumerate(requests)
+                                             if isinstance(request, pymongo.InsertOne))
+        if write_errors:
+            raise pymongo.errors.BulkWriteError({"nInserted": 0, "writeErrors": write_errors})
+
+        routed = []
+        for request in requests:
+            if isinstance(request, (pymongo.InsertOne, pymongo.ReplaceOne)):
+                number = partition_index(self.document_user_id(request._doc), len(self.partitions))
+                routed.append((number, request))
+                if isinstance(request, pymongo.ReplaceOne):
+                    routed += [(other, pymongo.DeleteOne(request._filter))
+                               for other in range(len(self.partitions)) if other != number]
+            else:
+                routed += [(number, request) for number in range(len(self.partitions))]
+
+        if not ordered:
+            groups = [[] for _ in self.partitions]
+            for number, request in routed:
+                groups[number].append(request)
+            self.fan_out(list(zip(self.partitions, groups)),
+                         lambda item: item[1] and item[0].bulk_write(item[1], ordered=False))
+            return
+        batches = []
+        for number, request in routed:
+            if batches and batches[-1][0] == number:
+                batches[-1][1].append(request)
+            else:
+                batches.append((number, [request]))
+        for number, batch in batches:
+            self.partitions[number].bulk_write(batch, ordered=True)
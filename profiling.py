@@ -0,0 +1,175 @@
+"""
+Opt-in cProfile hooks for the loaders, including their child processes
+"""
+
+import cProfile
+import functools
+import glob
+import io
+import multiprocessing.util
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+
+# Set to a directory to enable profiling; child processes inherit it through the environment
+PROFILE_ENV = "A07_PROFILE_DIR"
+# Set by the outermost merging loader; tags the .pstats files of one run, child processes included
+RUN_ENV = "A07_PROFILE_RUN"
+MERGED_REPORT = "merged_report.txt"
+
+
+def enable(directory):
+    """
+    Turns profiling on for this process and any process it starts afterwards.
+    """
+    os.makedirs(directory, exist_ok=True)
+    os.environ[PROFILE_ENV] = directory
+
+
+def disable():
+    """
+    Turns profiling off.
+    """
+    os.environ.pop(PROFILE_ENV, None)
+
+
+def profile_dir():
+    """
+    Returns the profiling output directory, or None when profiling is off.
+    """
+    return os.environ.get(PROFILE_ENV) or None
+
+
+class ProcessProfile:
+    """
+    The one cProfile.Profile of a process, enabled while any profiled call runs in it and
+    written once as <name>-<pid>-<time>.<run>.pstats, name being the first profiled function
+    """
+
+    def __init__(self, name, directory, run_id):
+        self.pid = os.getpid()
+        self.name = name
+        self.directory = directory
+        self.run_id = run_id
+        self.profile = cProfile.Profile()
+        self.depth = 0
+        self.lock = threading.Lock()
+
+    def enter(self):
+        """
+        Starts profiling unless a profiled call is already running
+        """
+        with self.lock:
+            self.depth += 1
+            if self.depth == 1:
+                self.profile.enable()
+
+    def exit(self):
+        """
+        Stops profiling when the outermost profiled call returns
+        """
+        with self.lock:
+            self.depth -= 1
+            if self.depth == 0:
+                self.profile.disable()
+
+    def dump(self):
+        """
+        Writes the profile file
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        filename = f"{self.name}-{self.pid}-{time.time_ns()}.{self.run_id}.pstats"
+        self.profile.dump_stats(os.path.join(self.directory, filename))
+
+
+# This process's ProcessProfile; a forked child inherits the parent's, hence the pid check
+CURRENT = {"profile": None}
+CURRENT_LOCK = threading.Lock()
+
+
+def process_profile(name, directory):
+    """
+    The ProcessProfile of this process, created on first use with a dump at process exit
+    (multiprocessing finalizers also run in pool workers, which skip atexit)
+    """
+    with CURRENT_LOCK:
+        current = CURRENT["profile"]
+        if current is None or current.pid != os.getpid():
+            current = CURRENT["profile"] = ProcessProfile(name, directory, os.environ.get(RUN_ENV, "norun"))
+            multiprocessing.util.Finalize(None, dump_process_profile, exitpriority=0)
+        return current
+
+
+def dump_process_profile():
+    """
+    Writes this process's profile, if it has one, and starts afresh
+    """
+    with CURRENT_LOCK:
+        current = CURRENT["profile"]
+        if current is None or current.pid != os.getpid():
+            return
+        CURRENT["profile"] = None
+    current.dump()
+
+
+def profiled(func=None, merge=False):
+    """
+    Decorator that profiles func when profiling is enabled. Every call in a process adds
+    to that process's single profile, written once when the process exits.
+    With merge=True, for the top-level loaders, the outermost such call starts a run:
+    when it returns the process's profile is written and the merged top-functions
+    report of the run is rewritten, so profiles of earlier runs are left out.
+    Pool workers have exited (and written theirs) by then, as the loaders close their pools.
+    """
+    if func is None:
+        return functools.partial(profiled, merge=merge)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        directory = profile_dir()
+        if directory is None:
+            return func(*args, **kwargs)
+        starts_run = merge and not os.environ.get(RUN_ENV)
+        if starts_run:
+            # A profile left from calls outside any run is written under its own tag first
+            dump_process_profile()
+            os.environ[RUN_ENV] = uuid.uuid4().hex[:12]
+        run_id = os.environ[RUN_ENV] if starts_run else None
+        profile = process_profile(func.__name__, directory)
+        profile.enter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.exit()
+            if starts_run:
+                dump_process_profile()
+                merge_profiles(directory, run_id=run_id)
+                os.environ.pop(RUN_ENV, None)
+
+    return wrapper
+
+
+def merge_profiles(directory, top=30, sort="cumulative", run_id=None):
+    """
+    Merges the .pstats files of run_id (every .pstats file if None) in directory
+    and writes the top hot functions to merged_report.txt. Returns the report text.
+    """
+    pattern = f"*.{run_id}.pstats" if run_id else "*.pstats"
+    files = sorted(glob.glob(os.path.join(directory, pattern)))
+    if not files:
+        return ""
+    stream = io.StringIO()
+    stats = pstats.Stats(*files, stream=stream)
+    stream.write(f"Merged {len(files)} profiles from {directory}\n")
+    stats.sort_stats(sort).print_stats(top)
+    report = stream.getvalue()
+    with open(os.path.join(directory, MERGED_REPORT), "w", encoding="utf-8") as file:
+        file.write(report)
+    return report
+
+
+if __name__ == "__main__":
+    print(merge_profiles(sys.argv[1] if len(sys.argv) > 1 else profile_dir() or "."))
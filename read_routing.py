@@ -0,0 +1,120 @@
+"""
+Read routing: search, listing and existence-check reads can go to secondaries,
+with a per-operation-class read preference and tag sets. Writes stay on the primary.
+A causally consistent session shared by reads and writes keeps read-your-writes.
+"""
+
+from pymongo import read_preferences
+
+from backends import CollectionBackend
+
+# Operation class -> {"mode": ..., "tag_sets": [...], "max_staleness": seconds}
+DEFAULT_READ_ROUTES = {
+    "search": {"mode": "secondaryPreferred"},
+    "listing": {"mode": "secondaryPreferred"},
+    "existence": {"mode": "primaryPreferred"},
+}
+# Read class used by each collection method when the caller does not name one
+METHOD_READ_CLASSES = {"find_one": "search", "find": "listing", "count_documents": "listing"}
+READ_PREFERENCE_CLASSES = {
+    "primary": read_preferences.Primary,
+    "primaryPreferred": read_preferences.PrimaryPreferred,
+    "secondary": read_preferences.Secondary,
+    "secondaryPreferred": read_preferences.SecondaryPreferred,
+    "nearest": read_preferences.Nearest,
+}
+
+
+def make_read_preference(route):
+    """
+    Builds a pymongo read preference from a route dict
+    """
+    preference_class = READ_PREFERENCE_CLASSES[route.get("mode", "primary")]
+    if preference_class is read_preferences.Primary:
+        return preference_class()
+    return preference_class(tag_sets=route.get("tag_sets"), max_staleness=route.get("max_staleness", -1))
+
+
+class ReadRoutedCollection(CollectionBackend):
+    """
+    Wraps a pymongo collection; reads use the read preference of their operation class,
+    every operation runs in the given causally consistent session
+    """
+
+    def __init__(self, collection, session=None, routes=None, read_class=None):
+        self.collection = collection
+        self.session = session
+        self.routes = routes or DEFAULT_READ_ROUTES
+        self.read_class = read_class
+        self.views = {}
+        self.class_views = {}
+
+    def for_class(self, read_class):
+        """
+        Same collection, with every read using read_class; built once per class and
+        sharing this collection's read preference views
+        """
+        if read_class not in self.class_views:
+            view = ReadRoutedCollection(self.collection, self.session, self.routes, read_class)
+            view.views = self.views
+            self.class_views[read_class] = view
+        return self.class_views[read_class]
+
+    def reader(self, method):
+        """
+        Collection view with the read preference for this read
+        """
+        read_class = self.read_class or METHOD_READ_CLASSES[method]
+        if read_class not in self.views:
+            route = self.routes.get(read_class, {"mode": "primary"})
+            self.views[read_class] = self.collection.with_options(read_preference=make_read_preference(route))
+        return self.views[read_class]
+
+    def find_one(self, query, projection=None):
+        return self.reader("find_one").find_one(query, projection, session=self.session)
+
+    def find(self, query=None, projection=None):
+        return self.reader("find").find(query or {}, projection, session=self.session)
+
+    def count_documents(self, query):
+        return self.reader("count_documents").count_documents(query, session=self.session)
+
+    def aggregate(self, pipeline, **kwargs):
+        return self.reader("find").aggregate(pipeline, session=self.session, **kwargs)
+
+    def insert_one(self, document):
+        return self.collection.insert_one(document, session=self.session)
+
+    def insert_many(self, documents, ordered=True):
+        return self.collection.insert_many(documents, ordered=ordered, session=self.session)
+
+    def update_one(self, query, update, upsert=False):
+        return self.collection.update_one(query, update, upsert=upsert, session=self.session)
+
+    def delete_one(self, query):
+        return self.collection.delete_one(query, session=self.session)
+
+    def delete_many(self, query):
+        return self.collection.delete_many(query, session=self.session)
+
+    def bulk_write(self, requests, ordered=True):
+        return self.collection.bulk_write(requests, ordered=ordered, session=self.session)
+
+    def create_index(self, keys, **kwargs):
+        """
+        Index builds always go to the primary
+        """
+        return self.collection.create_index(keys, session=self.session, **kwargs)
+
+    def with_options(self, **kwargs):
+        return ReadRoutedCollection(self.collection.with_options(**kwargs), self.session, self.routes,
+                                    self.read_class)
+
+
+def read_view(collection, read_class):
+    """
+    collection with reads routed as read_class; collections without routing are returned as is
+    """
+    if isinstance(collection, ReadRoutedCollection):
+        return collection.for_class(read_class)
+    return collection
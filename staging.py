@@ -0,0 +1,106 @@
+"""
+Staged full reloads: the data is loaded into a fresh shadow collection with no
+secondary indexes, the indexes are built once at the end, the count is checked
+against the source file, and the shadow is renamed over the live collection in one
+step. Readers see the old data until the rename and the new data after it, never an
+empty or partial collection.
+"""
+
+import csv
+import time
+import uuid
+
+import pymongo
+
+import columnar
+from compact_schema import CompactCollection, translate_index_keys
+
+SHADOW_MARKER = "__staging_"
+# Secondary indexes of the live collections, rebuilt on the shadow before the swap
+# along with any others the live collection has (e.g. the unique email index)
+SECONDARY_INDEXES = {
+    "UserAccounts": [],
+    "StatusUpdates": [([("user_id", pymongo.ASCENDING)], {})],
+}
+# index_information() entries create_index accepts back as options
+INDEX_OPTIONS = ("unique", "sparse", "partialFilterExpression", "expireAfterSeconds", "collation")
+
+
+def source_row_count(filename):
+    """
+    Data rows in a CSV (header excluded) or Parquet file
+    """
+    if columnar.is_parquet(filename):
+        return columnar.open_parquet(filename).metadata.num_rows
+    with open(filename, encoding="utf-8", newline="") as file:
+        return max(sum(1 for _row in csv.reader(file)) - 1, 0)
+
+
+def drop_stale_shadows(database, table_name):
+    """
+    Drops shadows left behind by interrupted staged loads of table_name
+    """
+    for name in database.list_collection_names():
+        if name.startswith(table_name + SHADOW_MARKER):
+            database.drop_collection(name)
+
+
+def index_fields(keys, compact_keys=None):
+    """
+    create_index keys as the stored (field, direction) list, to compare with live_indexes
+    """
+    keys = [(keys, pymongo.ASCENDING)] if isinstance(keys, str) else list(keys)
+    return translate_index_keys(keys, compact_keys) if compact_keys else keys
+
+
+def live_indexes(collection):
+    """
+    The collection's secondary indexes as (keys, options) for create_index, under their own names
+    """
+    return [(list(info["key"]), {"name": name, **{option: info[option] for option in INDEX_OPTIONS if option in info}})
+            for name, info in collection.index_information().items() if name != "_id_"]
+
+
+def staged_load(database, table_name, load, source_rows, indexes=None, max_skipped=0.0, compact_keys=None):
+    """
+    Runs load(shadow_collection), builds indexes (default SECONDARY_INDEXES) plus the live
+    collection's own indexes and, if
+    the shadow holds between source_rows * (1 - max_skipped) and source_rows documents,
+    renames it over table_name. max_skipped allows for rows the loader drops on purpose.
+    With compact_keys the shadow stores the compact schema (see compact_schema).
+    Returns a report with rows, loaded, per-phase seconds and success; on failure the
+    live collection is untouched and the shadow is dropped.
+    """
+    drop_stale_shadows(database, table_name)
+    copied = live_indexes(database[table_name]) if table_name in database.list_collection_names() else []
+    # A fresh name per load: no collision with a leftover shadow or its index names
+    shadow_name = f"{table_name}{SHADOW_MARKER}{uuid.uuid4().hex[:8]}"
+    raw_shadow = shadow = database[shadow_name]
+    if compact_keys:
+        shadow = CompactCollection(shadow, compact_keys)
+    report = {"table": table_name, "rows": source_rows, "loaded": 0, "success": False}
+
+    start_time = time.perf_counter()
+    loaded_ok = load(shadow)
+    report["load_seconds"] = time.perf_counter() - start_time
+    if loaded_ok:
+        start_time = time.perf_counter()
+        # Copied indexes already use the stored (possibly compact) field names
+        for keys, options in copied:
+            raw_shadow.create_index(keys, **options)
+        copied_keys = [keys for keys, _options in copied]
+        for keys, options in SECONDARY_INDEXES.get(table_name, []) if indexes is None else indexes:
+            if index_fields(keys, compact_keys) not in copied_keys:
+                shadow.create_index(keys, **options)
+        report["index_seconds"] = time.perf_counter() - start_time
+        report["loaded"] = shadow.count_documents({})
+
+    if not loaded_ok or not source_rows * (1 - max_skipped) <= report["loaded"] <= source_rows:
+        print(f"Staged load of {table_name} failed: loaded {report['loaded']} of {source_rows} rows, "
+              f"live collection left unchanged")
+        database.drop_collection(shadow_name)
+        return report
+
+    shadow.rename(table_name, dropTarget=True)
+    report["success"] = True
+    return report
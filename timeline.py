@@ -0,0 +1,100 @@
+"""
+Materialized per-user timeline: one capped document per user holding the latest
+status IDs and texts, newest first, so "latest statuses" is a single _id lookup.
+
+Every status write has to reach the timeline: the main functions take it as an optional
+argument, and bulk paths that cannot fan out per status (delta sync) rebuild the
+timelines of the users they touched.
+"""
+
+from pymongo import DeleteOne, ReplaceOne, UpdateOne
+
+TIMELINE_TABLE = "StatusTimelines"
+DEFAULT_TIMELINE_SIZE = 20
+
+
+class StatusTimeline:
+    """
+    Fan-out-on-write timeline documents {"_id": user_id, "statuses": [{"_id", "status_text"}, ...]}
+    """
+
+    def __init__(self, database, size=DEFAULT_TIMELINE_SIZE):
+        self.database = database
+        self.size = size
+
+    def push(self, entries):
+        """
+        Update prepending entries (newest first) and capping the timeline at size
+        """
+        return {"$push": {"statuses": {"$each": entries, "$position": 0, "$slice": self.size}}}
+
+    def add(self, user_id, status_id, status_text):
+        """
+        Puts a new status at the top of the user's timeline
+        """
+        self.database.update_one({"_id": user_id}, self.push([{"_id": status_id, "status_text": status_text}]),
+                                 upsert=True)
+
+    def add_many(self, statuses):
+        """
+        Batched fan-out for bulk loads: one update per user, later rows counted as newer
+        """
+        entries = {}
+        for status in statuses:
+            entries.setdefault(status["user_id"], []).append({"_id": status["_id"],
+                                                              "status_text": status["status_text"]})
+        if entries:
+            self.database.bulk_write([UpdateOne({"_id": user_id}, self.push(user_entries[-self.size:][::-1]),
+                                                upsert=True)
+                                      for user_id, user_entries in entries.items()], ordered=False)
+
+    def modify(self, user_id, status_id, status_text):
+        """
+        Updates the text of a status if it is on the user's timeline
+        """
+        self.database.update_one({"_id": user_id, "statuses._id": status_id},
+                                 {"$set": {"statuses.$.status_text": status_text}})
+
+    def remove(self, user_id, status_id):
+        """
+        Takes a deleted status off the user's timeline; older statuses are not backfilled
+        """
+        self.database.update_one({"_id": user_id}, {"$pull": {"statuses": {"_id": status_id}}})
+
+    def delete_user(self, user_id):
+        """
+        Drops a deleted user's timeline
+        """
+        self.database.delete_one({"_id": user_id})
+
+    def users_with(self, status_ids):
+        """
+        IDs of the users whose timelines show any of status_ids
+        """
+        users = set()
+        for status_id in status_ids:
+            users.update(document["_id"] for document in self.database.find({"statuses._id": status_id}, {"_id": 1}))
+        return users
+
+    def rebuild(self, status_collection, user_ids):
+        """
+        Rewrites the timelines of user_ids from their stored statuses, later ones counted as newer
+        """
+        requests = []
+        for user_id in user_ids:
+            entries = [{"_id": status["_id"], "status_text": status["status_text"]}
+                       for status in status_collection.find({"user_id": user_id})]
+            if entries:
+                requests.append(ReplaceOne({"_id": user_id}, {"_id": user_id, "statuses": entries[-self.size:][::-1]},
+                                           upsert=True))
+            else:
+                requests.append(DeleteOne({"_id": user_id}))
+        if requests:
+            self.database.bulk_write(requests, ordered=False)
+
+    def latest(self, user_id):
+        """
+        The user's latest statuses, newest first
+        """
+        document = self.database.find_one({"_id": user_id})
+        return document["statuses"] if document else []
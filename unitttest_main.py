@@ -2,12 +2,34 @@
 Unittests for main.py
 """
 
+import importlib.util
+import io
+import os
+import tempfile
+import threading
+import time
 import unittest
 from unittest.mock import patch, MagicMock, mock_open, call
 
+import batch_lookup
+import cache_coherence
+import bson
+import compact_schema
+import dedup
+import email_index
+import export
 import pandas as pd
 import pymongo
 import main
+import memory_budget
+import validation
+import partitioning
+import profiling
+import read_routing
+import staging
+import timeline
+from bson.raw_bson import RawBSONDocument
+from user_directory import UserDirectory
 
 
 # pylint: disable = C0301
@@ -202,6 +224,58 @@ class TestMainUserFunctions(unittest.TestCase):
         result = main.search_user("SC", self.mock_user_collection)
         self.assertEqual(result["_id"], "SC")
 
+    def test_verify_bulk_load_resends_missing(self):
+        """
+        The verification pass re-sends only documents missing from the collection.
+        """
+        mock_collection = MagicMock()
+        mock_collection.find.return_value = [{"_id": "SC"}]
+        mock_collection.insert_many.return_value.inserted_ids = ["MC"]
+        documents = [{"_id": "SC"}, {"_id": "MC"}]
+
+        report = main.verify_bulk_load(mock_collection, documents)
+
+        mock_collection.insert_many.assert_called_once_with([{"_id": "MC"}], ordered=False)
+        self.assertEqual(report, {"checked": 2, "missing": 1, "resent": 1, "errors": 0, "duplicates": 0})
+
+    def test_load_users_bulk_ingest_reports_duplicates(self):
+        """
+        Repeated USER_IDs in the file fail a bulk ingest, as they fail the acknowledged path.
+        """
+        mock_dictreader = MagicMock()
+        mock_dictreader.__iter__.return_value = [
+            {"USER_ID": "SC", "EMAIL": "sesame@uw.edu", "NAME": "Sesame", "LASTNAME": "Chan"},
+            {"USER_ID": "SC", "EMAIL": "other@uw.edu", "NAME": "Other", "LASTNAME": "Chan"},
+        ]
+        self.mock_user_collection.find.return_value = [{"_id": "SC"}]
+
+        with patch("builtins.open", unittest.mock.mock_open()), patch(
+                "csv.DictReader", return_value=mock_dictreader
+        ):
+            result = main.load_users("test_users.csv", self.mock_user_collection, bulk_ingest=True)
+
+        self.assertFalse(result)
+
+    def test_load_users_bulk_ingest(self):
+        """
+        Bulk ingest writes through a relaxed write concern and then verifies.
+        """
+        mock_dictreader = MagicMock()
+        mock_dictreader.__iter__.return_value = [
+            {"USER_ID": "SC", "EMAIL": "sesame@uw.edu", "NAME": "Sesame", "LASTNAME": "Chan"},
+        ]
+        self.mock_user_collection.find.return_value = [{"_id": "SC"}]
+
+        with patch("builtins.open", unittest.mock.mock_open()), patch(
+                "csv.DictReader", return_value=mock_dictreader
+        ):
+            result = main.load_users("test_users.csv", self.mock_user_collection, bulk_ingest=True)
+
+        self.assertTrue(result)
+        self.mock_user_collection.with_options.assert_called_once_with(write_concern=main.BULK_WRITE_CONCERN)
+        self.mock_user_collection.with_options.return_value.insert_many.assert_called_once()
+        self.mock_user_collection.insert_many.assert_not_called()
+
 
 class TestMainStatusFunctions(unittest.TestCase):
     """
@@ -343,5 +417,1626 @@ class TestMainStatusFunctions(unittest.TestCase):
         result = main.search_status("status1", self.mock_status_collection)
         self.assertEqual(result["_id"], "status1")
 
+    def test_encode_status_batch_matches_bson(self):
+        """
+        Pre-encoded status buffers are byte-identical to pymongo's own encoding.
+        """
+        rows = [["Meow", "SC", "SC1"], ["Food! \u00e9", "SC", "SC2"]]
+        encoded = main.encode_status_batch(rows, order=(2, 1, 0))
+        self.assertEqual(encoded[1], bson.encode({"_id": "SC2", "user_id": "SC", "status_text": "Food! \u00e9"}))
+
+    @patch('builtins.open', new_callable=mock_open,
+           read_data="STATUS_ID,USER_ID,STATUS_TEXT\nSC1,SC,Meow\nSC2,SC,Food!\n")
+    def test_load_status_updates_raw(self, _mock_open_instance):
+        """
+        The raw loader hands RawBSONDocument batches to batch_load_statuses.
+        """
+        with patch("main.ProcessPoolExecutor", main.ThreadPoolExecutor):
+            result = main.load_status_updates_raw("test_status.csv", self.mock_status_collection)
+
+        self.assertTrue(result)
+        batch = self.mock_status_collection.batch_load_statuses.call_args[0][0]
+        self.assertEqual([dict(doc) for doc in batch], [
+            {"_id": "SC1", "user_id": "SC", "status_text": "Meow"},
+            {"_id": "SC2", "user_id": "SC", "status_text": "Food!"}
+        ])
+
+
+    @patch('builtins.open', new_callable=mock_open,
+           read_data="STATUS_ID,USER_ID,STATUS_TEXT\nSC1,SC,Meow\nSC2\n\nSC3,SC,Food!\n")
+    def test_load_status_updates_raw_skips_short_rows(self, _mock_open_instance):
+        """
+        A row missing columns is skipped and reported instead of crashing the load.
+        """
+        with patch("main.ProcessPoolExecutor", main.ThreadPoolExecutor), patch("builtins.print") as mock_print:
+            result = main.load_status_updates_raw("test_status.csv", self.mock_status_collection)
+
+        self.assertTrue(result)
+        batch = self.mock_status_collection.batch_load_statuses.call_args[0][0]
+        self.assertEqual([doc["_id"] for doc in batch], ["SC1", "SC3"])
+        mock_print.assert_called_once_with("Rejected 1 invalid rows")
+
+
+class TestMainMultiprocessLoad(unittest.TestCase):
+    """
+    Unit tests for the multiprocess loader's structured results.
+    """
+
+    def test_insert_batch_counted_duplicates(self):
+        """
+        Duplicate key write errors are counted rather than raised.
+        """
+        mock_collection = MagicMock()
+        mock_collection.insert_many.side_effect = pymongo.errors.BulkWriteError(
+            {"nInserted": 1, "writeErrors": [{"code": 11000}, {"code": 121}]})
+        result = main.insert_batch_counted(mock_collection, [{"_id": 1}, {"_id": 2}, {"_id": 3}])
+        self.assertEqual(result, (1, 1, 1))
+
+    @patch('main.pymongo.MongoClient')
+    def test_load_users_multiprocess_worker(self, mock_client):
+        """
+        The worker reports rows, inserted and duplicate counts back to the parent.
+        """
+        mock_collection = mock_client.return_value.__getitem__.return_value.__getitem__.return_value
+        mock_collection.insert_many.side_effect = lambda batch, ordered: MagicMock(
+            inserted_ids=[row["_id"] for row in batch])
+        data = pd.DataFrame([{"USER_ID": "SC", "EMAIL": "sesame@uw.edu", "NAME": "Sesame", "LASTNAME": "Chan"},
+                             {"USER_ID": "MC", "EMAIL": "mochi@uw.edu", "NAME": "Mochi", "LASTNAME": "Chan"}])
+        result = main.load_users_multiprocess_worker(data, "localhost", 27017, "databaseA07")
+        self.assertEqual(result["rows"], 2)
+        self.assertEqual(result["inserted"], 2)
+        self.assertEqual(result["errors"], 0)
+        mock_client.return_value.close.assert_called_once()
+
+    def test_worker_writes_compact_schema(self):
+        """
+        collection_options reach the worker's collection, e.g. the compact schema.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            connection_string = main.SQLITE_SCHEME + directory
+            data = pd.DataFrame([{"USER_ID": "SC", "EMAIL": "sesame@uw.edu", "NAME": "Sesame", "LASTNAME": "Chan"}])
+            result = main.load_users_multiprocess_worker(data, "localhost", 27017, main.DATABASE,
+                                                         connection_string=connection_string,
+                                                         collection_options={"compact": True})
+            self.assertEqual(result["inserted"], 1)
+            client = main.get_mongo_client(connection_string)
+            self.assertEqual(client[main.DATABASE]["UserAccounts"].find_one({"_id": "SC"})["e"], "sesame@uw.edu")
+            client.close()
+
+    def test_merge_load_results(self):
+        """
+        Worker results are summed and the success flag computed from them.
+        """
+        results = [main.worker_result(10, 10, 0, 0, 1.0), main.worker_result(5, 3, 2, 0, 1.0)]
+        report = main.merge_load_results(results, 2.0)
+        self.assertEqual(report["rows"], 15)
+        self.assertEqual(report["duplicates"], 2)
+        self.assertEqual(report["rows_per_sec"], 7.5)
+        self.assertTrue(report["success"])
+
+        results.append(main.worker_result(5, 4, 0, 1, 1.0))
+        self.assertFalse(main.merge_load_results(results, 2.0)["success"])
+
+
+class TestLoaderProfiling(unittest.TestCase):
+    """
+    Unit tests for the opt-in loader profiling hooks.
+    """
+
+    def tearDown(self):
+        profiling.disable()
+
+    def test_profiled_loader_writes_pstats_and_report(self):
+        """
+        A profiled loader writes its own .pstats file and the merged report.
+        """
+        mock_status_collection = MagicMock()
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "status.csv")
+            with open(filename, "w", encoding="utf-8") as file:
+                file.write("STATUS_ID,USER_ID,STATUS_TEXT\nSC1,SC,Meow\n")
+            profile_directory = os.path.join(directory, "profiles")
+            profiling.enable(profile_directory)
+
+            self.assertTrue(main.load_status_updates(filename, mock_status_collection))
+
+            files = os.listdir(profile_directory)
+            self.assertTrue(any(name.startswith("load_status_updates-") for name in files))
+            self.assertIn(profiling.MERGED_REPORT, files)
+
+    def test_merge_leaves_out_earlier_runs(self):
+        """
+        Each loader run merges only its own profiles, not those left by earlier runs.
+        """
+        mock_status_collection = MagicMock()
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "status.csv")
+            with open(filename, "w", encoding="utf-8") as file:
+                file.write("STATUS_ID,USER_ID,STATUS_TEXT\nSC1,SC,Meow\n")
+            profile_directory = os.path.join(directory, "profiles")
+            profiling.enable(profile_directory)
+
+            main.load_status_updates(filename, mock_status_collection)
+            main.load_status_updates(filename, mock_status_collection)
+
+            with open(os.path.join(profile_directory, profiling.MERGED_REPORT), encoding="utf-8") as report:
+                self.assertTrue(report.readline().startswith("Merged 1 profiles"))
+            self.assertNotIn(profiling.RUN_ENV, os.environ)
+
+    def test_one_profile_per_process(self):
+        """
+        Per-batch profiled helpers add to their worker's single profile instead of writing a file per call.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "status.csv")
+            with open(filename, "w", encoding="utf-8") as file:
+                file.write("STATUS_ID,USER_ID,STATUS_TEXT\n")
+                file.writelines(f"S{i},U{i % 7},Meow\n" for i in range(2000))
+            profile_directory = os.path.join(directory, "profiles")
+            profiling.enable(profile_directory)
+            status_collection = MagicMock()
+            status_collection.database = MagicMock(spec=[])
+
+            self.assertTrue(main.load_status_updates_raw(filename, status_collection, batch_size=100, processes=2))
+
+            files = [name for name in os.listdir(profile_directory) if name.endswith(".pstats")]
+            self.assertLessEqual(len(files), 3)
+            self.assertEqual(len({name.split("-")[1] for name in files}), len(files))
+            self.assertEqual(sum(name.startswith("load_status_updates_raw-") for name in files), 1)
+            with open(os.path.join(profile_directory, profiling.MERGED_REPORT), encoding="utf-8") as report:
+                self.assertTrue(report.readline().startswith(f"Merged {len(files)} profiles"))
+
+    def test_profiling_disabled_by_default(self):
+        """
+        Without the environment variable the loaders run unprofiled.
+        """
+        profiling.disable()
+        self.assertIsNone(profiling.profile_dir())
+
+
+class TestSQLiteBackend(unittest.TestCase):
+    """
+    The main.py functions running against the SQLite backend.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.client = main.get_mongo_client(main.SQLITE_SCHEME + self.directory.name)
+        self.user_collection = main.init_user_collection(self.client)
+        self.status_collection = main.init_status_collection(self.client)
+
+    def tearDown(self):
+        self.client.close()
+        self.directory.cleanup()
+
+    def test_user_and_status_round_trip(self):
+        """
+        Users and statuses can be added, updated, searched and cascade-deleted.
+        """
+        self.assertTrue(main.add_user("SC", "sesame@uw.edu", "Sesame", "Chan", self.user_collection))
+        self.assertFalse(main.add_user("SC", "sesame@uw.edu", "Sesame", "Chan", self.user_collection))
+        self.assertTrue(main.update_user("SC", "new@uw.edu", "Sesame", "Chan", self.user_collection))
+        self.assertEqual(main.search_user("SC", self.user_collection)["user_email"], "new@uw.edu")
+
+        self.assertTrue(main.add_status("SC", "SC1", "Meow", self.status_collection, self.user_collection))
+        self.assertFalse(main.add_status("XX", "XX1", "Meow", self.status_collection, self.user_collection))
+        self.assertTrue(main.update_status("SC1", "SC", "Food!", self.status_collection))
+        self.assertEqual(main.search_status("SC1", self.status_collection)["status_text"], "Food!")
+
+        self.assertTrue(main.delete_user("SC", self.user_collection, self.status_collection))
+        self.assertFalse(main.search_status("SC1", self.status_collection))
+
+    def test_insert_many_reports_duplicates(self):
+        """
+        Unordered bulk inserts skip duplicates and report them like pymongo does.
+        """
+        documents = [{"_id": "SC1", "user_id": "SC", "status_text": "Meow"},
+                     {"_id": "SC1", "user_id": "SC", "status_text": "Meow again"},
+                     {"_id": "SC2", "user_id": "SC", "status_text": "Food!"}]
+        self.assertEqual(main.insert_batch_counted(self.status_collection.database, documents), (2, 1, 0))
+        self.assertEqual(self.status_collection.database.count_documents({"user_id": "SC"}), 2)
+
+    def test_identifiers_quoted_and_field_names_checked(self):
+        """
+        Table names are quoted; field names that are not plain paths are rejected before reaching SQL.
+        """
+        collection = self.client[main.DATABASE]['Odd "name"']
+        collection.insert_one({"_id": "SC", "user_email": "sesame@uw.edu"})
+        self.assertEqual(collection.find_one({"user_email": "sesame@uw.edu"})["_id"], "SC")
+        with self.assertRaises(ValueError):
+            self.user_collection.find_one({"x') OR 1=1 --": "SC"})
+        with self.assertRaises(ValueError):
+            self.user_collection.create_index("user_email') --")
+
+    def test_upsert_and_unsupported_features(self):
+        """
+        update_one upserts from the query's _id; analytics reports the missing pipeline support.
+        """
+        result = self.user_collection.update_one({"_id": "SC"}, {"$set": {"user_name": "Sesame"}}, upsert=True)
+        self.assertEqual(result.upserted_id, "SC")
+        self.assertEqual(main.search_user("SC", self.user_collection), {"_id": "SC", "user_name": "Sesame"})
+        report, _users, _statuses = main.init_analytics(self.client)
+        with self.assertRaises(NotImplementedError):
+            list(report.statuses_per_user())
+
+
+class TestUserDirectory(unittest.TestCase):
+    """
+    Unit tests for in-memory user existence checks.
+    """
+
+    def setUp(self):
+        self.mock_user_collection = MagicMock()
+        self.mock_user_collection.find.return_value = [{"_id": "SC"}, {"_id": "AB"}]
+        self.directory = UserDirectory(self.mock_user_collection)
+
+    def test_add_status_uses_directory(self):
+        """
+        add_status checks the directory instead of calling find_one.
+        """
+        mock_status_collection = MagicMock()
+        main.add_status("SC", "SC1", "Meow", mock_status_collection, self.mock_user_collection, self.directory)
+        self.assertFalse(main.add_status("XX", "XX1", "Meow", mock_status_collection,
+                                         self.mock_user_collection, self.directory))
+        self.mock_user_collection.find_one.assert_not_called()
+        mock_status_collection.add_status.assert_called_once_with("SC1", "SC", "Meow")
+
+    def test_directory_follows_add_and_delete(self):
+        """
+        add_user and delete_user keep the directory fresh.
+        """
+        main.add_user("MC", "mochi@uw.edu", "Mochi", "Chan", self.mock_user_collection, self.directory)
+        self.assertIn("MC", self.directory)
+        self.mock_user_collection.delete_one.return_value.deleted_count = 1
+        main.delete_user("SC", self.mock_user_collection, MagicMock(), self.directory)
+        self.assertNotIn("SC", self.directory)
+        self.assertEqual(self.directory.ids, ["AB", "MC"])
+
+    def test_periodic_resync(self):
+        """
+        A stale directory reloads the user IDs on the next lookup.
+        """
+        self.directory.resync_interval = 0
+        self.mock_user_collection.find.return_value = [{"_id": "NEW"}]
+        self.assertIn("NEW", self.directory)
+
+    def test_non_string_ids_and_changes_during_resync(self):
+        """
+        IDs of any type are stored as strings; adds and discards made during a resync survive it.
+        """
+        def find(_query, _projection):
+            self.directory.add(bson.ObjectId("0123456789ab0123456789ab"))
+            self.directory.discard("AB")
+            return [{"_id": "SC"}, {"_id": "AB"}]
+
+        self.mock_user_collection.find.side_effect = find
+        self.directory.resync()
+        self.assertIn(bson.ObjectId("0123456789ab0123456789ab"), self.directory)
+        self.assertNotIn("AB", self.directory)
+        self.assertEqual(self.directory.ids, ["0123456789ab0123456789ab", "SC"])
+
+    def test_from_ids_matches_repeated_adds(self):
+        """
+        A directory built in bulk holds the same sorted, de-duplicated IDs as one built by add().
+        """
+        ids = ["MC", "SC", 7, "AB", "SC"]
+        added = UserDirectory()
+        for user_id in ids:
+            added.add(user_id)
+        bulk = UserDirectory.from_ids(ids)
+        self.assertEqual(bulk.ids, added.ids)
+        self.assertIn(7, bulk)
+        self.assertNotIn("ZZ", bulk)
+
+
+class TestDeduplication(unittest.TestCase):
+    """
+    Unit tests for the in-file deduplication pre-pass.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, "accounts.csv")
+        with open(self.filename, "w", encoding="utf-8") as file:
+            file.write("USER_ID,EMAIL,NAME,LASTNAME\n"
+                       "SC,sesame@uw.edu,Sesame,Chan\n"
+                       "MC,mochi@uw.edu,Mochi,Chan\n"
+                       "SC,sesame2@uw.edu,Sesame,Chan\n")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_load_users_first_wins(self):
+        """
+        Duplicates are dropped before insert_many and reported with line numbers.
+        """
+        mock_user_collection = MagicMock()
+        with patch("builtins.print") as mock_print:
+            self.assertTrue(main.load_users(self.filename, mock_user_collection, dedupe="first"))
+        batch = mock_user_collection.insert_many.call_args[0][0]
+        self.assertEqual([(user["_id"], user["user_email"]) for user in batch],
+                         [("SC", "sesame@uw.edu"), ("MC", "mochi@uw.edu")])
+        mock_print.assert_called_once_with("Duplicate USER_ID SC on line 4 (kept line 2)")
+
+    def test_last_wins_with_spill(self):
+        """
+        Last-wins keeps the final occurrence, also once the key store spills to disk.
+        """
+        duplicates = []
+        rows = list(dedup.read_csv_deduplicated(self.filename, "USER_ID", dedup.LAST_WINS,
+                                                duplicates, max_keys=1))
+        self.assertEqual([row["EMAIL"] for row in rows], ["mochi@uw.edu", "sesame2@uw.edu"])
+        self.assertEqual(duplicates, [{"key": "SC", "line": 2, "kept_line": 4}])
+
+    def test_invalid_row_does_not_win(self):
+        """
+        A row missing a field is dropped before dedup, so a later valid duplicate is kept.
+        """
+        with open(self.filename, "w", encoding="utf-8") as file:
+            file.write("USER_ID,EMAIL,NAME,LASTNAME\n"
+                       "SC,,Sesame,Chan\n"
+                       "SC,sesame@uw.edu,Sesame,Chan\n")
+        mock_user_collection = MagicMock()
+        self.assertTrue(main.load_users(self.filename, mock_user_collection, dedupe="first"))
+        batch = mock_user_collection.insert_many.call_args[0][0]
+        self.assertEqual([user["user_email"] for user in batch], ["sesame@uw.edu"])
+
+    def test_multiprocess_load_deduplicates(self):
+        """
+        The multiprocess loader drops repeated USER_IDs before building worker chunks.
+        """
+        with patch("main.ProcessPoolExecutor", main.ThreadPoolExecutor), patch("builtins.print"):
+            report = main.load_users_multiprocess(self.filename, return_report=True, dedupe="last",
+                                                  connection_string=main.SQLITE_SCHEME + self.directory.name)
+        self.assertEqual((report["rows"], report["inserted"], report["duplicates"]), (2, 2, 0))
+        client = main.get_mongo_client(main.SQLITE_SCHEME + self.directory.name)
+        self.assertEqual(main.search_user("SC", main.init_user_collection(client))["user_email"],
+                         "sesame2@uw.edu")
+        client.close()
+
+
+class TestChunkValidation(unittest.TestCase):
+    """
+    Unit tests for vectorized chunk validation.
+    """
+
+    def test_swapped_columns_detected_by_content(self):
+        """
+        The shipped accounts.csv header order is corrected from the data itself.
+        """
+        chunk = pd.DataFrame([["Larisa.Yesima75", "Larisa", "Yesima", "Larisa.Yesima75@testmail.com"]],
+                             columns=["USER_ID", "EMAIL", "NAME", "LASTNAME"])
+        valid, rejected = validation.prepare_chunk(chunk, validation.USER_SCHEMA)
+        self.assertTrue(rejected.empty)
+        self.assertEqual(valid.iloc[0]["EMAIL"], "Larisa.Yesima75@testmail.com")
+        self.assertEqual(valid.iloc[0]["NAME"], "Larisa")
+        self.assertEqual(valid.iloc[0]["LASTNAME"], "Yesima")
+
+    def test_bad_rows_routed_to_reject_file(self):
+        """
+        Rows with missing fields or a malformed email go to the reject file, the rest are loaded.
+        """
+        mock_user_collection = MagicMock()
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "accounts.csv")
+            reject_file = os.path.join(directory, "rejects.csv")
+            with open(filename, "w", encoding="utf-8") as file:
+                file.write("user_id,email,name,lastname\n"
+                           "SC,sesame@uw.edu,Sesame,Chan\n"
+                           "MC,not-an-email,Mochi,Chan\n"
+                           ",nobody@uw.edu,No,Body\n")
+            with patch("builtins.print"):
+                self.assertTrue(main.load_users(filename, mock_user_collection, validate=True,
+                                                reject_file=reject_file))
+            rejects = pd.read_csv(reject_file, keep_default_na=False)
+
+        self.assertEqual([user["_id"] for user in mock_user_collection.insert_many.call_args[0][0]], ["SC"])
+        self.assertEqual(rejects["LINE"].tolist(), [3, 4])
+        self.assertEqual(rejects[validation.REJECT_REASON].tolist(), ["malformed EMAIL", "missing USER_ID"])
+
+
+class TestDeltaSync(unittest.TestCase):
+    """
+    Delta sync of CSV snapshots, run against the SQLite backend.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.client = main.get_mongo_client(main.SQLITE_SCHEME + self.directory.name)
+        self.user_collection = main.init_user_collection(self.client)
+        self.filename = os.path.join(self.directory.name, "accounts.csv")
+        self.store_path = os.path.join(self.directory.name, "fingerprints.sqlite3")
+
+    def tearDown(self):
+        self.client.close()
+        self.directory.cleanup()
+
+    def write_snapshot(self, rows):
+        """
+        Writes an accounts snapshot
+        """
+        with open(self.filename, "w", encoding="utf-8") as file:
+            file.write("USER_ID,EMAIL,NAME,LASTNAME\n")
+            for row in rows:
+                file.write(",".join(row) + "\n")
+
+    def test_only_changes_are_sent(self):
+        """
+        The second sync sends only the new, changed and deleted users.
+        """
+        self.write_snapshot([("SC", "sesame@uw.edu", "Sesame", "Chan"), ("MC", "mochi@uw.edu", "Mochi", "Chan"),
+                             ("AB", "abby@uw.edu", "Abby", "Bee")])
+        report = main.sync_users(self.filename, self.user_collection, self.store_path)
+        self.assertEqual((report["new"], report["changed"], report["deleted"]), (3, 0, 0))
+
+        self.write_snapshot([("SC", "sesame@uw.edu", "Sesame", "Chan"), ("MC", "new@uw.edu", "Mochi", "Chan"),
+                             ("ZZ", "zed@uw.edu", "Zed", "Zee")])
+        with patch.object(self.user_collection, "bulk_write", wraps=self.user_collection.bulk_write) as bulk_write:
+            report = main.sync_users(self.filename, self.user_collection, self.store_path)
+
+        self.assertEqual((report["new"], report["changed"], report["deleted"], report["unchanged"]), (1, 1, 1, 1))
+        self.assertEqual(len(bulk_write.call_args[0][0]), 3)
+        self.assertEqual(main.search_user("MC", self.user_collection)["user_email"], "new@uw.edu")
+        self.assertIsNone(main.search_user("AB", self.user_collection))
+        self.assertEqual(self.user_collection.count_documents({}), 3)
+
+    def test_truncated_rows_skipped_and_kept(self):
+        """
+        Short rows are skipped and counted in both passes; a stored user whose row is
+        truncated is neither changed nor deleted.
+        """
+        self.write_snapshot([("SC", "sesame@uw.edu", "Sesame", "Chan"), ("MC", "mochi@uw.edu", "Mochi", "Chan")])
+        main.sync_users(self.filename, self.user_collection, self.store_path)
+
+        self.write_snapshot([("SC", "new@uw.edu", "Sesame", "Chan"), ("MC", "other@uw.edu"), ("ZZ",)])
+        with patch("builtins.print"):
+            report = main.sync_users(self.filename, self.user_collection, self.store_path)
+        self.assertEqual((report["changed"], report["deleted"], report["unchanged"], report["skipped"]),
+                         (1, 0, 0, 2))
+        self.assertTrue(report["success"])
+        self.assertEqual(main.search_user("MC", self.user_collection)["user_email"], "mochi@uw.edu")
+        self.assertIsNone(main.search_user("ZZ", self.user_collection))
+
+        # MC's stored fingerprint survived, so a complete row again is unchanged
+        self.write_snapshot([("SC", "new@uw.edu", "Sesame", "Chan"), ("MC", "mochi@uw.edu", "Mochi", "Chan")])
+        report = main.sync_users(self.filename, self.user_collection, self.store_path)
+        self.assertEqual((report["changed"], report["unchanged"], report["skipped"]), (0, 2, 0))
+
+
+class TestPartitionedStatuses(unittest.TestCase):
+    """
+    Hash-partitioned statuses over several local SQLite stand-in instances.
+    """
+
+    def setUp(self):
+        self.directories = [tempfile.TemporaryDirectory() for _ in range(3)]
+        self.status_collection = main.init_partitioned_status_collection(
+            [main.SQLITE_SCHEME + directory.name for directory in self.directories])
+        self.partitions = self.status_collection.database.partitions
+
+    def tearDown(self):
+        self.status_collection.database.close()
+        for directory in self.directories:
+            directory.cleanup()
+
+    def test_bulk_load_groups_by_partition(self):
+        """
+        Each status lands in its user's partition; cross-partition reads fan out.
+        """
+        statuses = [{"_id": f"U{i}_{j}", "user_id": f"U{i}", "status_text": "Meow"}
+                    for i in range(20) for j in range(3)]
+        self.assertTrue(self.status_collection.batch_load_statuses(statuses))
+
+        for number, partition in enumerate(self.partitions):
+            for status in partition.find({}):
+                self.assertEqual(partitioning.partition_index(status["user_id"], 3), number)
+        self.assertTrue(all(partition.count_documents({}) for partition in self.partitions))
+        self.assertEqual(self.status_collection.database.count_documents({}), 60)
+        self.assertEqual(main.search_status("U7_2", self.status_collection)["user_id"], "U7")
+
+    def test_single_key_operations_route_to_one_partition(self):
+        """
+        Updates and user deletes carrying user_id touch only that user's partition.
+        """
+        self.status_collection.add_status("U1_1", "U1", "Meow")
+        home = self.status_collection.database.partition_for("U1")
+        others = [partition for partition in self.partitions if partition is not home]
+        with patch.object(others[0], "update_one") as other_update:
+            self.assertTrue(main.update_status("U1_1", "U1", "Food!", self.status_collection))
+        other_update.assert_not_called()
+        self.assertEqual(home.find_one({"_id": "U1_1"})["status_text"], "Food!")
+        self.assertEqual(self.status_collection.delete_many({"user_id": "U1"}).deleted_count, 1)
+
+    def test_ids_unique_across_partitions_and_ordered_inserts(self):
+        """
+        An _id stored for one user cannot be inserted for a user in another partition;
+        an ordered insert stops at the first duplicate.
+        """
+        collection = self.status_collection.database
+        other_user = next(f"U{i}" for i in range(2, 100)
+                          if partitioning.partition_index(f"U{i}", 3) != partitioning.partition_index("U1", 3))
+        collection.insert_one({"_id": "S1", "user_id": "U1", "status_text": "Meow"})
+        with self.assertRaises(pymongo.errors.DuplicateKeyError):
+            collection.insert_one({"_id": "S1", "user_id": other_user, "status_text": "Meow"})
+
+        with self.assertRaises(pymongo.errors.BulkWriteError) as raised:
+            collection.insert_many([{"_id": "S2", "user_id": other_user, "status_text": "Food!"},
+                                    {"_id": "S1", "user_id": other_user, "status_text": "Meow"},
+                                    {"_id": "S3", "user_id": other_user, "status_text": "Nap"}])
+        self.assertEqual(raised.exception.details["nInserted"], 1)
+        self.assertEqual([error["index"] for error in raised.exception.details["writeErrors"]], [1])
+        self.assertEqual(collection.count_documents({}), 2)
+        self.assertEqual(collection.find_one({"_id": "S1"})["user_id"], "U1")
+
+
+    def test_raw_load_into_compact_partitions(self):
+        """
+        The raw BSON loader writes short keys into compact partitions, routed by the short user_id.
+        """
+        status_collection = main.init_partitioned_status_collection(
+            [main.SQLITE_SCHEME + directory.name for directory in self.directories], "CompactStatuses", compact=True)
+        filename = os.path.join(self.directories[0].name, "statuses.csv")
+        with open(filename, "w", encoding="utf-8") as file:
+            file.write("STATUS_ID,USER_ID,STATUS_TEXT\n")
+            file.writelines(f"U{i}_1,U{i},Meow\n" for i in range(20))
+        self.assertTrue(main.load_status_updates_raw(filename, status_collection, processes=1))
+
+        for number, partition in enumerate(status_collection.database.partitions):
+            for status in partition.collection.find({}):
+                self.assertEqual(set(status), {"_id", "u", "t"})
+                self.assertEqual(partitioning.partition_index(status["u"], 3), number)
+        self.assertEqual(main.search_status("U7_1", status_collection)["user_id"], "U7")
+        self.assertEqual(status_collection.delete_many({"user_id": "U7"}).deleted_count, 1)
+        status_collection.database.close()
+
+        # Raw BSON under full names is re-keyed rather than stored as is
+        compact = compact_schema.CompactCollection(MagicMock(), compact_schema.STATUS_KEYS)
+        raw = RawBSONDocument(bson.encode({"_id": "S1", "user_id": "U1", "status_text": "Meow"}))
+        self.assertEqual(compact.compact(raw), {"_id": "S1", "u": "U1", "t": "Meow"})
+
+
+class TestReadRouting(unittest.TestCase):
+    """
+    Unit tests for per-operation read routing.
+    """
+
+    def setUp(self):
+        self.mock_client = MagicMock()
+        self.mock_session = self.mock_client.start_session.return_value
+        routes = {"search": {"mode": "secondary", "tag_sets": [{"dc": "east"}]},
+                  "existence": {"mode": "primaryPreferred"}}
+        self.user_collection, self.status_collection = main.init_read_routed_collections(self.mock_client, routes)
+        self.mock_collection = self.mock_client.__getitem__.return_value.__getitem__.return_value
+
+    def test_search_reads_use_configured_preference(self):
+        """
+        search_user reads through the search route, in the causal session.
+        """
+        main.search_user("SC", self.user_collection)
+        self.mock_client.start_session.assert_called_once_with(causal_consistency=True)
+        preference = self.mock_collection.with_options.call_args.kwargs["read_preference"]
+        self.assertEqual(preference.mongos_mode, "secondary")
+        self.assertEqual(preference.tag_sets, [{"dc": "east"}])
+        self.mock_collection.with_options.return_value.find_one.assert_called_once_with(
+            {"_id": "SC"}, None, session=self.mock_session)
+
+    def test_writes_stay_on_primary_in_session(self):
+        """
+        Writes skip the read preference and share the session with the reads.
+        """
+        main.add_status("SC", "SC1", "Meow", self.status_collection, self.user_collection)
+        modes = [call.kwargs["read_preference"].mongos_mode for call in self.mock_collection.with_options.call_args_list]
+        # user existence check, then the status pre-insert check, both through the existence route
+        self.assertEqual(modes, ["primaryPreferred", "primaryPreferred"])
+        self.mock_collection.with_options.return_value.find_one.return_value = None
+        main.add_user("MC", "mochi@uw.edu", "Mochi", "Chan", self.user_collection)
+        self.mock_collection.insert_one.assert_called_with(
+            {"_id": "MC", "user_email": "mochi@uw.edu", "user_name": "Mochi", "user_last_name": "Chan"},
+            session=self.mock_session)
+
+    def test_class_views_are_reused(self):
+        """
+        read_view returns the same routed view each time, so read preferences are built once.
+        """
+        view = read_routing.read_view(self.user_collection, "search")
+        self.assertIs(read_routing.read_view(self.user_collection, "search"), view)
+        main.search_user("SC", self.user_collection)
+        main.search_user("MC", self.user_collection)
+        self.mock_collection.with_options.assert_called_once()
+
+
+class TestAnalytics(unittest.TestCase):
+    """
+    Unit tests for the cached aggregation analytics.
+    """
+
+    def setUp(self):
+        self.mock_client = MagicMock()
+        self.mock_db = self.mock_client.__getitem__.return_value
+        self.mock_collection = self.mock_db.__getitem__.return_value
+        self.mock_collection.aggregate.side_effect = lambda *args, **kwargs: iter([{"_id": "SC", "statuses": 3}])
+        self.report, self.user_collection, self.status_collection = main.init_analytics(self.mock_client)
+
+    def test_results_cached_until_write(self):
+        """
+        A repeated query is served from cache; a status write invalidates it.
+        """
+        self.assertEqual(list(self.report.top_posters(5)), [{"_id": "SC", "statuses": 3}])
+        self.assertEqual(list(self.report.top_posters(5)), [{"_id": "SC", "statuses": 3}])
+        self.assertEqual(self.mock_collection.aggregate.call_count, 1)
+        self.assertTrue(self.mock_collection.aggregate.call_args.kwargs["allowDiskUse"])
+
+        self.mock_collection.find_one.side_effect = lambda query, *args: query if query["_id"] == "SC" else None
+        main.add_status("SC", "SC4", "Meow", self.status_collection, self.user_collection)
+        list(self.report.top_posters(5))
+        self.assertEqual(self.mock_collection.aggregate.call_count, 2)
+
+    def test_large_results_are_not_cached(self):
+        """
+        Results over the row cap are streamed every time rather than kept.
+        """
+        self.report.max_cached_rows = 0
+        list(self.report.statuses_per_user())
+        list(self.report.statuses_per_user())
+        self.assertEqual(self.mock_collection.aggregate.call_count, 2)
+
+    def test_length_distribution_tolerates_missing_text(self):
+        """
+        Statuses without status_text are measured as empty instead of failing the pipeline.
+        """
+        list(self.report.status_length_distribution())
+        pipeline = self.mock_collection.aggregate.call_args[0][0]
+        self.assertEqual(pipeline[0]["$bucket"]["groupBy"], {"$strLenCP": {"$ifNull": ["$status_text", ""]}})
+
+
+class TestStatusTimeline(unittest.TestCase):
+    """
+    Unit tests for the materialized per-user timeline.
+    """
+
+    def setUp(self):
+        self.mock_timeline_collection = MagicMock()
+        self.timeline = timeline.StatusTimeline(self.mock_timeline_collection, size=2)
+        self.mock_status_collection = MagicMock()
+
+    def test_add_status_pushes_capped_entry(self):
+        """
+        A new status is pushed to the top of the timeline, capped at size.
+        """
+        mock_user_collection = MagicMock()
+        self.mock_status_collection.add_status.return_value = True
+        main.add_status("SC", "SC1", "Meow", self.mock_status_collection, mock_user_collection,
+                        timeline=self.timeline)
+        self.mock_timeline_collection.update_one.assert_called_once_with(
+            {"_id": "SC"},
+            {"$push": {"statuses": {"$each": [{"_id": "SC1", "status_text": "Meow"}], "$position": 0, "$slice": 2}}},
+            upsert=True)
+
+    def test_bulk_load_batches_one_update_per_user(self):
+        """
+        A loaded batch becomes one upsert per user with the newest statuses first.
+        """
+        self.timeline.add_many([{"_id": f"SC{i}", "user_id": "SC", "status_text": str(i)} for i in range(3)]
+                               + [{"_id": "MC1", "user_id": "MC", "status_text": "Food!"}])
+        requests = self.mock_timeline_collection.bulk_write.call_args[0][0]
+        self.assertEqual(len(requests), 2)
+        self.assertEqual(requests[0]._doc["$push"]["statuses"]["$each"],  # pylint: disable = W0212
+                         [{"_id": "SC2", "status_text": "2"}, {"_id": "SC1", "status_text": "1"}])
+
+    def test_delete_status_and_user_cascade(self):
+        """
+        delete_status pulls the entry and delete_user drops the timeline.
+        """
+        self.mock_status_collection.search_status.return_value = {"_id": "SC1", "user_id": "SC"}
+        self.mock_status_collection.delete_status.return_value = True
+        self.assertTrue(main.delete_status("SC1", self.mock_status_collection, self.timeline))
+        self.mock_timeline_collection.update_one.assert_called_once_with(
+            {"_id": "SC"}, {"$pull": {"statuses": {"_id": "SC1"}}})
+
+        mock_user_collection = MagicMock()
+        mock_user_collection.delete_one.return_value.deleted_count = 1
+        with patch("builtins.print"):
+            main.delete_user("SC", mock_user_collection, self.mock_status_collection, timeline=self.timeline)
+        self.mock_timeline_collection.delete_one.assert_called_once_with({"_id": "SC"})
+
+    def test_latest_statuses_single_lookup(self):
+        """
+        Reading the latest statuses is one _id lookup.
+        """
+        self.mock_timeline_collection.find_one.return_value = {"_id": "SC", "statuses": [{"_id": "SC1"}]}
+        self.assertEqual(main.latest_statuses("SC", self.timeline), [{"_id": "SC1"}])
+        self.mock_timeline_collection.find_one.assert_called_once_with({"_id": "SC"})
+
+    def test_sqlite_timeline_and_reloads(self):
+        """
+        On the SQLite backend, reloading a file leaves timelines unchanged; edits and deletes follow.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            client = main.get_mongo_client(main.SQLITE_SCHEME + directory)
+            status_collection = main.init_status_collection(client)
+            user_collection = main.init_user_collection(client)
+            status_timeline = main.init_timeline(client, size=2)
+            filename = os.path.join(directory, "status.csv")
+            with open(filename, "w", encoding="utf-8") as file:
+                file.write("STATUS_ID,USER_ID,STATUS_TEXT\nSC1,SC,Meow\nSC2,SC,Food!\nSC3,SC,Nap\n")
+
+            self.assertTrue(main.load_status_updates(filename, status_collection, timeline=status_timeline))
+            self.assertTrue(main.load_status_updates(filename, status_collection, timeline=status_timeline))
+            self.assertEqual(main.latest_statuses("SC", status_timeline),
+                             [{"_id": "SC3", "status_text": "Nap"}, {"_id": "SC2", "status_text": "Food!"}])
+
+            main.add_user("SC", "sesame@uw.edu", "Sesame", "Chan", user_collection)
+            self.assertTrue(main.add_status("SC", "SC4", "Meow!", status_collection, user_collection,
+                                            timeline=status_timeline))
+            self.assertTrue(main.update_status("SC3", "SC", "Long nap", status_collection, status_timeline))
+            self.assertTrue(main.delete_status("SC4", status_collection, status_timeline))
+            self.assertEqual(main.latest_statuses("SC", status_timeline), [{"_id": "SC3", "status_text": "Long nap"}])
+            client.close()
+
+    def test_sqlite_timeline_after_raw_load_and_delta_sync(self):
+        """
+        The raw loader fans out what it inserted; a delta sync rebuilds the timelines it touched.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            client = main.get_mongo_client(main.SQLITE_SCHEME + directory)
+            status_collection = main.init_status_collection(client)
+            status_timeline = main.init_timeline(client, size=2)
+            filename = os.path.join(directory, "status.csv")
+            store_path = os.path.join(directory, "fingerprints.sqlite3")
+            with open(filename, "w", encoding="utf-8") as file:
+                file.write("STATUS_ID,USER_ID,STATUS_TEXT\nSC1,SC,Meow\nSC2,SC,Food!\nMC1,MC,Purr\n")
+            self.assertTrue(main.load_status_updates_raw(filename, status_collection, batch_size=1, processes=1,
+                                                         timeline=status_timeline))
+            self.assertTrue(main.load_status_updates_raw(filename, status_collection, processes=1,
+                                                         timeline=status_timeline))
+            self.assertEqual(main.latest_statuses("SC", status_timeline),
+                             [{"_id": "SC2", "status_text": "Food!"}, {"_id": "SC1", "status_text": "Meow"}])
+
+            main.sync_status_updates(filename, status_collection, store_path, status_timeline)
+            # SC2 edited, SC1 moved to MC, MC1 deleted
+            with open(filename, "w", encoding="utf-8") as file:
+                file.write("STATUS_ID,USER_ID,STATUS_TEXT\nSC1,MC,Meow\nSC2,SC,Long nap\n")
+            self.assertTrue(main.sync_status_updates(filename, status_collection, store_path,
+                                                     status_timeline)["success"])
+            self.assertEqual(main.latest_statuses("SC", status_timeline), [{"_id": "SC2", "status_text": "Long nap"}])
+            self.assertEqual(main.latest_statuses("MC", status_timeline), [{"_id": "SC1", "status_text": "Meow"}])
+            client.close()
+
+
+class CountingStatusCollection:
+    """
+    Stand-in status collection that only counts rows, so it holds no memory itself
+    """
+
+    def __init__(self):
+        self.rows = 0
+
+    def batch_load_statuses(self, data):
+        """
+        Counts a loaded batch
+        """
+        self.rows += len(data)
+        return True
+
+
+class TestMemoryBudget(unittest.TestCase):
+    """
+    Unit tests for memory-budgeted loading.
+    """
+
+    def test_plan_fits_budget(self):
+        """
+        Chunk size and workers shrink with the budget.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "status.csv")
+            with open(filename, "w", encoding="utf-8") as file:
+                file.write("STATUS_ID,USER_ID,STATUS_TEXT\n" + "SC_1,SC,Meow\n" * 50)
+            rss = memory_budget.process_rss()
+            tight = memory_budget.plan_load(filename, int((rss + 8 * 1024 ** 2) / memory_budget.HIGH_WATER),
+                                            processes=4, worker_base=0)
+            roomy = memory_budget.plan_load(filename, int((rss + 512 * 1024 ** 2) / memory_budget.HIGH_WATER),
+                                            processes=4, worker_base=0)
+        self.assertLess(tight["chunk_size"], roomy["chunk_size"])
+        self.assertLessEqual(tight["chunk_size"] * tight["row_cost"] * tight["in_flight"], 8 * 1024 ** 2)
+        self.assertEqual(memory_budget.parse_size("512M"), 512 * 1024 ** 2)
+
+    def test_large_file_under_tight_limit(self):
+        """
+        A synthetic 300k-row status file loads completely while RSS stays under a tight budget.
+        """
+        rows = 300_000
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "status.csv")
+            with open(filename, "w", encoding="utf-8") as file:
+                file.write("STATUS_ID,USER_ID,STATUS_TEXT\n")
+                for i in range(rows):
+                    file.write(f"User.Name{i % 2000}_{i:06d},User.Name{i % 2000},Status text number {i}\n")
+            budget = memory_budget.process_rss() + 40 * 1024 ** 2
+            status_collection = CountingStatusCollection()
+            peak = [0]
+            loading = threading.Event()
+
+            def sample_rss():
+                while not loading.is_set():
+                    peak[0] = max(peak[0], memory_budget.process_rss())
+                    loading.wait(0.005)
+
+            sampler = threading.Thread(target=sample_rss)
+            sampler.start()
+            try:
+                result = main.load_status_updates(filename, status_collection, memory_budget=budget)
+            finally:
+                loading.set()
+                sampler.join()
+
+        self.assertTrue(result)
+        self.assertEqual(status_collection.rows, rows)
+        self.assertLess(peak[0], budget)
+
+    def test_multiprocess_user_load_follows_plan(self):
+        """
+        load_users_multiprocess under a budget runs the planned workers and chunk size, and the
+        per-chunk worker results merge into one report.
+        """
+        budget = int((memory_budget.process_rss() + 8 * 1024 ** 2) / memory_budget.HIGH_WATER)
+        plans = []
+
+        def record_plan(*args, **kwargs):
+            plans.append(memory_budget.plan_load(*args, **kwargs))
+            return plans[-1]
+
+        with tempfile.TemporaryDirectory() as directory, \
+                patch("main.plan_load", side_effect=record_plan), \
+                patch("main.ProcessPoolExecutor", wraps=main.ProcessPoolExecutor) as executor, \
+                patch("main.merge_load_results", wraps=main.merge_load_results) as merge_load_results:
+            report = main.load_users_multiprocess("accounts.csv", connection_string=main.SQLITE_SCHEME + directory,
+                                                  return_report=True, memory_budget=budget)
+            client = main.get_mongo_client(main.SQLITE_SCHEME + directory)
+            self.assertEqual(main.init_user_collection(client).count_documents({}), 2000)
+            client.close()
+
+        self.assertEqual(len(plans), 1)
+        plan = plans[0]
+        self.assertEqual(executor.call_args.kwargs["max_workers"], plan["workers"])
+        results = merge_load_results.call_args[0][0]
+        self.assertEqual(len(results), -(-2000 // plan["chunk_size"]))
+        self.assertGreater(len(results), 1)
+        self.assertTrue(all(result["rows"] <= plan["chunk_size"] for result in results))
+        self.assertEqual((report["rows"], report["inserted"], report["duplicates"], report["errors"]),
+                         (2000, 2000, 0, 0))
+        self.assertTrue(report["success"])
+
+
+class TestExport(unittest.TestCase):
+    """
+    Unit tests for the parallel streaming export.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.client = main.get_mongo_client(main.SQLITE_SCHEME + self.directory.name)
+        self.user_collection = main.init_user_collection(self.client)
+        self.status_collection = main.init_status_collection(self.client)
+        self.accounts = os.path.join(self.directory.name, "accounts.csv")
+        with open(self.accounts, "w", encoding="utf-8") as file:
+            file.write("USER_ID,EMAIL,NAME,LASTNAME\n")
+            for i in range(40):
+                file.write(f"User{i:02d},user{i}@uw.edu,Name{i},Last{i}\n")
+        self.statuses = os.path.join(self.directory.name, "status_updates.csv")
+        with open(self.statuses, "w", encoding="utf-8") as file:
+            file.write("STATUS_ID,USER_ID,STATUS_TEXT\n")
+            for i in range(200):
+                file.write(f'User{i % 40:02d}_{i:03d},User{i % 40:02d},"Meow, said ""cat"" {i}"\n')
+        main.load_users(self.accounts, self.user_collection)
+        main.load_status_updates(self.statuses, self.status_collection)
+
+    def tearDown(self):
+        self.client.close()
+        self.directory.cleanup()
+
+    def test_csv_round_trip(self):
+        """
+        An exported CSV, scanned in several ranges, loads back into identical collections.
+        """
+        users_out = os.path.join(self.directory.name, "users_out.csv")
+        statuses_out = os.path.join(self.directory.name, "statuses_out.csv")
+        self.assertEqual(main.export_users(users_out, self.user_collection, parts=3, batch_size=7), 40)
+        self.assertEqual(main.export_status_updates(statuses_out, self.status_collection, parts=3, batch_size=7),
+                         200)
+
+        os.makedirs(os.path.join(self.directory.name, "copy"))
+        copy = main.get_mongo_client(main.SQLITE_SCHEME + os.path.join(self.directory.name, "copy"))
+        try:
+            user_copy = main.init_user_collection(copy)
+            status_copy = main.init_status_collection(copy)
+            self.assertTrue(main.load_users(users_out, user_copy))
+            self.assertTrue(main.load_status_updates(statuses_out, status_copy))
+            self.assertEqual(sorted(user_copy.find({}), key=lambda d: d["_id"]),
+                             sorted(self.user_collection.find({}), key=lambda d: d["_id"]))
+            self.assertEqual(sorted(status_copy.database.find({}), key=lambda d: d["_id"]),
+                             sorted(self.status_collection.database.find({}), key=lambda d: d["_id"]))
+        finally:
+            copy.close()
+
+    def test_split_ranges_cover_all_ids(self):
+        """
+        The _id ranges are disjoint and together cover the collection.
+        """
+        ranges = export.split_ranges(self.status_collection.database, 4)
+        self.assertEqual(len(ranges), 5)
+        self.assertEqual(ranges[-1], export.NON_STRING_IDS)
+        counts = [self.status_collection.database.count_documents(export.range_query(*bounds))
+                  for bounds in ranges]
+        self.assertTrue(all(counts[:4]))
+        self.assertEqual(sum(counts), 200)
+
+    def test_mixed_id_types_and_unknown_format(self):
+        """
+        Non-string _ids get their own scan instead of falling outside every range;
+        an unknown explicit format is an error rather than CSV.
+        """
+        mock_collection = MagicMock()
+        mock_collection.aggregate.return_value = [{"_id": f"U{i:02d}"} for i in range(40)] + [{"_id": 7},
+                                                                                               {"_id": None}]
+        ranges = export.split_ranges(mock_collection, 2)
+        self.assertEqual(ranges, [(None, "U20"), ("U20", None), export.NON_STRING_IDS])
+        self.assertEqual(export.range_query(*ranges[-1]), {"_id": {"$not": {"$type": "string"}}})
+        with self.assertRaises(ValueError):
+            main.export_users(os.path.join(self.directory.name, "users.out"), self.user_collection, "json")
+
+    @unittest.skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow is not installed")
+    def test_parquet_export(self):
+        """
+        Parquet export writes the loader columns, one row group per batch.
+        """
+        import pyarrow.parquet  # pylint: disable = C0415
+        filename = os.path.join(self.directory.name, "statuses.parquet")
+        self.assertEqual(main.export_status_updates(filename, self.status_collection, parts=2, batch_size=50), 200)
+        table = pyarrow.parquet.read_table(filename)
+        self.assertEqual(table.column_names, ["STATUS_ID", "USER_ID", "STATUS_TEXT"])
+        self.assertEqual(sorted(table.column("STATUS_ID").to_pylist()),
+                         sorted(document["_id"] for document in self.status_collection.database.find({})))
+        self.assertIn('Meow, said "cat" 7', table.column("STATUS_TEXT").to_pylist())
+        self.assertGreaterEqual(pyarrow.parquet.ParquetFile(filename).num_row_groups, 4)
+
+
+@unittest.skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow is not installed")
+class TestParquetLoading(unittest.TestCase):
+    """
+    Unit tests for loading Parquet input.
+    """
+
+    def setUp(self):
+        import pyarrow  # pylint: disable = C0415
+        import pyarrow.parquet  # pylint: disable = C0415
+        self.directory = tempfile.TemporaryDirectory()
+        self.connection_string = main.SQLITE_SCHEME + self.directory.name
+        self.client = main.get_mongo_client(self.connection_string)
+        self.user_collection = main.init_user_collection(self.client)
+        self.status_collection = main.init_status_collection(self.client)
+        self.accounts = os.path.join(self.directory.name, "accounts.parquet")
+        users = pyarrow.table({"USER_ID": [f"User{i}" for i in range(30)],
+                               "EMAIL": [f"user{i}@uw.edu" if i != 7 else "" for i in range(30)],
+                               "NAME": [f"Name{i}" for i in range(30)],
+                               "LASTNAME": [f"Last{i}" if i != 9 else None for i in range(30)]})
+        pyarrow.parquet.write_table(users, self.accounts, row_group_size=10)
+        self.statuses = os.path.join(self.directory.name, "status_updates.parquet")
+        statuses = pyarrow.table({"STATUS_ID": [f"User{i % 30}_{i}" for i in range(90)],
+                                  "USER_ID": [f"User{i % 30}" for i in range(90)],
+                                  "STATUS_TEXT": [f"Meow {i}" for i in range(90)],
+                                  "EXTRA": list(range(90))})
+        pyarrow.parquet.write_table(statuses, self.statuses, row_group_size=25)
+
+    def tearDown(self):
+        self.client.close()
+        self.directory.cleanup()
+
+    def test_load_users_and_statuses(self):
+        """
+        Parquet columns map to the same documents as CSV rows; incomplete users are skipped.
+        """
+        self.assertTrue(main.load_users(self.accounts, self.user_collection))
+        self.assertTrue(main.load_status_updates(self.statuses, self.status_collection))
+        self.assertEqual(self.user_collection.count_documents({}), 28)
+        self.assertIsNone(self.user_collection.find_one({"_id": "User7"}))
+        self.assertEqual(self.user_collection.find_one({"_id": "User3"}),
+                         {"_id": "User3", "user_email": "user3@uw.edu", "user_name": "Name3",
+                          "user_last_name": "Last3"})
+        self.assertEqual(self.status_collection.database.find_one({"_id": "User4_34"}),
+                         {"_id": "User4_34", "user_id": "User4", "status_text": "Meow 34"})
+        self.assertEqual(self.status_collection.database.count_documents({}), 90)
+
+    def test_row_groups_spread_across_workers(self):
+        """
+        The multiprocess loader hands one row group to each task.
+        """
+        report = main.load_users_multiprocess(self.accounts, connection_string=self.connection_string,
+                                              return_report=True)
+        self.assertTrue(report["success"])
+        self.assertEqual(len(report["workers"]), 3)
+        self.assertEqual(report["inserted"], 28)
+        self.assertEqual(self.user_collection.count_documents({}), 28)
+
+    def test_missing_column_and_csv_only_options(self):
+        """
+        A file without the loader columns fails like a bad CSV; CSV-only options are refused.
+        """
+        self.assertFalse(main.load_users(self.statuses, self.user_collection))
+        with self.assertRaises(ValueError):
+            main.load_users(self.accounts, self.user_collection, dedupe="first")
+
+
+class TestEmailLookup(unittest.TestCase):
+    """
+    Unit tests for indexed, cached email lookups.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.client = main.get_mongo_client(main.SQLITE_SCHEME + self.directory.name)
+        self.user_collection = main.init_user_collection(self.client)
+        self.status_collection = main.init_status_collection(self.client)
+
+    def tearDown(self):
+        self.client.close()
+        self.directory.cleanup()
+
+    def test_duplicate_emails_rejected_and_cache_kept_in_step(self):
+        """
+        The unique index rejects duplicate emails on add and update; changes evict the cache.
+        """
+        lookup = main.init_email_lookup(self.user_collection)
+        self.assertTrue(main.add_user("SC", "sesame@uw.edu", "Sesame", "Chan", self.user_collection,
+                                      email_lookup=lookup))
+        self.assertTrue(main.add_user("MC", "mochi@uw.edu", "Mochi", "Chan", self.user_collection,
+                                      email_lookup=lookup))
+        self.assertFalse(main.add_user("XX", "sesame@uw.edu", "Other", "User", self.user_collection,
+                                       email_lookup=lookup))
+        self.assertFalse(main.update_user("MC", "sesame@uw.edu", "Mochi", "Chan", self.user_collection,
+                                          email_lookup=lookup))
+
+        self.assertEqual(main.search_user_by_email("sesame@uw.edu", self.user_collection, lookup)["_id"], "SC")
+        with patch.object(self.user_collection, "find_one") as find_one:
+            self.assertEqual(main.search_user_by_email("sesame@uw.edu", self.user_collection, lookup)["_id"], "SC")
+            find_one.assert_not_called()
+
+        self.assertTrue(main.update_user("SC", "new@uw.edu", "Sesame", "Chan", self.user_collection,
+                                         email_lookup=lookup))
+        self.assertIsNone(main.search_user_by_email("sesame@uw.edu", self.user_collection, lookup))
+        self.assertEqual(main.search_user_by_email("new@uw.edu", self.user_collection, lookup)["_id"], "SC")
+        self.assertTrue(main.delete_user("SC", self.user_collection, self.status_collection, email_lookup=lookup))
+        self.assertIsNone(main.search_user_by_email("new@uw.edu", self.user_collection, lookup))
+
+    def test_normalized_lookup_backfills_and_ignores_case(self):
+        """
+        Loaded users get the normalized field; lookups and duplicates ignore case.
+        """
+        self.user_collection.insert_many([{"_id": "SC", "user_email": "Sesame@UW.edu", "user_name": "Sesame",
+                                           "user_last_name": "Chan"}])
+        lookup = main.init_email_lookup(self.user_collection, normalized=True, cache_size=1)
+        self.assertEqual(main.search_user_by_email(" sesame@uw.EDU", self.user_collection, lookup)["_id"], "SC")
+        self.assertFalse(main.add_user("XX", "SESAME@uw.edu", "Other", "User", self.user_collection,
+                                       email_lookup=lookup))
+        self.assertTrue(main.add_user("MC", "Mochi@uw.edu", "Mochi", "Chan", self.user_collection,
+                                      email_lookup=lookup))
+        self.assertEqual(main.search_user_by_email("mochi@uw.edu", self.user_collection, lookup)["_id"], "MC")
+        self.assertEqual(len(lookup.cache), 1)
+
+    def test_existing_duplicates_and_bulk_inserts(self):
+        """
+        The index is not built over existing duplicates; bulk inserts report index conflicts.
+        """
+        users = [{"_id": user_id, "user_email": "same@uw.edu", "user_name": "N", "user_last_name": "L"}
+                 for user_id in ("A", "B")]
+        self.user_collection.insert_many(users)
+        self.assertFalse(email_index.EmailLookup(self.user_collection).ensure_index())
+
+        self.user_collection.delete_one({"_id": "B"})
+        self.assertTrue(email_index.EmailLookup(self.user_collection).ensure_index())
+        batch = [{"_id": "C", "user_email": "c@uw.edu"}, {"_id": "D", "user_email": "same@uw.edu"},
+                 {"_id": "E", "user_email": "e@uw.edu"}]
+        self.assertEqual(main.insert_batch_counted(self.user_collection, batch), (2, 1, 0))
+        self.user_collection.insert_one({"_id": "F", "user_email": "SAME@uw.edu"})
+        self.assertIsNone(main.init_email_lookup(self.user_collection, normalized=True))
+
+    def test_index_reports_duplicates_of_unchecked_load(self):
+        """
+        accounts.csv loads in full without the index; the index reports the swapped columns'
+        repeated "emails" and is only built once the data is column-fixed.
+        """
+        self.assertTrue(main.load_users("accounts.csv", self.user_collection))
+        self.assertEqual(self.user_collection.count_documents({}), 2000)
+        with patch("builtins.print") as mock_print:
+            self.assertIsNone(main.init_email_lookup(self.user_collection))
+        self.assertIn("297 emails are shared", mock_print.call_args[0][0])
+        self.assertEqual(self.user_collection.index_information().keys(), {"_id_"})
+
+        self.user_collection.drop()
+        self.assertTrue(main.load_users("accounts.csv", self.user_collection, validate=True))
+        self.assertIsNotNone(main.init_email_lookup(self.user_collection))
+
+    def test_normalized_email_written_by_bulk_load_and_delta_sync(self):
+        """
+        Users bulk loaded or delta synced after the index exists are found by a normalized lookup.
+        """
+        lookup = main.init_email_lookup(self.user_collection, normalized=True)
+        user_collection = main.init_user_collection(self.client, normalized_email=True)
+        filename = os.path.join(self.directory.name, "accounts.csv")
+        with open(filename, "w", encoding="utf-8") as file:
+            file.write("USER_ID,EMAIL,NAME,LASTNAME\nSC,Sesame@UW.edu,Sesame,Chan\n")
+        self.assertTrue(main.load_users(filename, user_collection))
+        with open(filename, "w", encoding="utf-8") as file:
+            file.write("USER_ID,EMAIL,NAME,LASTNAME\nSC,Sesame@UW.edu,Sesame,Chan\nMC,Mochi@UW.edu,Mochi,Chan\n")
+        main.sync_users(filename, user_collection, os.path.join(self.directory.name, "fingerprints.sqlite3"))
+
+        self.assertEqual(main.search_user_by_email("sesame@uw.edu", user_collection, lookup)["_id"], "SC")
+        self.assertEqual(main.search_user_by_email("MOCHI@uw.edu", user_collection, lookup)["_id"], "MC")
+        with open(filename, "w", encoding="utf-8") as file:
+            file.write("USER_ID,EMAIL,NAME,LASTNAME\nXX,SESAME@uw.edu,Other,User\n")
+        self.assertFalse(main.load_users(filename, user_collection))
+
+
+class TestStagedLoad(unittest.TestCase):
+    """
+    Unit tests for staged reloads through a shadow collection.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.client = main.get_mongo_client(main.SQLITE_SCHEME + self.directory.name)
+        self.status_collection = main.init_status_collection(self.client)
+        self.status_collection.batch_load_statuses([{"_id": "OLD_1", "user_id": "OLD", "status_text": "Old"}])
+        self.filename = os.path.join(self.directory.name, "status_updates.csv")
+        with open(self.filename, "w", encoding="utf-8") as file:
+            file.write("STATUS_ID,USER_ID,STATUS_TEXT\n")
+            for i in range(50):
+                file.write(f"SC_{i},SC,Meow {i}\n")
+
+    def tearDown(self):
+        self.client.close()
+        self.directory.cleanup()
+
+    def test_live_collection_swapped_after_load(self):
+        """
+        Readers see the old data during the load and the indexed new data after the swap.
+        """
+        live_counts = []
+        load_status_updates = main.load_status_updates
+
+        def load_and_observe(*args, **kwargs):
+            result = load_status_updates(*args, **kwargs)
+            live_counts.append(self.status_collection.database.count_documents({}))
+            return result
+
+        with patch("main.load_status_updates", side_effect=load_and_observe):
+            report = main.load_status_updates_staged(self.filename, self.client)
+        self.assertTrue(report["success"])
+        self.assertEqual(live_counts, [1])
+        self.assertEqual((report["rows"], report["loaded"]), (50, 50))
+        self.assertFalse(self.status_collection.search_status("OLD_1"))
+        self.assertEqual(self.status_collection.database.count_documents({"user_id": "SC"}), 50)
+        self.assertTrue(self.status_collection.database.has_index("user_id"))
+        self.assertEqual(self.client[main.DATABASE].list_collection_names(), ["StatusUpdates"])
+
+    def test_count_mismatch_keeps_live_collection(self):
+        """
+        A shadow with fewer documents than the source is dropped and the live data kept.
+        """
+        user_directory = UserDirectory()
+        user_directory.add("NOBODY")
+        report = main.load_status_updates_staged(self.filename, self.client, user_directory=user_directory)
+        self.assertFalse(report["success"])
+        self.assertEqual(report["loaded"], 0)
+        self.assertEqual(self.status_collection.search_status("OLD_1")["status_text"], "Old")
+        self.assertEqual(self.client[main.DATABASE].list_collection_names(), ["StatusUpdates"])
+
+    def test_stale_shadow_dropped_and_users_staged(self):
+        """
+        A shadow left by an interrupted load is cleaned up; users reload through the same path.
+        """
+        self.client[main.DATABASE]["UserAccounts" + staging.SHADOW_MARKER + "dead"].insert_one({"_id": "X"})
+        report = main.load_users_staged("accounts.csv", self.client)
+        self.assertTrue(report["success"])
+        self.assertEqual(main.init_user_collection(self.client).count_documents({}), 2000)
+        self.assertEqual(sorted(self.client[main.DATABASE].list_collection_names()),
+                         ["StatusUpdates", "UserAccounts"])
+
+    def test_live_indexes_kept_across_reloads(self):
+        """
+        The unique email index of the live collection is rebuilt on the shadow, under its own name.
+        """
+        self.assertIsNotNone(main.init_email_lookup(main.init_user_collection(self.client)))
+        filename = os.path.join(self.directory.name, "accounts.csv")
+        with open(filename, "w", encoding="utf-8") as file:
+            file.write("USER_ID,EMAIL,NAME,LASTNAME\nSC,sesame@uw.edu,Sesame,Chan\nMC,mochi@uw.edu,Mochi,Chan\n")
+        for _reload in range(2):
+            self.assertTrue(main.load_users_staged(filename, self.client)["success"])
+        user_collection = main.init_user_collection(self.client)
+        self.assertEqual(sorted(user_collection.index_information()), ["_id_", "user_email_unique"])
+        self.assertFalse(main.add_user("XX", "sesame@uw.edu", "Other", "User", user_collection))
+
+
+class TestCompactSchema(unittest.TestCase):
+    """
+    Unit tests for the compact on-disk schema.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.client = main.get_mongo_client(main.SQLITE_SCHEME + self.directory.name)
+        self.raw_users = self.client[main.DATABASE]["UserAccounts"]
+        self.raw_statuses = self.client[main.DATABASE]["StatusUpdates"]
+
+    def tearDown(self):
+        self.client.close()
+        self.directory.cleanup()
+
+    def test_main_functions_store_short_keys(self):
+        """
+        Documents are stored with short keys and read back with the full field names.
+        """
+        user_collection = main.init_user_collection(self.client, compact=True)
+        status_collection = main.init_status_collection(self.client, compact=True)
+        self.assertTrue(main.add_user("SC", "sesame@uw.edu", "Sesame", "Chan", user_collection))
+        self.assertTrue(main.update_user("SC", "new@uw.edu", "Sesame", "Chan", user_collection))
+        self.assertTrue(main.add_status("SC", "SC1", "Meow", status_collection, user_collection))
+        self.assertTrue(main.update_status("SC1", "SC", "Food!", status_collection))
+
+        self.assertEqual(main.search_user("SC", user_collection),
+                         {"_id": "SC", "user_email": "new@uw.edu", "user_name": "Sesame", "user_last_name": "Chan"})
+        self.assertEqual(main.search_status("SC1", status_collection),
+                         {"_id": "SC1", "user_id": "SC", "status_text": "Food!"})
+        self.assertEqual(self.raw_users.find_one({"_id": "SC"}),
+                         {"_id": "SC", "e": "new@uw.edu", "n": "Sesame", "l": "Chan"})
+        self.assertEqual(self.raw_statuses.find_one({"_id": "SC1"}), {"_id": "SC1", "u": "SC", "t": "Food!"})
+        self.assertTrue(main.delete_user("SC", user_collection, status_collection))
+        self.assertEqual(self.raw_statuses.count_documents({}), 0)
+
+    def test_loaders_and_raw_bson_path(self):
+        """
+        Dict-based and pre-encoded BSON loads both store the compact form.
+        """
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False, dir=self.directory.name) as file:
+            file.write("STATUS_ID,USER_ID,STATUS_TEXT\nSC_1,SC,Meow\nMC_1,MC,Purr\n")
+        status_collection = main.init_status_collection(self.client, compact=True)
+        self.assertTrue(main.load_status_updates_raw(file.name, status_collection, processes=1))
+        self.assertEqual(self.raw_statuses.find_one({"_id": "MC_1"}), {"_id": "MC_1", "u": "MC", "t": "Purr"})
+        self.assertTrue(main.load_users("accounts.csv", main.init_user_collection(self.client, compact=True)))
+        self.assertEqual(set(self.raw_users.find_one({})), {"_id", "e", "n", "l"})
+
+    def test_migration_both_ways(self):
+        """
+        migrate rewrites existing documents to the compact schema and back.
+        """
+        main.load_users("accounts.csv", self.raw_users, batch_size=500)
+        original = sorted(self.raw_users.find({}), key=lambda d: d["_id"])
+        self.assertEqual(compact_schema.migrate(self.raw_users, compact_schema.USER_KEYS, batch_size=300), 2000)
+        self.assertEqual(set(self.raw_users.find_one({})), {"_id", "e", "n", "l"})
+        compact_view = main.init_user_collection(self.client, compact=True)
+        self.assertEqual(sorted(compact_view.find({}), key=lambda d: d["_id"]), original)
+        self.assertEqual(compact_schema.migrate(self.raw_users, compact_schema.USER_KEYS), 0)
+        compact_schema.migrate(self.raw_users, compact_schema.USER_KEYS, to_compact=False)
+        self.assertEqual(sorted(self.raw_users.find({}), key=lambda d: d["_id"]), original)
+
+    def test_pipeline_translation(self):
+        """
+        Field paths in pipelines are renamed, with $lookup using the joined collection's keys.
+        """
+        pipeline = [{"$match": {"user_id": "SC"}},
+                    {"$bucket": {"groupBy": {"$strLenCP": "$status_text"}, "boundaries": [0, 20]}}]
+        self.assertEqual(compact_schema.translate_pipeline(pipeline, compact_schema.STATUS_KEYS),
+                         [{"$match": {"u": "SC"}},
+                          {"$bucket": {"groupBy": {"$strLenCP": "$t"}, "boundaries": [0, 20]}}])
+        lookup = [{"$lookup": {"from": "StatusUpdates", "localField": "_id", "foreignField": "user_id",
+                               "as": "statuses"}}]
+        self.assertEqual(compact_schema.translate_pipeline(lookup, compact_schema.USER_KEYS)[0]["$lookup"]
+                         ["foreignField"], "u")
+
+    def test_pipeline_output_names_kept(self):
+        """
+        Output names of $group / $project are neither translated nor mapped back, even when
+        they match a full or short field name.
+        """
+        pipeline = [{"$group": {"_id": "$user_name", "n": {"$sum": 1}, "user_email": {"$first": "$user_email"}}},
+                    {"$sort": {"user_email": 1}}]
+        self.assertEqual(compact_schema.translate_pipeline(pipeline, compact_schema.USER_KEYS),
+                         [{"$group": {"_id": "$n", "n": {"$sum": 1}, "user_email": {"$first": "$e"}}},
+                          {"$sort": {"user_email": 1}}])
+        project = [{"$project": {"user_name": 1, "user_email": {"$toUpper": "$user_email"}}}]
+        self.assertEqual(compact_schema.translate_pipeline(project, compact_schema.USER_KEYS),
+                         [{"$project": {"n": 1, "user_email": {"$toUpper": "$e"}}}])
+
+        stored = MagicMock()
+        stored.aggregate.return_value = iter([{"_id": "Sesame", "n": 2}])
+        users = compact_schema.CompactCollection(stored, compact_schema.USER_KEYS)
+        self.assertEqual(list(users.aggregate(pipeline)), [{"_id": "Sesame", "n": 2}])
+        stored.aggregate.return_value = iter([{"_id": "SC", "n": "Sesame", "total": 1}])
+        self.assertEqual(list(users.aggregate([{"$addFields": {"total": 1}}])),
+                         [{"_id": "SC", "user_name": "Sesame", "total": 1}])
+
+
+class StubChangeStream:
+    """
+    Stand-in for one collection's change stream: an append-only event log whose
+    connection can be dropped, replaying from a resume token like the server does
+    """
+
+    def __init__(self):
+        self.events = []
+        self.opened = []
+        self.condition = threading.Condition()
+        self.generation = 0
+        self.history_lost = False
+
+    def emit(self, operation, document_id):
+        """
+        Appends a change event
+        """
+        with self.condition:
+            self.events.append({"_id": {"token": len(self.events)}, "operationType": operation,
+                                "documentKey": {"_id": document_id}})
+            self.condition.notify_all()
+
+    def disconnect(self):
+        """
+        Drops the open stream; the next read raises AutoReconnect
+        """
+        with self.condition:
+            self.generation += 1
+            self.condition.notify_all()
+
+    def __call__(self, resume_token):
+        self.opened.append(resume_token)
+        if resume_token is not None and self.history_lost:
+            self.history_lost = False
+            raise pymongo.errors.OperationFailure("resume point lost", cache_coherence.CHANGE_STREAM_HISTORY_LOST)
+        return StubCursor(self, len(self.events) if resume_token is None else resume_token["token"] + 1)
+
+
+class StubCursor:
+    """
+    Iterator over a StubChangeStream from a position, blocking for new events
+    """
+
+    def __init__(self, stream, position):
+        self.stream = stream
+        self.position = position
+        self.generation = stream.generation
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        with self.stream.condition:
+            while True:
+                if self.closed:
+                    raise StopIteration
+                if self.generation != self.stream.generation:
+                    raise pymongo.errors.AutoReconnect("connection dropped")
+                if self.position < len(self.stream.events):
+                    self.position += 1
+                    return self.stream.events[self.position - 1]
+                self.stream.condition.wait(0.05)
+
+    def close(self):
+        """
+        Ends the iteration
+        """
+        self.closed = True
+
+
+def wait_until(predicate, timeout=5.0):
+    """
+    Polls predicate until it is true or timeout seconds pass
+    """
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+class TestCacheCoherence(unittest.TestCase):
+    """
+    Unit tests for change-stream cache invalidation.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.client = main.get_mongo_client(main.SQLITE_SCHEME + self.directory.name)
+        self.user_collection = main.init_user_collection(self.client)
+        self.streams = {cache_coherence.USER_TABLE: StubChangeStream(), cache_coherence.STATUS_TABLE: StubChangeStream()}
+        self.invalidator = cache_coherence.CacheInvalidator(self.streams, ttl=0.0, retry_delay=0.01)
+
+    def tearDown(self):
+        self.invalidator.stop()
+        self.client.close()
+        self.directory.cleanup()
+
+    def test_other_process_update_evicts_cached_user(self):
+        """
+        An update made elsewhere shows up in every subscribed cache once its event arrives.
+        """
+        main.add_user("SC", "sesame@uw.edu", "Sesame", "Chan", self.user_collection)
+        lookups = [email_index.EmailLookup(self.user_collection) for _ in range(2)]
+        user_directory = UserDirectory(self.user_collection, resync_interval=None)
+        for cache in lookups + [user_directory]:
+            cache.follow(self.invalidator)
+        self.invalidator.start()
+        self.assertTrue(wait_until(self.invalidator.live))
+        for lookup in lookups:
+            lookup.find("sesame@uw.edu")
+
+        # Another process changes the email and adds a user, bypassing these caches
+        self.user_collection.update_one({"_id": "SC"}, {"$set": {"user_email": "new@uw.edu"}})
+        self.user_collection.insert_one({"_id": "MC", "user_email": "mochi@uw.edu"})
+        self.streams[cache_coherence.USER_TABLE].emit("update", "SC")
+        self.streams[cache_coherence.USER_TABLE].emit("insert", "MC")
+        self.assertTrue(wait_until(lambda: "MC" in user_directory))
+        for lookup in lookups:
+            self.assertIsNone(lookup.find("sesame@uw.edu"))
+            self.assertEqual(lookup.find("new@uw.edu")["_id"], "SC")
+
+    def test_resume_after_disconnect_with_ttl_meanwhile(self):
+        """
+        A dropped stream reopens from its last token, missing nothing; caches use the TTL meanwhile.
+        """
+        seen = []
+        self.invalidator.subscribe(cache_coherence.STATUS_TABLE, lambda status_id, operation: seen.append(status_id))
+        stream = self.streams[cache_coherence.STATUS_TABLE]
+        self.invalidator.retry_delay = 0.3
+        self.invalidator.start()
+        self.assertTrue(wait_until(self.invalidator.live))
+        self.assertIsNone(self.invalidator.max_age())
+        stream.emit("delete", "SC_1")
+        self.assertTrue(wait_until(lambda: seen == ["SC_1"]))
+
+        stream.disconnect()
+        stream.emit("update", "SC_2")
+        self.assertTrue(wait_until(lambda: not self.invalidator.live()))
+        self.assertEqual(self.invalidator.max_age(), 0.0)
+        self.assertTrue(wait_until(lambda: seen == ["SC_1", "SC_2"]))
+        self.assertEqual(stream.opened, [None, {"token": 0}])
+
+    def test_lost_history_flushes_subscribers(self):
+        """
+        When the resume point is gone, subscribers are flushed and the stream restarts from now.
+        """
+        analytics_report, _users, _statuses = main.init_analytics(self.client)
+        analytics_report.follow(self.invalidator)
+        before = analytics_report.counter.version([cache_coherence.STATUS_TABLE])
+        stream = self.streams[cache_coherence.STATUS_TABLE]
+        self.invalidator.start()
+        self.assertTrue(wait_until(self.invalidator.live))
+        stream.emit("insert", "SC_1")
+        self.assertTrue(wait_until(lambda: self.invalidator.resume_tokens.get(cache_coherence.STATUS_TABLE)))
+        stream.history_lost = True
+        stream.disconnect()
+        self.assertTrue(wait_until(lambda: len(stream.opened) == 3))
+        self.assertEqual(stream.opened[1:], [{"token": 0}, None])
+        # One bump for the insert event, one for the flush
+        self.assertEqual(analytics_report.counter.version([cache_coherence.STATUS_TABLE])[0], before[0] + 2)
+
+    def test_failing_subscriber_flushed_and_others_still_served(self):
+        """
+        A subscriber raising on an event is flushed; the other subscribers and the stream carry on.
+        """
+        seen = []
+        flushed = []
+
+        def broken(_status_id, _operation):
+            raise ValueError("cache bug")
+
+        self.invalidator.subscribe(cache_coherence.STATUS_TABLE, broken, lambda: flushed.append(True))
+        self.invalidator.subscribe(cache_coherence.STATUS_TABLE, lambda status_id, operation: seen.append(status_id))
+        stream = self.streams[cache_coherence.STATUS_TABLE]
+        self.invalidator.start()
+        self.assertTrue(wait_until(self.invalidator.live))
+        with patch("builtins.print"):
+            stream.emit("delete", "SC_1")
+            stream.emit("delete", "SC_2")
+            self.assertTrue(wait_until(lambda: seen == ["SC_1", "SC_2"]))
+        self.assertEqual(flushed, [True, True])
+        self.assertTrue(self.invalidator.live())
+        self.assertEqual(stream.opened, [None])
+
+    def test_unexpected_stream_error_retried(self):
+        """
+        A non-pymongo error from the source marks the stream down and is retried.
+        """
+        stream = self.streams[cache_coherence.STATUS_TABLE]
+        opened = []
+
+        def failing_source(resume_token):
+            opened.append(resume_token)
+            if len(opened) == 1:
+                raise RuntimeError("driver bug")
+            return stream(resume_token)
+
+        self.invalidator.sources[cache_coherence.STATUS_TABLE] = failing_source
+        with patch("builtins.print") as mock_print:
+            self.invalidator.start()
+            self.assertTrue(wait_until(self.invalidator.live))
+        self.assertEqual(len(opened), 2)
+        mock_print.assert_called_once()
+
+
+class TestBatchLookup(unittest.TestCase):
+    """
+    Unit tests for batch lookups of users and statuses by ID.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.client = main.get_mongo_client(main.SQLITE_SCHEME + self.directory.name)
+        self.user_collection = main.init_user_collection(self.client)
+        self.status_collection = main.init_status_collection(self.client)
+        self.user_collection.insert_many([{"_id": f"User{i}", "user_email": f"user{i}@uw.edu",
+                                           "user_name": "User", "user_last_name": f"Name{i}"}
+                                          for i in range(50)])
+
+    def tearDown(self):
+        self.client.close()
+        self.directory.cleanup()
+
+    def test_results_in_input_order_with_missing_ids(self):
+        """
+        Every ID gets a result, in input order, duplicates included; unknown IDs map to None.
+        """
+        ids = ["User3", "Nobody", "User1", "User3"]
+        results = list(main.search_users(ids, self.user_collection))
+        self.assertEqual([item_id for item_id, _user in results], ids)
+        self.assertEqual(results[0][1]["user_last_name"], "Name3")
+        self.assertIsNone(results[1][1])
+        self.assertEqual(results[3][1]["_id"], "User3")
+
+    def test_chunks_queried_concurrently_keep_order(self):
+        """
+        Many small chunks go through the thread pool and still come back in order.
+        """
+        ids = [f"User{i}" for i in reversed(range(60))]
+        with patch.object(batch_lookup, "ThreadPoolExecutor", wraps=batch_lookup.ThreadPoolExecutor) as pool:
+            results = list(main.search_users(ids, self.user_collection, chunk_size=7))
+        pool.assert_called_once()
+        self.assertEqual([item_id for item_id, _user in results], ids)
+        self.assertEqual(sum(user is None for _item_id, user in results), 10)
+        self.assertTrue(all(user["_id"] == item_id for item_id, user in results if user is not None))
+
+    def test_ids_from_file_and_projection(self):
+        """
+        A file of IDs (header skipped) is accepted; the projection limits returned fields.
+        """
+        filename = os.path.join(self.directory.name, "ids.csv")
+        with open(filename, "w", encoding="utf-8") as file:
+            file.write("USER_ID,NAME\nUser2,x\n\nUser9\nGhost\n")
+        results = list(main.search_users_from_file(filename, self.user_collection, projection={"user_email": 1}))
+        self.assertEqual(results, [("User2", {"_id": "User2", "user_email": "user2@uw.edu"}),
+                                   ("User9", {"_id": "User9", "user_email": "user9@uw.edu"}),
+                                   ("Ghost", None)])
+        with self.assertRaises(TypeError):
+            main.search_users(filename, self.user_collection)
+
+    def test_projection_without_id(self):
+        """
+        IDs are still matched when the projection excludes _id, which stays out of the results.
+        """
+        results = list(main.search_users(["User2", "Ghost"], self.user_collection,
+                                         projection={"_id": 0, "user_email": 1}))
+        self.assertEqual(results, [("User2", {"user_email": "user2@uw.edu"}), ("Ghost", None)])
+
+    def test_status_lookup_and_written_report(self):
+        """
+        search_statuses resolves status IDs; write_results counts found and missing rows.
+        """
+        main.add_status("User1", "User1_1", "Hello", self.status_collection, self.user_collection)
+        output = io.StringIO()
+        counts = batch_lookup.write_results(main.search_statuses(["User1_1", "User1_2"], self.status_collection),
+                                            output, ["user_id", "status_text"])
+        self.assertEqual(counts, (1, 1))
+        self.assertEqual(output.getvalue().splitlines(),
+                         ["ID,FOUND,user_id,status_text", "User1_1,yes,User1,Hello", "User1_2,no,,"])
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,149 @@
+"""
+Compact in-process directory of user IDs for existence checks without a database round trip
+"""
+
+import bisect
+import sys
+import threading
+import time
+
+import cache_coherence
+
+
+def insert_sorted(ids, user_id):
+    """
+    Inserts user_id into the sorted list ids unless present
+    """
+    index = bisect.bisect_left(ids, user_id)
+    if index == len(ids) or ids[index] != user_id:
+        ids.insert(index, user_id)
+
+
+def remove_sorted(ids, user_id):
+    """
+    Removes user_id from the sorted list ids if present
+    """
+    index = bisect.bisect_left(ids, user_id)
+    if index < len(ids) and ids[index] == user_id:
+        del ids[index]
+
+
+class UserDirectory:
+    """
+    Sorted array of interned user ID strings (IDs of other types are stored as str()).
+    Kept fresh by add/discard from add_user/delete_user and a periodic resync
+    against the user collection, or by change events from every process (see follow).
+    """
+
+    def __init__(self, user_collection=None, resync_interval=300):
+        self.user_collection = user_collection
+        self.resync_interval = resync_interval
+        self.ids = []
+        self.last_sync = 0.0
+        self.lock = threading.Lock()
+        self.resync_lock = threading.Lock()
+        # add/discard calls made while a resync reads the collection, replayed onto its snapshot
+        self.pending = None
+        # Overrides resync_interval once following a CacheInvalidator
+        self.max_age = None
+        if user_collection is not None:
+            self.resync()
+
+    @classmethod
+    def from_ids(cls, user_ids):
+        """
+        Directory of user_ids built with one sort, unlike repeated add() calls
+        """
+        directory = cls()
+        directory.ids = sorted({cls.key(user_id) for user_id in user_ids})
+        return directory
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, user_id):
+        return self.contains(user_id)
+
+    @staticmethod
+    def key(user_id):
+        """
+        Stored form of a user ID
+        """
+        return sys.intern(str(user_id))
+
+    def resync(self):
+        """
+        Reloads every user ID from the user collection; changes made meanwhile are kept
+        """
+        with self.resync_lock:
+            with self.lock:
+                self.pending = []
+            try:
+                cursor = self.user_collection.find({}, {"_id": 1})
+                ids = sorted(self.key(doc["_id"]) for doc in cursor)
+                with self.lock:
+                    for change, user_id in self.pending:
+                        change(ids, user_id)
+                    self.ids = ids
+                    self.last_sync = time.monotonic()
+            finally:
+                with self.lock:
+                    self.pending = None
+
+    def maybe_resync(self):
+        """
+        Resyncs when the last sync is older than resync_interval seconds
+        (when following: only while the change stream is down, after its TTL)
+        """
+        interval = self.max_age() if self.max_age is not None else self.resync_interval
+        if (self.user_collection is not None and interval is not None
+                and time.monotonic() - self.last_sync > interval):
+            self.resync()
+
+    def contains(self, user_id):
+        """
+        True if user_id is a known user
+        """
+        self.maybe_resync()
+        user_id = self.key(user_id)
+        ids = self.ids
+        index = bisect.bisect_left(ids, user_id)
+        return index < len(ids) and ids[index] == user_id
+
+    def add(self, user_id):
+        """
+        Records a newly added user
+        """
+        self.change(insert_sorted, user_id)
+
+    def discard(self, user_id):
+        """
+        Forgets a deleted user
+        """
+        self.change(remove_sorted, user_id)
+
+    def change(self, change, user_id):
+        """
+        Applies change(ids, user_id) now and, during a resync, again to its snapshot
+        """
+        user_id = self.key(user_id)
+        with self.lock:
+            change(self.ids, user_id)
+            if self.pending is not None:
+                self.pending.append((change, user_id))
+
+    def follow(self, invalidator):
+        """
+        Applies user inserts and deletes from every process through a CacheInvalidator;
+        periodic resyncs then only happen while its change stream is down
+        """
+        def apply(user_id, operation):
+            if operation == "insert":
+                self.add(user_id)
+            elif operation == "delete":
+                self.discard(user_id)
+
+        invalidator.subscribe(cache_coherence.USER_TABLE, apply,
+                              self.resync if self.user_collection is not None else None)
+        self.max_age = invalidator.max_age
+
@@ -3,6 +3,9 @@ classes to manage the user status messages
 """
 import pymongo
 
+import read_routing
+from compact_schema import STATUS_KEYS, CompactCollection
+
 
 # from loguru import logger
 
@@ -17,28 +20,41 @@ class UserStatusCollection:
     Collection of UserStatus messages
     """
 
-    def __init__(self, database):
-        self.database = database
+    def __init__(self, database, compact=False):
+        # With compact, documents are stored under short keys (see compact_schema)
+        self.database = CompactCollection(database, STATUS_KEYS) if compact else database
         # logger.debug("Status database successfully linked")
 
+    def with_write_concern(self, write_concern):
+        """
+        Returns a view of this collection that writes with a different write concern
+        """
+        return UserStatusCollection(self.database.with_options(write_concern=write_concern))
+
     def add_status(self, status_id, user_id, status_text):
         """
         Adds a new status to the collection
         """
-        if self.search_status(status_id):
+        if self.existing_status(status_id):
             return False
         status = {
             "_id": status_id,
             "user_id": user_id,
             "status_text": status_text
         }
-        self.database.insert_one(status)
+        try:
+            self.database.insert_one(status)
+        except pymongo.errors.DuplicateKeyError:
+            # Added by someone else since the check
+            return False
         return True
 
-    def batch_load_statuses(self, data):
+    def batch_load_statuses(self, data, inserted=None):
         """
-        Adds new statuses to the collection with a batch load
+        Adds new statuses to the collection with a batch load.
+        If inserted is a list, the statuses actually inserted (duplicates left out) are appended to it.
         """
+        failed = set()
         try:
             self.database.insert_many(data, ordered=False)
         except pymongo.errors.BulkWriteError as error:
@@ -48,13 +64,16 @@ class UserStatusCollection:
                     # Handle unexpected errors
                     print(f"Unexpected error in batch: {error}")
                     return False
+            failed = {write_error['index'] for write_error in write_errors}
+        if inserted is not None:
+            inserted.extend(status for index, status in enumerate(data) if index not in failed)
         return True
 
     def modify_status(self, status_id, user_id, status_text):
         """
         Modifies a status message if the status_id and user_id match.
         """
-        existing_status = self.search_status(status_id)
+        existing_status = self.existing_status(status_id)
 
         if not existing_status:
             return False
@@ -63,14 +82,15 @@ class UserStatusCollection:
             return False
 
         data = {"status_text": status_text}
-        self.database.update_one({"_id": status_id}, {"$set": data})
+        # user_id is already known to match; including it lets a partitioned collection route the update
+        self.database.update_one({"_id": status_id, "user_id": user_id}, {"$set": data})
         return True
 
     def delete_status(self, status_id):
         """
         Deletes the status message with id, status_id
         """
-        if not self.search_status(status_id):
+        if not self.existing_status(status_id):
             return False
         self.database.delete_one({"_id": status_id})
         return True
@@ -81,6 +101,12 @@ class UserStatusCollection:
         """
         return self.database.delete_many(query)
 
+    def existing_status(self, status_id):
+        """
+        The status read for a pre-write check, through the "existence" read route
+        """
+        return read_routing.read_view(self.database, "existence").find_one({"_id": status_id})
+
     def search_status(self, status_id):
         '''
         Find and return a status message by its status_id
@@ -7,6 +7,8 @@ revised to work with database
 
 from loguru import logger
 
+from compact_schema import USER_KEYS, CompactCollection
+
 # set-up logging for users.py
 logger.remove()
 logger.add("log_file_{time:YYYY_MMM_DD}.log")
@@ -23,8 +25,9 @@ class UserCollection():
     Contains a collection of Users objects
     '''
 
-    def __init__(self, database):
-        self.database = database
+    def __init__(self, database, compact=False):
+        # With compact, documents are stored under short keys (see compact_schema)
+        self.database = CompactCollection(database, USER_KEYS) if compact else database
         logger.debug("User database successfully linked")
 
     def add_user(self, user_id, email, user_name, user_last_name):
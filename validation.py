@@ -0,0 +1,120 @@
+"""
+Vectorized validation and column normalization of pandas chunks for the loaders
+"""
+
+import pandas as pd
+
+# IDs and email local parts are built from names, which may contain spaces and apostrophes
+# (e.g. "La Verne.Caplan7"), so only leading/trailing whitespace, '@' and ',' are refused
+ID_PATTERN = r"^[^\s@,](?:[^@,]*[^\s@,])?$"
+EMAIL_PATTERN = r"^[^\s@,](?:[^@,]*[^\s@,])?@[^\s@,]+\.[^\s@,]+$"
+REJECT_REASON = "REJECT_REASON"
+# Minimum share of '@' values before a column is taken to be the email column
+EMAIL_DETECTION_THRESHOLD = 0.5
+
+USER_SCHEMA = {
+    "columns": ("USER_ID", "EMAIL", "NAME", "LASTNAME"),
+    "ids": ("USER_ID",),
+    "emails": ("EMAIL",),
+}
+STATUS_SCHEMA = {
+    "columns": ("STATUS_ID", "USER_ID", "STATUS_TEXT"),
+    "ids": ("STATUS_ID", "USER_ID"),
+    "emails": (),
+}
+
+
+def normalize_columns(chunk):
+    """
+    Strips and upper-cases the header names
+    """
+    chunk.columns = chunk.columns.str.strip().str.upper()
+    return chunk
+
+
+def fix_swapped_user_columns(chunk):
+    """
+    Detects by content which of EMAIL/NAME/LASTNAME holds the emails, first and last names,
+    and renames the columns to match. The first name is the part of USER_ID before the dot.
+    """
+    candidates = ["EMAIL", "NAME", "LASTNAME"]
+    email_share = {column: chunk[column].str.contains("@", regex=False).mean() for column in candidates}
+    email_column = max(candidates, key=email_share.get)
+    if email_share[email_column] < EMAIL_DETECTION_THRESHOLD:
+        return chunk
+
+    name_columns = [column for column in candidates if column != email_column]
+    first_names = chunk["USER_ID"].str.split(".", n=1).str[0]
+    name_share = {column: (chunk[column] == first_names).mean() for column in name_columns}
+    name_column = max(name_columns, key=name_share.get)
+    last_name_column = next(column for column in name_columns if column != name_column)
+
+    mapping = {email_column: "EMAIL", name_column: "NAME", last_name_column: "LASTNAME"}
+    if all(source == target for source, target in mapping.items()):
+        return chunk
+    return chunk.rename(columns=mapping)
+
+
+def validate_chunk(chunk, schema):
+    """
+    Splits a chunk into (valid, rejected) frames with whole-column string operations.
+    rejected carries a REJECT_REASON column naming the first failed check.
+    """
+    reason = pd.Series("", index=chunk.index, dtype=object)
+    for column in schema["columns"]:
+        if column not in chunk:
+            return chunk.iloc[0:0], chunk.assign(**{REJECT_REASON: f"missing column {column}"})
+        failed = chunk[column].fillna("").str.strip() == ""
+        reason = reason.mask(failed & (reason == ""), f"missing {column}")
+    for column in schema["ids"]:
+        failed = ~chunk[column].fillna("").str.match(ID_PATTERN)
+        reason = reason.mask(failed & (reason == ""), f"malformed {column}")
+    for column in schema["emails"]:
+        failed = ~chunk[column].fillna("").str.match(EMAIL_PATTERN)
+        reason = reason.mask(failed & (reason == ""), f"malformed {column}")
+
+    valid = reason == ""
+    return chunk[valid], chunk[~valid].assign(**{REJECT_REASON: reason[~valid]})
+
+
+def prepare_chunk(chunk, schema):
+    """
+    Normalizes, fixes swapped user columns and validates one chunk
+    """
+    chunk = normalize_columns(chunk)
+    if schema is USER_SCHEMA and all(column in chunk for column in schema["columns"]):
+        chunk = fix_swapped_user_columns(chunk)
+    return validate_chunk(chunk, schema)
+
+
+def read_csv_chunks(filename, chunksize):
+    """
+    Reads a CSV file in chunks of strings, keeping empty fields as ""
+    """
+    return pd.read_csv(filename, chunksize=chunksize, dtype=str, keep_default_na=False)
+
+
+def numbered_valid_rows(filename, schema, rejects=None, chunksize=10000):
+    """
+    Yields (line_number, row dict) for the valid rows of a CSV file.
+    Rejected rows are stored in the rejects dict keyed by line number, so calling
+    this twice (as last-wins dedup does) does not report them twice.
+    Line numbers assume one physical line per record.
+    """
+    for chunk in read_csv_chunks(filename, chunksize):
+        valid, rejected = prepare_chunk(chunk, schema)
+        if rejects is not None:
+            rejects.update(zip((rejected.index + 2).tolist(), rejected.to_dict("records")))
+        yield from zip((valid.index + 2).tolist(), valid.to_dict("records"))
+
+
+def write_rejects(rejects, reject_file):
+    """
+    Writes rejected rows, with their line numbers and reasons, to reject_file
+    """
+    if not rejects:
+        return
+    lines = sorted(rejects)
+    frame = pd.DataFrame([rejects[line] for line in lines])
+    frame.insert(0, "LINE", lines)
+    frame.to_csv(reject_file, index=False)